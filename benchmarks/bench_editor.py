@@ -0,0 +1,83 @@
+"""
+Time the typing and the scrolling in a large notebook, with the rich text
+editor used before, and the plain text one
+
+Usage: python benchmarks/bench_editor.py [size of the notebook in MB]
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+import sys
+import time
+
+from PySide import QtGui
+from PySide import QtTest
+
+from noteorganiser.syntax import ModifiedMarkdownHighlighter
+from bench_parser import generate_notebook
+
+SENTENCE = 'Life is beautiful, '
+SCROLL_STEPS = 50
+
+
+def create_editor(cls, text):
+    """Show an editor of the text, and return it with the loading time"""
+    start = time.time()
+    editor = cls()
+    editor.highlighter = ModifiedMarkdownHighlighter(editor.document())
+    if cls is QtGui.QTextEdit:
+        # As TextEditor used to load the notebooks
+        editor.setText(text)
+    else:
+        editor.setPlainText(text)
+    editor.resize(800, 600)
+    editor.show()
+    QtGui.QApplication.processEvents()
+    return editor, time.time()-start
+
+
+def typing(editor):
+    """Type in the middle of the notebook, and return the time per key"""
+    cursor = editor.textCursor()
+    cursor.setPosition(editor.document().characterCount()//2)
+    editor.setTextCursor(cursor)
+    QtGui.QApplication.processEvents()
+    start = time.time()
+    for character in SENTENCE:
+        QtTest.QTest.keyClicks(editor, character)
+        QtGui.QApplication.processEvents()
+    return (time.time()-start)/len(SENTENCE)
+
+
+def scrolling(editor):
+    """Scroll from the top to the bottom, and return the time per step"""
+    scrollbar = editor.verticalScrollBar()
+    start = time.time()
+    for step in range(SCROLL_STEPS+1):
+        scrollbar.setValue(scrollbar.maximum()*step//SCROLL_STEPS)
+        editor.viewport().repaint()
+    return (time.time()-start)/(SCROLL_STEPS+1)
+
+
+def main(megabytes=10):
+    application = QtGui.QApplication.instance() or QtGui.QApplication(
+        sys.argv)
+    post = ''.join(generate_notebook(1)[3:])
+    text = ''.join(generate_notebook(
+        int(megabytes*2**20/len(post.encode('utf-8')))))
+    print("%.1f MB, %i lines" % (
+        len(text.encode('utf-8'))/2.**20, text.count('\n')))
+    for cls in (QtGui.QTextEdit, QtGui.QPlainTextEdit):
+        editor, loading = create_editor(cls, text)
+        assert editor.toPlainText().rstrip('\n') == text.rstrip('\n')
+        print("%s" % cls.__name__)
+        print("    %-20s %8.3f s" % ('loading', loading))
+        print("    %-20s %8.2f ms" % ('per keystroke', 1000*typing(editor)))
+        print("    %-20s %8.2f ms" % ('per scroll step',
+                                      1000*scrolling(editor)))
+        editor.close()
+        editor.deleteLater()
+        application.processEvents()
+
+
+if __name__ == '__main__':
+    main(*[float(arg) for arg in sys.argv[1:]])
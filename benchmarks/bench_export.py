@@ -0,0 +1,48 @@
+"""
+Time the export of a generated library to a static website, on one and on all
+the cpus, and again when nothing changed
+
+Usage: python benchmarks/bench_export.py [number of notebooks]
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+import os
+import io
+import sys
+import time
+import shutil
+import tempfile
+import multiprocessing
+
+from noteorganiser.export import export
+from bench_parser import generate_notebook
+
+
+def main(number_of_notebooks=100, number_of_posts=20):
+    root = tempfile.mkdtemp()
+    try:
+        library = os.path.join(root, 'library')
+        os.mkdir(library)
+        for index in range(number_of_notebooks):
+            path = os.path.join(library, 'notebook%03i.md' % index)
+            with io.open(path, 'w', encoding='utf-8') as notebook:
+                notebook.write(''.join(generate_notebook(number_of_posts)))
+        print("%i notebooks of %i posts" % (
+            number_of_notebooks, number_of_posts))
+
+        cpus = multiprocessing.cpu_count()
+        for site, (name, jobs) in enumerate((
+                ('one process', 1), ('%i processes' % cpus, cpus))):
+            output = os.path.join(root, 'site%i' % site)
+            start = time.time()
+            export(library, output, jobs)
+            print("%-28s %8.3f s" % (name, time.time()-start))
+        start = time.time()
+        export(library, output, jobs)
+        print("%-28s %8.3f s" % ('nothing changed', time.time()-start))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
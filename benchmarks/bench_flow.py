@@ -0,0 +1,97 @@
+"""
+Time the resizing of a flow layout of many buttons, with the layout of the Qt
+example the FlowLayout was taken from, and with the FlowLayout
+
+Usage: python benchmarks/bench_flow.py [number of buttons]
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+import sys
+import timeit
+
+from PySide import QtGui
+from PySide import QtCore
+
+from noteorganiser.utils import FlowLayout
+
+# Widths of the window while resizing it
+WIDTHS = list(range(400, 1200, 8))
+
+
+class ExampleFlowLayout(FlowLayout):
+    """Reference: every size hint read, and every item placed, every time"""
+
+    def heightForWidth(self, width):
+        return self.doLayout(QtCore.QRect(0, 0, width, 0), True)
+
+    def minimumSize(self):
+        size = QtCore.QSize()
+        for item in self.itemList:
+            size = size.expandedTo(item.minimumSize())
+        size += QtCore.QSize(2*self.contentsMargins().top(),
+                             2*self.contentsMargins().top())
+        return size
+
+    def doLayout(self, rect, testOnly):
+        x = rect.x()
+        y = rect.y()
+        lineHeight = 0
+
+        for item in self.itemList:
+            spaceX = self.spacing()
+            spaceY = self.spacing()
+
+            nextX = x + item.sizeHint().width() + spaceX
+            if nextX - spaceX > rect.right() and lineHeight > 0:
+                x = rect.x()
+                y = y + lineHeight + spaceY
+                nextX = x + item.sizeHint().width() + spaceX
+                lineHeight = 0
+
+            if not testOnly:
+                item.setGeometry(QtCore.QRect(QtCore.QPoint(x, y),
+                                 item.sizeHint()))
+
+            x = nextX
+            lineHeight = max(lineHeight, item.sizeHint().height())
+
+        return y + lineHeight - rect.y()
+
+
+def create(cls, number_of_buttons):
+    widget = QtGui.QWidget()
+    flow = cls(widget, spacing=4)
+    for index in range(number_of_buttons):
+        flow.addWidget(QtGui.QPushButton('tag %i' % index))
+    widget.show()
+    QtGui.QApplication.processEvents()
+    return widget, flow
+
+
+def resize(flow):
+    """What Qt asks to the layout while resizing the window"""
+    for width in WIDTHS:
+        rect = QtCore.QRect(0, 0, width, 0)
+        flow.minimumSize()
+        flow.heightForWidth(width)
+        flow.setGeometry(rect)
+
+
+def main(number_of_buttons=2000):
+    application = QtGui.QApplication.instance() or QtGui.QApplication(
+        sys.argv)
+    print("%i buttons, %i widths" % (number_of_buttons, len(WIDTHS)))
+    timings = {}
+    for cls in (ExampleFlowLayout, FlowLayout):
+        widget, flow = create(cls, number_of_buttons)
+        timings[cls] = min(timeit.repeat(
+            lambda: resize(flow), number=1, repeat=3))
+        print("%-18s %8.2f ms per width" % (
+            cls.__name__, 1000*timings[cls]/len(WIDTHS)))
+        widget.deleteLater()
+        application.processEvents()
+    print("speedup: %.1fx" % (timings[ExampleFlowLayout]/timings[FlowLayout]))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
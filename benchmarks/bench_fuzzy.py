@@ -0,0 +1,64 @@
+"""
+Compare fuzzySearch and the FuzzyMatcher while typing in the tag filter
+
+Usage: python benchmarks/bench_fuzzy.py [number of tags]
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+import sys
+import random
+import timeit
+
+from noteorganiser.utils import fuzzySearch, FuzzyMatcher
+
+SYLLABLES = ['la', 'yo', 'ut', 'wi', 'dg', 'et', 'cl', 'ea', 'r', 'bu', 'tt',
+             'on', 'di', 'sa', 'bl', 'e', 'sc', 'ro', 'll', 'py', 'th', 'n']
+
+
+def generate_tags(number_of_tags):
+    generator = random.Random(0)
+    tags = set()
+    while len(tags) < number_of_tags:
+        words = [''.join(generator.sample(SYLLABLES, generator.randint(2, 4)))
+                 for _ in range(generator.randint(1, 2))]
+        tags.add(' '.join(words))
+    return sorted(tags)
+
+
+def typing(text):
+    """Successive contents of the field, when typing and erasing the text"""
+    steps = [text[:length] for length in range(1, len(text)+1)]
+    return steps+steps[-2::-1]
+
+
+def with_function(tags, steps):
+    return [[tag for tag in tags if fuzzySearch(step, tag)]
+            for step in steps]
+
+
+def with_matcher(tags, steps):
+    # The matcher is created with the buttons, and reused while typing
+    matcher = FuzzyMatcher(tags)
+    return [[tags[index] for index, _ in matcher.match(step)]
+            for step in steps]
+
+
+def main(number_of_tags=5000):
+    tags = generate_tags(number_of_tags)
+    steps = typing('layout wid')
+    print("%i tags, %i keystrokes" % (len(tags), len(steps)))
+    # The matcher also accepts the subsequences, so it finds more tags
+    for found, reference in zip(with_matcher(tags, steps),
+                                with_function(tags, steps)):
+        assert set(reference) <= set(found)
+    timings = {}
+    for function in (with_function, with_matcher):
+        timings[function] = min(timeit.repeat(
+            lambda: function(tags, steps), number=1, repeat=5))
+        print("%-14s %8.2f ms per keystroke" % (
+            function.__name__, 1000*timings[function]/len(steps)))
+    print("speedup: %.1fx" % (timings[with_function]/timings[with_matcher]))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,72 @@
+"""
+Time the parsing of the notebooks of the global page, in a single process and
+in a process pool, and the update of the page when one notebook changes
+
+Usage: python benchmarks/bench_global.py [number of notebooks]
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+import os
+import io
+import sys
+import shutil
+import hashlib
+import tempfile
+import timeit
+import multiprocessing
+
+from noteorganiser.rendering import Renderer
+from noteorganiser.rendering import notebook_tag, parse_tagged_notebooks
+from bench_parser import generate_notebook
+
+STYLE = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..',
+                     'noteorganiser', 'assets', 'style')
+
+
+def sha(path):
+    with io.open(path, 'rb') as notebook:
+        return hashlib.sha1(notebook.read()).hexdigest()
+
+
+def main(number_of_notebooks=500, number_of_posts=40):
+    root = tempfile.mkdtemp()
+    try:
+        text = ''.join(generate_notebook(number_of_posts))
+        paths = []
+        for index in range(number_of_notebooks):
+            paths.append(os.path.join(root, 'notebook%03i.md' % index))
+            with io.open(paths[-1], 'w', encoding='utf-8') as notebook:
+                notebook.write(text)
+        print("%i notebooks of %i posts" % (
+            number_of_notebooks, number_of_posts))
+
+        items = [(path, notebook_tag(path, root)) for path in paths]
+        cpus = multiprocessing.cpu_count()
+        # The pool is started once, like a caller of the renderer should
+        pool = multiprocessing.Pool(cpus)
+        try:
+            for name, parallel in (('single process', None),
+                                   ('pool of %i processes' % cpus, pool)):
+                timing = min(timeit.repeat(
+                    lambda: parse_tagged_notebooks(items, parallel),
+                    number=1, repeat=3))
+                print("%-28s %8.3f s" % (name, timing))
+        finally:
+            pool.terminate()
+
+        renderer = Renderer(os.path.join(STYLE, 'bootstrap-blog.html'),
+                            os.path.join(STYLE, 'bootstrap.css'), root)
+        notebooks = [(path, sha(path), tag) for path, tag in items]
+        renderer.update_notebooks(notebooks)
+        with io.open(paths[0], 'a', encoding='utf-8') as notebook:
+            notebook.write(''.join(generate_notebook(1)[3:]))
+        notebooks[0] = (paths[0], sha(paths[0]), items[0][1])
+        timing = timeit.timeit(
+            lambda: renderer.update_notebooks(notebooks), number=1)
+        print("%-28s %8.3f s" % ('one notebook changed', timing))
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,68 @@
+"""
+Time the highlighting of a large notebook, and the latency of typing in it
+
+Usage: python benchmarks/bench_highlighter.py [number of lines]
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+import sys
+import time
+
+from PySide import QtGui
+
+from noteorganiser.syntax import ModifiedMarkdownHighlighter
+from bench_parser import generate_notebook
+
+# Duration of a frame at 60 Hz, in ms
+FRAME = 1000/60.
+
+
+def keystrokes(editor, line, text):
+    """Type the text at the end of the line, and return every latency"""
+    block = editor.document().findBlockByNumber(line)
+    cursor = QtGui.QTextCursor(block)
+    cursor.movePosition(QtGui.QTextCursor.EndOfBlock)
+    editor.setTextCursor(cursor)
+    QtGui.QApplication.processEvents()
+    latencies = []
+    for character in text:
+        start = time.time()
+        editor.insertPlainText(character)
+        QtGui.QApplication.processEvents()
+        latencies.append(1000*(time.time()-start))
+    return latencies
+
+
+def main(number_of_lines=50000):
+    application = QtGui.QApplication.instance() or QtGui.QApplication(
+        sys.argv)
+    lines = generate_notebook(number_of_lines//18+1)
+    editor = QtGui.QPlainTextEdit()
+    editor.setPlainText(''.join(lines))
+    editor.resize(800, 600)
+    editor.show()
+    application.processEvents()
+    print("%i lines" % editor.document().blockCount())
+
+    start = time.time()
+    highlighter = ModifiedMarkdownHighlighter(editor.document())
+    highlighter.rehighlight()
+    print("%-28s %8.3f s" % ('highlighting everything', time.time()-start))
+
+    middle = len(lines)//2
+    # A line of text, the title of a post, and the line above a post
+    for name, line, text in (
+            ('typing in a post', lines.index('Some text, with *emphasis* and '
+                                             'a [link](http://toto.com).\n',
+                                             middle), ' and *more*'),
+            ('typing in a title', lines.index('with a long title\n', middle),
+             ' and more'),
+            ('adding a post', lines.index('-----------------\n', middle)-3,
+             '\nNew\n---')):
+        latencies = keystrokes(editor, line, text)
+        print("%-28s %8.2f ms mean, %6.2f ms max (one frame: %.1f ms)" % (
+            name, sum(latencies)/len(latencies), max(latencies), FRAME))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,48 @@
+"""
+Compare the notebook parsers on a large generated notebook
+
+Usage: python benchmarks/bench_parser.py [number of posts]
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+import sys
+import timeit
+
+import noteorganiser.text_processing as tp
+
+
+def generate_notebook(number_of_posts):
+    """Create the lines of a notebook with many posts"""
+    text = ['Benchmark\n', '=========\n', '\n']
+    for index in range(number_of_posts):
+        text.extend([
+            '\n', 'Post number %i\n' % index, 'with a long title\n',
+            '-----------------\n',
+            '# tag%i, tag%i, common\n' % (index % 100, index % 7), '\n',
+            '*%02i/%02i/2015*\n' % (index % 28 + 1, index % 12 + 1), '\n',
+            'Some text, with *emphasis* and a [link](http://toto.com).\n',
+            '\n', '~~~ python\n', 'def function(a):\n',
+            '    # a comment\n', '    return a\n', '~~~\n',
+            '\n', '| table | header |\n', '|-------|--------|\n',
+            '| a     | b      |\n'])
+    return text
+
+
+def main(number_of_posts=50000):
+    text = generate_notebook(number_of_posts)
+    print("%i posts, %i lines" % (number_of_posts, len(text)))
+    assert tp.parse_notebook(text) == \
+        tp.extract_title_and_posts_from_text(text)
+    timings = {}
+    for name in ('extract_title_and_posts_from_text', 'parse_notebook'):
+        function = getattr(tp, name)
+        timings[name] = min(timeit.repeat(
+            lambda: function(text), number=1, repeat=3))
+        print("%-36s %8.3f s" % (name, timings[name]))
+    print("speedup: %.1fx" % (
+        timings['extract_title_and_posts_from_text'] /
+        timings['parse_notebook']))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,89 @@
+"""
+Time the search engine on a large generated library
+
+Usage: python benchmarks/bench_search.py [number of notebooks] [posts each]
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+import io
+import os
+import sys
+import time
+import random
+import shutil
+import logging
+import tempfile
+import timeit
+
+from noteorganiser.search import SearchEngine
+
+# Words of the posts, the first ones being the most frequent
+VOCABULARY = ['word%i' % index for index in range(20000)]
+
+
+def write_library(folder, notebooks, posts):
+    """Write notebooks of posts with random words"""
+    generator = random.Random(0)
+    weights = [1./(rank+1) for rank in range(len(VOCABULARY))]
+    for number in range(notebooks):
+        text = ['Notebook %i\n' % number, '==========\n', '\n']
+        for index in range(posts):
+            words = generator.choices(VOCABULARY, weights, k=60)
+            text.extend([
+                '\n', 'Post %i %s\n' % (index, ' '.join(words[:3])),
+                '-------\n', '# tag%i\n' % (index % 50), '\n',
+                '*%02i/%02i/2015*\n' % (index % 28 + 1, index % 12 + 1), '\n',
+                ' '.join(words[3:30])+'\n', ' '.join(words[30:])+'\n'])
+        with io.open(os.path.join(folder, 'notebook%i.md' % number), 'w',
+                     encoding='utf-8') as notebook:
+            notebook.write(''.join(text))
+
+
+def scan(folder, word):
+    """Reference: read every notebook, looking for the word"""
+    count = 0
+    for name in os.listdir(folder):
+        if name.endswith('.md'):
+            with io.open(os.path.join(folder, name), encoding='utf-8') as text:
+                count += text.read().count(word)
+    return count
+
+
+def main(notebooks=100, posts=1000):
+    log = logging.getLogger('bench')
+    folder = tempfile.mkdtemp()
+    try:
+        write_library(folder, notebooks, posts)
+        print("%i notebooks of %i posts" % (notebooks, posts))
+        start = time.time()
+        engine = SearchEngine(folder, log)
+        engine.refresh()
+        print("%-30s %8.3f s" % ('first indexing', time.time()-start))
+        start = time.time()
+        engine = SearchEngine(folder, log)
+        engine.load()
+        print("%-30s %8.3f s" % ('loading the index', time.time()-start))
+        print("%-30s %8.3f s" % ('checking the notebooks', min(timeit.repeat(
+            engine.refresh, number=1, repeat=3))))
+        # A change reported by the watcher only reads the notebook
+        with io.open(os.path.join(folder, 'notebook0.md'), 'a',
+                     encoding='utf-8') as notebook:
+            notebook.write('\nNew\n---\n# new\n*01/01/2016*\nText\n')
+        start = time.time()
+        engine.notify([os.path.join(folder, 'notebook0.md')])
+        engine.update()
+        print("%-30s %8.3f s" % ('one notebook changed', time.time()-start))
+        for query in ('word19999', 'word500 word12000', 'word3 word10'):
+            elapsed = min(timeit.repeat(
+                lambda: engine.search(query, refresh=False),
+                number=1, repeat=5))
+            print("%-30s %8.2f ms" % ("query '%s'" % query, 1000*elapsed))
+        elapsed = min(timeit.repeat(
+            lambda: scan(folder, 'word19999'), number=1, repeat=3))
+        print("%-30s %8.2f ms" % ('reading all the notebooks', 1000*elapsed))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,75 @@
+"""
+Compare the peak memory of the full and streaming parsers
+
+Usage: python benchmarks/bench_streaming.py [size in MB...]
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+import io
+import os
+import sys
+import time
+import shutil
+import tempfile
+try:
+    import tracemalloc
+except ImportError:
+    # Python 2: only the times are measured
+    tracemalloc = None
+
+import noteorganiser.text_processing as tp
+from bench_parser import generate_notebook
+
+
+def write_notebook(path, megabytes):
+    """Write a notebook of about the given size"""
+    block = ''.join(generate_notebook(1000)[3:])
+    with io.open(path, 'w', encoding='utf-8') as notebook:
+        notebook.write('Benchmark\n=========\n\n')
+        for _ in range(max(1, int(megabytes*2**20/len(block)))):
+            notebook.write(block)
+
+
+def full(path):
+    text = io.open(path, 'r', encoding='utf-8').readlines()
+    _, posts = tp.parse_posts(text)
+    return len([post for post in posts if 'tag1' in post.tags])
+
+
+def streaming(path):
+    _, posts = tp.stream_notebook(path, ['tag1'])
+    return sum(1 for _ in posts)
+
+
+def measure(function, path):
+    if tracemalloc is None:
+        start = time.time()
+        return function(path), time.time()-start, float('nan')
+    tracemalloc.start()
+    start = time.time()
+    count = function(path)
+    elapsed = time.time()-start
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return count, elapsed, peak
+
+
+def main(sizes=(1, 10, 100)):
+    folder = tempfile.mkdtemp()
+    try:
+        for size in sizes:
+            path = os.path.join(folder, 'notebook.md')
+            write_notebook(path, size)
+            print("%i MB notebook" % size)
+            for function in (full, streaming):
+                if function is full and size > 200:
+                    continue
+                count, elapsed, peak = measure(function, path)
+                print("    %-10s %6i posts %8.2f s %10.1f MB peak" % (
+                    function.__name__, count, elapsed, peak/2.**20))
+    finally:
+        shutil.rmtree(folder)
+
+
+if __name__ == '__main__':
+    main([float(arg) for arg in sys.argv[1:]] or (1, 10, 100))
@@ -16,6 +16,8 @@ from PySide import QtCore
 from noteorganiser.popups import SetExternalEditor
 from noteorganiser.frames import Library, Editing, Preview
 from noteorganiser.logger import create_logger
+from noteorganiser.watcher import LibraryWatcher
+from noteorganiser.workers import ConversionService
 import noteorganiser.configuration as conf
 
 
@@ -129,6 +131,14 @@ class NoteOrganiser(QtGui.QMainWindow):
         toggleUseTOC.setChecked(self.info.use_TOC)
         toggleUseTOC.triggered.connect(self.toggleUseTOC)
 
+        # Toggle use of a pandoc server
+        togglePandocServer = QtGui.QAction('use a pandoc server', self)
+        togglePandocServer.setStatusTip(
+            'Keep pandoc running in the background, for faster previews')
+        togglePandocServer.setCheckable(True)
+        togglePandocServer.setChecked(self.info.pandoc_server)
+        togglePandocServer.triggered.connect(self.togglePandocServer)
+
         # Choose the main folder
         mainFolderAction = QtGui.QAction('change the main directory', self)
         mainFolderAction.setStatusTip(
@@ -165,6 +175,7 @@ class NoteOrganiser(QtGui.QMainWindow):
         optionsMenu.addAction(toggleRefreshAction)
         optionsMenu.addAction(externalEditor)
         optionsMenu.addAction(toggleUseTOC)
+        optionsMenu.addAction(togglePandocServer)
         optionsMenu.addAction(mainFolderAction)
 
         # Display menu
@@ -205,6 +216,14 @@ class NoteOrganiser(QtGui.QMainWindow):
         self.settings.setValue("use_TOC", self.info.use_TOC)
         self.preview.reload()
 
+    def togglePandocServer(self):
+        """toggle the use of a pandoc server for the conversions"""
+        self.info.pandoc_server = not self.info.pandoc_server
+        #save the setting
+        self.settings = QtCore.QSettings("audren", "NoteOrganiser")
+        self.settings.setValue("pandoc_server", self.info.pandoc_server)
+        self.preview.setBackend()
+
     def chooseMainFolder(self):
         """Select another folder for the source of notebooks"""
         # Recover the folder path and the notebooks
@@ -216,6 +235,9 @@ class NoteOrganiser(QtGui.QMainWindow):
         self.info.level = root
         self.info.notebooks = notebooks
         self.info.folders = folders
+        self.info.tree = conf.LibraryTree(self.log)
+        self.watcher.restart()
+        self.updateSearchEngine()
 
         # Refresh the display of the current widget
         self.tabs.currentWidget().refresh()
@@ -274,6 +296,19 @@ class NoteOrganiser(QtGui.QMainWindow):
         self.library.shelves.previewSignal.connect(self.previewNotebook)
         # * editing preview to preview loadNotebook, and switch the tab
         self.editing.loadNotebook.connect(self.previewNotebook)
+        # * failed conversions in the preview back to the editor
+        self.preview.loadEditor.connect(self.switchTab)
+        # * posts found by the search engine to the editor or the preview
+        self.editing.openSearchResult.connect(self.editSearchResult)
+        self.preview.openSearchResult.connect(self.previewSearchResult)
+        # * changes of the library on the disk, batched, to the display
+        self.watcher = LibraryWatcher(self.info, self.log, self)
+        self.watcher.changed.connect(self.libraryChanged)
+        self.library.shelves.refreshSignal.connect(self.watcher.watch)
+        # * the full-text index, built and then updated in the background
+        self.indexer = ConversionService(self)
+        self.indexer.failed.connect(self.indexingFailed)
+        self.updateSearchEngine()
 
     @QtCore.Slot(str, str)
     def switchTab(self, tab, notebook):
@@ -290,6 +325,78 @@ class NoteOrganiser(QtGui.QMainWindow):
         if self.preview.loadNotebook(notebook):
             self.switchTab('preview', notebook)
 
+    @QtCore.Slot(str, int)
+    def editSearchResult(self, path, line):
+        """Open the notebook of a post in the editor, at its first line"""
+        self.changeFolder(os.path.dirname(path))
+        self.switchTab(
+            'editing', os.path.splitext(os.path.basename(path))[0])
+        self.editing.goToLine(line)
+
+    @QtCore.Slot(str, int)
+    def previewSearchResult(self, path, line):
+        """Preview the notebook of a post"""
+        self.changeFolder(os.path.dirname(path))
+        self.previewNotebook(os.path.basename(path))
+
+    def changeFolder(self, folder):
+        """Display the folder in the library and the editor"""
+        if os.path.normpath(folder) == os.path.normpath(self.info.level):
+            return
+        self.info.notebooks, self.info.folders = \
+            conf.search_folder_recursively(
+                self.log, folder, self.info.display_empty, self.info.tree)
+        self.info.level = folder
+        # The editor is refreshed by the shelves
+        self.library.shelves.refresh()
+
+    def updateSearchEngine(self):
+        """
+        Index the changes of the library in the background
+
+        The first time, the whole index is built. Every job indexes all the
+        changes reported so far, so the ones superseded can be skipped.
+        """
+        self.indexer.submit(self.info.get_search_engine().update)
+
+    @QtCore.Slot(str, str)
+    def indexingFailed(self, kind, message):
+        self.log.error("The notebooks could not be indexed: %s" % message)
+
+    @QtCore.Slot(list, list)
+    def libraryChanged(self, folders, notebooks):
+        """Bring the caches and the display up to date with the disk"""
+        for folder in folders:
+            self.info.prune_index(folder)
+        self.info.notify_search_engine(folders, notebooks)
+        self.updateSearchEngine()
+        removed = [path for path in notebooks if not os.path.isfile(path)]
+        if removed:
+            self.preview.forgetNotebooks(removed)
+
+        # Redraw the library and the editor only if the current folder changed
+        level = self.info.level
+        if not os.path.isdir(level):
+            level = self.info.root
+        notebooks_found, folders_found = conf.search_folder_recursively(
+            self.log, level, self.info.display_empty, self.info.tree)
+        if level != self.info.level or \
+                sorted(notebooks_found) != sorted(self.info.notebooks) or \
+                sorted(folders_found) != sorted(self.info.folders):
+            self.info.level = level
+            self.info.notebooks = notebooks_found
+            self.info.folders = folders_found
+            self.library.shelves.refresh()
+
+        # Reload the displayed preview if its notebook changed, or any
+        # notebook for the global page
+        current = os.path.join(self.info.level, self.info.current_notebook)
+        if self.tabs.currentWidget() is self.preview and (
+                self.preview.global_page and notebooks or
+                self.info.current_notebook and current in notebooks and
+                os.path.isfile(current)):
+            self.preview.reload()
+
     def closeEvent(self, _):
         self.cleanClose()
 
@@ -0,0 +1,235 @@
+"""
+.. module:: backends
+    :synopsys: Ways of running pandoc
+
+Two backends convert markdown texts to html with the same options:
+
+- :class:`PypandocBackend` starts a new pandoc process for every text, through
+  the pypandoc wrapper,
+- :class:`ServerBackend` keeps a pandoc process running in server mode
+  (available since pandoc 3), and sends it all the texts of a call at once.
+
+"""
+from __future__ import unicode_literals
+import os
+import io
+import json
+import time
+import socket
+import atexit
+import tempfile
+import subprocess
+import pypandoc as pa
+from six.moves.urllib import request as urllib_request
+
+from .constants import EXTENSION
+
+# Servers running, stopped when the interpreter exits
+SERVERS = set()
+
+
+def stop_servers():
+    """Stop all the pandoc servers still running"""
+    for server in list(SERVERS):
+        server.close()
+
+
+atexit.register(stop_servers)
+
+
+class Backend(object):
+    """
+    Common interface of the backends
+
+    Every call is timed, and the latency and throughput are logged, so that the
+    backends can be compared. The markdown can be written in `temp_root`, which
+    can change with the level of the library.
+    """
+    name = ''
+
+    def __init__(self, template, log, temp_root=None):
+        self.template = template
+        self.log = log
+        self.temp_root = temp_root
+        self.calls = 0
+        self.documents = 0
+        self.seconds = 0.
+
+    def convert(self, texts):
+        """
+        Convert every markdown text to html with the template
+
+        Returns
+        -------
+        outputs : list
+            the html of every text, in the same order
+        """
+        start = time.time()
+        outputs = self.run(texts)
+        elapsed = time.time()-start
+
+        self.calls += 1
+        self.documents += len(texts)
+        self.seconds += elapsed
+        self.log.info(
+            "pandoc (%s): %i document(s), %i characters in %.3f s, "
+            "overall %.1f documents/s over %i call(s)" % (
+                self.name, len(texts), sum(len(text) for text in texts),
+                elapsed, self.documents/max(self.seconds, 1e-6), self.calls))
+        return outputs
+
+    def run(self, texts):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class PypandocBackend(Backend):
+    """Run a pandoc process per text, on a temporary file"""
+    name = 'pypandoc'
+
+    def run(self, texts):
+        outputs = []
+        for text in texts:
+            handle, temp_path = tempfile.mkstemp(suffix=EXTENSION,
+                                                 dir=self.temp_root)
+            try:
+                with io.open(handle, 'w', encoding='utf-8') as temp:
+                    temp.write(text)
+                outputs.append(pa.convert(
+                    temp_path, 'html', encoding='utf-8',
+                    extra_args=['--highlight-style', 'pygments', '-s',
+                                '--template', self.template]))
+            finally:
+                os.remove(temp_path)
+        return outputs
+
+
+class ServerBackend(Backend):
+    """
+    Keep a warm pandoc server, and send it batches of texts over http
+
+    The server is started on the first call. If it can not be started within
+    `start_timeout` seconds, or fails, :class:`ServerError` is raised. Every
+    request is given `timeout` seconds.
+    """
+    name = 'server'
+
+    def __init__(self, template, log, timeout=10, start_timeout=2):
+        Backend.__init__(self, template, log)
+        with io.open(template, 'r', encoding='utf-8') as template_file:
+            self.template_text = template_file.read()
+        self.timeout = timeout
+        self.start_timeout = start_timeout
+        self.process = None
+        # The output of the server is never read, and would fill a pipe
+        self.devnull = None
+        self.url = ''
+
+    def start(self):
+        """Launch the server on a free port, and wait for it to answer"""
+        pandoc = getattr(pa, 'get_pandoc_path', lambda: 'pandoc')()
+        probe = socket.socket()
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+        probe.close()
+        self.devnull = open(os.devnull, 'wb')
+        try:
+            self.process = subprocess.Popen(
+                [pandoc, 'server', '--port', str(port),
+                 '--timeout', str(self.timeout)],
+                stdout=self.devnull, stderr=self.devnull)
+        except OSError as error:
+            self.devnull.close()
+            self.devnull = None
+            raise ServerError("pandoc could not be launched: %s" % error)
+        SERVERS.add(self)
+        self.url = 'http://127.0.0.1:%i' % port
+
+        deadline = time.time()+self.start_timeout
+        while time.time() < deadline:
+            if self.process.poll() is not None:
+                self.close()
+                raise ServerError("pandoc does not support the server mode")
+            try:
+                urllib_request.urlopen(self.url+'/version', timeout=1).read()
+            except (IOError, OSError):
+                time.sleep(0.05)
+            else:
+                self.log.info("pandoc server listening on %s" % self.url)
+                return
+        self.close()
+        raise ServerError("pandoc server did not answer")
+
+    def run(self, texts):
+        if self.process is None:
+            self.start()
+        options = [{'text': text, 'from': 'markdown', 'to': 'html',
+                    'standalone': True, 'template': self.template_text,
+                    'highlight-style': 'pygments'} for text in texts]
+        request = urllib_request.Request(
+            self.url+'/batch', data=json.dumps(options).encode('utf-8'),
+            headers={'Content-Type': 'application/json',
+                     'Accept': 'application/json'})
+        try:
+            response = urllib_request.urlopen(request, timeout=self.timeout)
+            results = json.loads(response.read().decode('utf-8'))
+        except (IOError, OSError, ValueError) as error:
+            raise ServerError("pandoc server failed: %s" % error)
+        # A failed conversion is reported as a plain error message
+        if any(not isinstance(result, dict) for result in results):
+            raise ServerError("pandoc server failed: %s" % results)
+        return [result['output'] for result in results]
+
+    def close(self):
+        """Stop the server"""
+        if self.process is not None:
+            if self.process.poll() is None:
+                self.process.terminate()
+            self.process.wait()
+            self.process = None
+        if self.devnull is not None:
+            self.devnull.close()
+            self.devnull = None
+        SERVERS.discard(self)
+
+
+class FallbackBackend(Backend):
+    """
+    Use the server when possible, and pypandoc otherwise
+
+    When the server fails, the call is done again with pypandoc, which is then
+    used for the rest of the session.
+    """
+
+    def __init__(self, template, log, temp_root):
+        Backend.__init__(self, template, log, temp_root)
+        self.server = ServerBackend(template, log)
+        self.pypandoc = PypandocBackend(template, log, temp_root)
+        self.current = self.server
+
+    def convert(self, texts):
+        # The timing is done by the actual backend
+        self.pypandoc.temp_root = self.temp_root
+        try:
+            return self.current.convert(texts)
+        except ServerError as error:
+            self.log.warning("%s, falling back to pypandoc" % error)
+            self.server.close()
+            self.current = self.pypandoc
+            return self.current.convert(texts)
+
+    def close(self):
+        self.server.close()
+
+
+class ServerError(RuntimeError):
+    pass
+
+
+def create_backend(template, log, temp_root, use_server=True):
+    """Return the backend to use, depending on the settings"""
+    if use_server:
+        return FallbackBackend(template, log, temp_root)
+    return PypandocBackend(template, log, temp_root)
@@ -0,0 +1,135 @@
+"""
+.. module:: cache
+    :synopsys: Caches for the html pages produced from the notebooks
+
+"""
+from __future__ import unicode_literals
+import os
+import hashlib
+from collections import OrderedDict as od
+
+
+class HTMLCache(object):
+    """
+    Least-recently-used cache of the html pages rendered by the Preview
+
+    Every page is stored as a file inside `root` (the .website folder), and is
+    identified by the path of the notebook, the SHA sum of its content, and a
+    tuple of options (selected tags, use of the TOC, version of the style...),
+    everything the page depends on. A notebook whose content changed therefore
+    never hits a stale page, and the pages of its previous versions are removed
+    from the disk as soon as a new one is stored.
+
+    """
+    def __init__(self, root, max_entries=32):
+        self.root = root
+        self.max_entries = max_entries
+        # Maps (path, sha, options) to the url and the data describing the
+        # page (the tags of its posts), the least recently used first
+        self.entries = od()
+        self.purge()
+
+    def url(self, path, sha, options):
+        """Name of the file storing the page for the given key"""
+        base = os.path.splitext(os.path.basename(path))[0]
+        digest = hashlib.sha1(
+            repr((path, sha, options)).encode('utf-8')).hexdigest()
+        return os.path.join(self.root, '%s-%s.html' % (base, digest[:16]))
+
+    def get(self, path, sha, options):
+        """
+        Return the (url, data) stored for this key, or None
+
+        """
+        key = (path, sha, options)
+        try:
+            url, data = self.entries.pop(key)
+        except KeyError:
+            return None
+        # The file could have been removed behind our back
+        if not os.path.isfile(url):
+            return None
+        # Mark it as the most recently used
+        self.entries[key] = (url, data)
+        return url, data
+
+    def store(self, path, sha, options, url, data):
+        """Reference a freshly written page, and evict the stale ones"""
+        # Pages of an outdated version of this notebook will never be hit again
+        for key in [key for key in self.entries
+                    if key[0] == path and key[1] != sha]:
+            self.evict(key)
+        self.entries[(path, sha, options)] = (url, data)
+        while len(self.entries) > self.max_entries:
+            self.evict(next(iter(self.entries)))
+
+    def forget(self, path):
+        """Evict all the pages of a notebook"""
+        for key in [key for key in self.entries if key[0] == path]:
+            self.evict(key)
+
+    def evict(self, key):
+        """Forget about a page, and remove it from the disk"""
+        url, _ = self.entries.pop(key)
+        try:
+            os.remove(url)
+        except OSError:
+            pass
+
+    def purge(self):
+        """Remove the pages that are not referenced by the cache"""
+        if not os.path.isdir(self.root):
+            return
+        known = set(url for url, _ in self.entries.values())
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            if name.endswith('.html') and path not in known:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+class FragmentCache(object):
+    """
+    Least-recently-used cache of the html rendered for every post
+
+    The fragments are stored in memory, keyed by the SHA sum of the markdown
+    of the post, so that a post is converted only once, whatever the selected
+    tags. The cache is bounded by the total length of the stored fragments.
+
+    """
+    def __init__(self, max_size=2**25):
+        self.max_size = max_size
+        self.size = 0
+        self.entries = od()
+
+    @staticmethod
+    def key(markdown):
+        """Compute the key of a post from its markdown lines"""
+        return hashlib.sha1('\n'.join(markdown).encode('utf-8')).hexdigest()
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def __len__(self):
+        return len(self.entries)
+
+    def get(self, key):
+        """Return the html fragment, or None"""
+        try:
+            fragment = self.entries.pop(key)
+        except KeyError:
+            return None
+        self.entries[key] = fragment
+        return fragment
+
+    def store(self, key, fragment):
+        """Store a fragment, evicting the least recently used ones"""
+        if key in self.entries:
+            self.size -= len(self.entries.pop(key))
+        self.entries[key] = fragment
+        self.size += len(fragment)
+        while self.size > self.max_size and len(self.entries) > 1:
+            _, evicted = self.entries.popitem(last=False)
+            self.size -= len(evicted)
@@ -7,6 +7,8 @@
 from __future__ import unicode_literals
 import os
 from noteorganiser.constants import EXTENSION
+from noteorganiser.index import NotebookIndex
+from noteorganiser.search import SearchEngine
 
 from PySide import QtCore
 from PySide import QtGui
@@ -68,7 +70,7 @@ def initialise(logger, force_folder_change=False):
     return main, notebooks, folders
 
 
-def search_folder_recursively(logger, main, display_empty=True):
+def search_folder_recursively(logger, main, display_empty=True, tree=None):
     """
     Search the main folder for notebooks and folders with notebooks
 
@@ -85,33 +87,150 @@ def search_folder_recursively(logger, main, display_empty=True):
 
     display_empty : bool
         determines whether to return empty folders or not
+
+    tree : LibraryTree
+        cached tree of the folders, to avoid reading again the unchanged ones.
+        A new one is used by default.
     """
-    notebooks, folders = [], []
-    if os.path.isdir(main):
-        logger.info("Main folder existed already")
-        # If yes, check if there are already some notebooks
-        for elem in os.listdir(main):
-            if os.path.isfile(os.path.join(main, elem)):
-                # If it is a valid file, append it to notebooks
-                if elem[-len(EXTENSION):] == EXTENSION:
-                    logger.info("Found the file %s as a valid notebook" % elem)
-                    notebooks.append(elem)
-            elif os.path.isdir(os.path.join(main, elem)):
-                # Otherwise, check the folder for valid files, and append it to
-                # folders in case there are some inside, or if display_empty is
-                # set to True (by default).
+    if tree is None:
+        tree = LibraryTree(logger)
+    return tree.listing(main, display_empty)
+
+
+class LibraryTree(object):
+    """
+    Cached tree of the folders containing the notebooks
+
+    For every folder read, the notebooks and the non-hidden sub-folders are
+    stored, along with the number of notebooks in the whole sub-tree, which
+    tells whether the folder is empty. A folder is read again only when its
+    modification time changed, that is when an entry was added, removed or
+    renamed inside it, and the new count is then propagated to its parents.
+    The displayed folder and its sub-folders are checked at each access;
+    deeper changes are noticed when browsing there, or after
+    :meth:`invalidate`.
+
+    """
+    def __init__(self, logger):
+        self.logger = logger
+        # Modification time, notebooks, sub-folders (absolute paths) and total
+        # number of notebooks of every folder
+        self.entries = {}
+
+    def listing(self, main, display_empty=True):
+        """
+        Return the notebooks and the folders of main
+
+        See :func:`search_folder_recursively`. The folder is created if it
+        does not exist.
+        """
+        main = os.path.normpath(main)
+        if os.path.isdir(main):
+            self.logger.info("Main folder existed already")
+        else:
+            self.logger.info("Main folder non-existant: creating it now")
+            os.mkdir(main)
+        entry = self.entry(main)
+        for folder in entry['folders']:
+            self.entry(folder)
+        folders = [folder for folder in entry['folders']
+                   if display_empty or not self.is_empty(folder)]
+        return list(entry['notebooks']), folders
+
+    def entry(self, folder):
+        """Return the up to date entry of the folder"""
+        entry, changed = self.update(folder)
+        if changed:
+            self.propagate(os.path.dirname(folder))
+        return entry
+
+    def update(self, folder):
+        """Read the folder if it changed, and tell whether it did"""
+        try:
+            mtime = os.stat(folder).st_mtime
+        except OSError:
+            self.invalidate(folder)
+            return {'mtime': None, 'notebooks': [], 'folders': [],
+                    'total': 0}, True
+        entry = self.entries.get(folder)
+        if entry is not None and entry['mtime'] == mtime:
+            return entry, False
+        return self.scan(folder, mtime), True
+
+    def scan(self, folder, mtime):
+        """Read the content of the folder, and of its unknown sub-folders"""
+        notebooks, folders = [], []
+        for name, is_dir in list_folder(folder):
+            if is_dir:
                 # If the folder is hidden (linux convention, with a leading
-                # dot), ignore. TODO also determines if it is hidden as far as
-                # Windows is concerned
-                if elem[0] != '.':
-                    temp, _ = search_folder_recursively(
-                        logger, os.path.join(main, elem), display_empty)
-                    if temp or display_empty:
-                        folders.append(os.path.join(main, elem))
-    else:
-        logger.info("Main folder non-existant: creating it now")
-        os.mkdir(main)
-    return notebooks, folders
+                # dot), ignore. TODO also determines if it is hidden as far
+                # as Windows is concerned
+                if name[0] != '.':
+                    folders.append(os.path.join(folder, name))
+            elif name.endswith(EXTENSION):
+                notebooks.append(name)
+        self.logger.info("Found %i notebook(s) and %i folder(s) in %s" % (
+            len(notebooks), len(folders), folder))
+        entry = {'mtime': mtime, 'notebooks': notebooks, 'folders': folders}
+        # The sub-folders that disappeared are forgotten
+        previous = self.entries.get(folder)
+        if previous is not None:
+            for path in set(previous['folders'])-set(folders):
+                self.invalidate(path)
+        entry['total'] = len(notebooks)+sum(
+            self.entries[path]['total'] if path in self.entries else
+            self.update(path)[0]['total'] for path in folders)
+        self.entries[folder] = entry
+        return entry
+
+    def propagate(self, folder):
+        """Update the number of notebooks of the known parents of a folder"""
+        while folder in self.entries:
+            entry = self.entries[folder]
+            total = len(entry['notebooks'])+sum(
+                self.entries[path]['total'] for path in entry['folders']
+                if path in self.entries)
+            if total == entry['total']:
+                break
+            entry['total'] = total
+            folder = os.path.dirname(folder)
+
+    def notebooks(self, main, recursive=False):
+        """
+        Return the absolute path of every notebook of main, sorted
+
+        With recursive, the notebooks of all the sub-folders follow, the
+        folders without any notebook being skipped without being listed.
+        """
+        main = os.path.normpath(main)
+        entry = self.entry(main)
+        paths = [os.path.join(main, name)
+                 for name in sorted(entry['notebooks'])]
+        if recursive:
+            for folder in sorted(entry['folders']):
+                if not self.is_empty(folder):
+                    paths.extend(self.notebooks(folder, True))
+        return paths
+
+    def is_empty(self, folder):
+        """Whether the folder and its sub-folders contain no notebook"""
+        return not self.entry(os.path.normpath(folder))['total']
+
+    def invalidate(self, folder):
+        """Forget a folder and its sub-folders, read again at next access"""
+        folder = os.path.normpath(folder)
+        prefix = os.path.join(folder, '')
+        for path in [path for path in self.entries
+                     if path == folder or path.startswith(prefix)]:
+            del self.entries[path]
+
+
+def list_folder(folder):
+    """Return the name of every entry of the folder, and if it is a folder"""
+    if hasattr(os, 'scandir'):
+        return [(entry.name, entry.is_dir()) for entry in os.scandir(folder)]
+    return [(name, os.path.isdir(os.path.join(folder, name)))
+            for name in os.listdir(folder)]
 
 
 class Information(object):
@@ -134,12 +253,18 @@ class Information(object):
         # folders in this directory.
         self.notebooks = notebooks
         self.folders = folders
+        # Cached tree of the folders, to browse them without reading them all
+        # again, see :class:`LibraryTree`
+        self.tree = LibraryTree(logger)
 
         # Reference towards the currently edited/previewed notebook
         self.current_notebook = ''
-        # Stores the SHA sum for every notebook, in order to avoid re-analyzing
-        # the entire file for each filtering TODO
-        self.sha = {}
+        # Index of the notebooks of every visited folder, storing the SHA sum
+        # and the tags of every notebook, in order to avoid re-analyzing the
+        # entire file, see :meth:`get_index`.
+        self.indices = {}
+        # Full-text index of all the notebooks, see :meth:`get_search_engine`
+        self.search_engine = None
 
         # get saved settings
         self.settings = QtCore.QSettings("audren", "NoteOrganiser")
@@ -176,3 +301,65 @@ class Information(object):
                 self.use_TOC = False
         else:
             self.use_TOC = False
+
+        # Switch to keep a pandoc server running, instead of launching pandoc
+        # for every conversion
+        if self.settings.contains("pandoc_server"):
+            if self.settings.value("pandoc_server") == "true":
+                self.pandoc_server = True
+            else:
+                self.pandoc_server = False
+        else:
+            self.pandoc_server = True
+
+    def get_index(self, path):
+        """Return the index of the folder containing the notebook"""
+        folder = os.path.dirname(os.path.abspath(path))
+        if folder not in self.indices:
+            self.indices[folder] = NotebookIndex(folder, self.logger)
+        return self.indices[folder]
+
+    def get_sha(self, path):
+        """
+        Return the SHA sum of the notebook's content
+
+        The sum is only computed again if the size or the modification time of
+        the file changed since it was stored in the index.
+        """
+        return self.get_index(path).sha(path)
+
+    def get_tags(self, path):
+        """Return the tags of a notebook, parsing it only if it changed"""
+        return self.get_index(path).tags(path)
+
+    def prune_index(self, folder):
+        """Forget the notebooks removed from a folder"""
+        folder = os.path.abspath(folder)
+        if folder in self.indices:
+            self.indices[folder].prune(self.tree.entry(folder)['notebooks'])
+
+    def get_search_engine(self):
+        """
+        Return the full-text search engine of the notebooks under root
+
+        It is only built by :meth:`SearchEngine.update`, which takes a while
+        the first time, and should be called outside of the main thread.
+        """
+        if self.search_engine is None or self.search_engine.root != self.root:
+            self.search_engine = SearchEngine(self.root, self.logger)
+        return self.search_engine
+
+    def notify_search_engine(self, folders, notebooks):
+        """
+        Report the changes of the library to the search engine
+
+        The notebooks under the changed folders are listed from the tree, up
+        to date with the disk, see :class:`LibraryWatcher`.
+        """
+        self.get_search_engine().notify(notebooks, dict(
+            (folder, self.tree.notebooks(folder, recursive=True))
+            for folder in folders if os.path.isdir(folder)))
+
+    def search(self, query, limit=20):
+        """Return the posts of all the notebooks best matching the query"""
+        return self.get_search_engine().search(query, limit, refresh=False)
@@ -0,0 +1,371 @@
+"""
+.. module:: export
+    :synopsys: Convert a whole library to a static website, without the GUI
+
+Every notebook found under the root, with the :class:`LibraryTree`, is
+converted to a page, and optionally to a page for each of its tags, by a pool
+of worker processes. The SHA sum of every exported notebook is kept in a
+manifest of the output folder, so that the unchanged notebooks are skipped
+when exporting again. An index page links to all the pages.
+
+Usage: noteorganiser-export [-j JOBS] [--tags] [--toc] root output
+"""
+from __future__ import print_function
+from __future__ import unicode_literals
+import os
+import io
+import re
+import sys
+import json
+import shutil
+import hashlib
+import logging
+import argparse
+import tempfile
+import multiprocessing
+import multiprocessing.util
+
+import noteorganiser.text_processing as tp
+from .configuration import LibraryTree
+from .rendering import Renderer, notebook_tag, style_version
+from .backends import create_backend
+from .index import write_atomically
+from .logger import create_logger
+
+STYLE = os.path.join(
+    os.path.abspath(os.path.dirname(__file__)), 'assets', 'style')
+TEMPLATE = os.path.join(STYLE, 'bootstrap-blog.html')
+FRAGMENTS_TEMPLATE = os.path.join(STYLE, 'fragments.html')
+CSS = os.path.join(STYLE, 'bootstrap.css')
+# Name of the style sheet, and of the manifest, in the output folder
+CSS_NAME = 'bootstrap.css'
+MANIFEST = '.export.json'
+INDEX = 'index.html'
+# Files of the output folder which are not the page of a notebook
+RESERVED = (INDEX, CSS_NAME, MANIFEST)
+# Increased whenever the pages or the manifest change
+VERSION = 2
+# Renderer of the worker process, see :func:`start_worker`
+RENDERER = None
+
+
+def file_sha(path):
+    """Return the SHA sum of the content of a file"""
+    with io.open(path, 'rb') as source:
+        return hashlib.sha1(source.read()).hexdigest()
+
+
+def page_url(name):
+    """Return the url of the page of a notebook, in the output folder"""
+    return '%s.html' % name
+
+
+def tag_page_url(page, tag):
+    """
+    Return the url of the page of a tag of a notebook
+
+    The pages of the tags of the notebook are stored in a folder next to its
+    page. Several tags can have the same url, see :func:`unique_url`.
+    """
+    return '%s.tags/%s.html' % (
+        page[:-len('.html')], re.sub(r'[^\w-]+', '-', tag, flags=re.UNICODE))
+
+
+def unique_url(url, used):
+    """
+    Return the url of a page, with a suffix if it is already used
+
+    used : set
+        urls already taken, in lower case for the file systems ignoring it,
+        to which the returned one is added
+    """
+    stem, number = url[:-len('.html')], 1
+    while url.lower() in used:
+        number += 1
+        url = '%s-%i.html' % (stem, number)
+    used.add(url.lower())
+    return url
+
+
+def relative_url(url, page):
+    """Return the url, relative to the output folder, as seen from a page"""
+    return '../'*page.count('/')+url
+
+
+def start_worker(temp_root, use_server=True):
+    """
+    Create the renderer of a worker process
+
+    Each process runs its own pandoc, closed when the process exits.
+    """
+    global RENDERER
+    backend = create_backend(FRAGMENTS_TEMPLATE, logging.getLogger(__name__),
+                             temp_root, use_server)
+    RENDERER = Renderer(TEMPLATE, CSS, temp_root, backend=backend)
+    multiprocessing.util.Finalize(None, backend.close, exitpriority=10)
+
+
+def export_notebook(job):
+    """
+    Write the pages of a notebook, with the renderer of the worker process
+
+    job : tuple
+        path, name and page of the notebook, output folder, whether to write
+        the page of every tag, whether to use a table of contents, and the
+        urls already used in the folder of the pages of the tags
+
+    Returns
+    -------
+    name : str
+        name of the notebook
+    entry : dict
+        title, tags and pages of the notebook, or None if it could not be
+        converted
+    error : str
+        the syntax error of the notebook, or None
+    """
+    path, name, page, output, with_tags, use_TOC, used = job
+    pages = [page]
+    try:
+        html, posts_tags = RENDERER.convert(
+            path, (), use_TOC, relative_url(CSS_NAME, pages[0]))
+    except ValueError as error:
+        return name, None, '%s' % error
+    write_page(output, pages[0], html)
+    tags = tp.sort_tags(tag for post_tags in posts_tags for tag in post_tags)
+    if with_tags:
+        used = set(used)
+        for tag in tags:
+            pages.append(unique_url(tag_page_url(page, tag), used))
+            html, _ = RENDERER.convert(
+                path, [tag], use_TOC, relative_url(CSS_NAME, pages[-1]))
+            write_page(output, pages[-1], html)
+    entry = {'title': RENDERER.state(path).title,
+             'tags': [[tag, count] for tag, count in tags.items()],
+             'pages': pages}
+    return name, entry, None
+
+
+def convert_notebooks(jobs, processes, temp_root, use_server=True):
+    """
+    Call :func:`export_notebook` on every job, in a pool of processes
+
+    With a single process, the jobs are done in the current one.
+    """
+    if processes == 1:
+        start_worker(temp_root, use_server)
+        try:
+            return [export_notebook(job) for job in jobs]
+        finally:
+            RENDERER.backend.close()
+    pool = multiprocessing.Pool(processes, start_worker,
+                                (temp_root, use_server))
+    try:
+        # The notebooks are sent one by one, their sizes being very different
+        results = pool.map(export_notebook, jobs, 1)
+    except Exception:
+        pool.terminate()
+        raise
+    pool.close()
+    pool.join()
+    return results
+
+
+def write_page(output, url, html):
+    """Write the html of a page, creating its folder if needed"""
+    path = os.path.join(output, *url.split('/'))
+    folder = os.path.dirname(path)
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    with io.open(path, 'w', encoding='utf-8') as page:
+        page.write(html)
+
+
+def remove_page(output, url):
+    """Remove a page, and the folders it leaves empty"""
+    path = os.path.join(output, *url.split('/'))
+    try:
+        os.remove(path)
+        folder = os.path.dirname(path)
+        while folder != output and not os.listdir(folder):
+            os.rmdir(folder)
+            folder = os.path.dirname(folder)
+    except OSError:
+        pass
+
+
+def load_manifest(output):
+    """Read the manifest of a previous export, or return an empty one"""
+    try:
+        with io.open(os.path.join(output, MANIFEST), 'rb') as manifest:
+            return json.loads(manifest.read().decode('utf-8'))
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def index_page(renderer, title, entries):
+    """Return the html of the page linking to the pages of all the notebooks"""
+    body = ["<article class='blog-header'>",
+            "<h1 class='blog-title'>%s</h1>" % tp.escape_html(title),
+            "</article>", "<article class='row'>",
+            "<article class='col-sm-12 blog-main'>"]
+    for name in sorted(entries):
+        entry = entries[name]
+        pages = entry['pages']
+        if len(pages) > 1:
+            tags = ['<a href="%s">%s</a> (%i)' % (
+                tp.escape_html(page), tp.escape_html(tag), count)
+                for (tag, count), page in zip(entry['tags'], pages[1:])]
+        else:
+            tags = ['<strong>%s</strong> (%i)' % (tp.escape_html(tag), count)
+                    for tag, count in entry['tags']]
+        body.extend([
+            "<article class='blog-post'>",
+            "<h2 class='blog-post-title'><a href=\"%s\">%s</a></h2>" % (
+                tp.escape_html(pages[0]), tp.escape_html(entry['title'])),
+            "<p class='blog-post-meta'>%s: %s</p>" % (
+                tp.escape_html(name), ', '.join(tags)),
+            "</article>"])
+    body.extend(["</article>", "</article>"])
+    return renderer.assemble(title, '\n'.join(body), css=CSS_NAME)
+
+
+def export(root, output, jobs=None, with_tags=False, use_TOC=False,
+           use_server=True, log=None):
+    """
+    Export all the notebooks under root to a static website in output
+
+    Parameters
+    ----------
+    jobs : int
+        number of worker processes, the number of cpus by default
+    with_tags : bool
+        write as well a page for every tag of every notebook
+    use_TOC : bool
+        add a table of contents to the pages
+    use_server : bool
+        keep a pandoc server running in every worker, see :mod:`backends`
+
+    Returns
+    -------
+    converted : list
+        names of the notebooks converted, the others being unchanged
+    failed : dict
+        syntax error of every notebook which could not be converted
+    """
+    if log is None:
+        log = logging.getLogger(__name__)
+    if jobs is None:
+        jobs = multiprocessing.cpu_count()
+    root, output = os.path.abspath(root), os.path.abspath(output)
+    if not os.path.isdir(output):
+        os.makedirs(output)
+
+    # The pages of a previous export with other options are all written again
+    options = {'version': VERSION, 'tags': with_tags, 'toc': use_TOC,
+               'style': style_version(CSS, TEMPLATE, FRAGMENTS_TEMPLATE)}
+    manifest = load_manifest(output)
+    old_entries = manifest.get('notebooks', {})
+    previous = old_entries if manifest.get('options') == options else {}
+
+    entries, shas, changed = {}, {}, []
+    for path in LibraryTree(log).notebooks(root, recursive=True):
+        name = notebook_tag(path, root)
+        shas[name] = file_sha(path)
+        entry = previous.get(name)
+        if entry is not None and entry['sha'] == shas[name] and all(
+                os.path.isfile(os.path.join(output, *page.split('/')))
+                for page in entry['pages']):
+            entries[name] = entry
+        else:
+            changed.append((path, name))
+
+    # Two notebooks, or two tags, can have the same url, which would be
+    # overwritten: the pages kept are reserved, and the others given a suffix.
+    # The notebooks already exported keep their url first.
+    used = set(url.lower() for url in RESERVED)
+    used.update(page.lower() for entry in entries.values()
+                for page in entry['pages'])
+    pages = {}
+    for name in sorted((name for _, name in changed),
+                       key=lambda name: name not in old_entries):
+        pages[name] = unique_url(
+            old_entries[name]['pages'][0] if name in old_entries
+            else page_url(name), used)
+    todo = []
+    for path, name in changed:
+        folder = '%s.tags/' % pages[name][:-len('.html')].lower()
+        todo.append((path, name, pages[name], output, with_tags, use_TOC,
+                     [url for url in used if url.startswith(folder)]))
+    log.info("%i notebook(s) to convert, %i unchanged" % (
+        len(todo), len(entries)))
+
+    converted, failed = [], {}
+    if todo:
+        temp_root = tempfile.mkdtemp()
+        try:
+            results = convert_notebooks(
+                todo, min(jobs, len(todo)), temp_root, use_server)
+        finally:
+            shutil.rmtree(temp_root, ignore_errors=True)
+        for name, entry, error in results:
+            if error is not None:
+                log.warning("%s could not be converted: %s" % (name, error))
+                failed[name] = error
+                # The last good version stays online, and is tried again
+                # next time
+                if name in previous:
+                    entries[name] = previous[name]
+            else:
+                entry['sha'] = shas[name]
+                entries[name] = entry
+                converted.append(name)
+
+    # Remove the pages of the notebooks gone, or of their previous versions
+    kept = set(page for entry in entries.values() for page in entry['pages'])
+    for entry in old_entries.values():
+        for page in entry['pages']:
+            if page not in kept:
+                remove_page(output, page)
+
+    shutil.copyfile(CSS, os.path.join(output, CSS_NAME))
+    renderer = Renderer(TEMPLATE, CSS, output)
+    write_page(output, INDEX, index_page(
+        renderer, os.path.basename(root), entries))
+    write_atomically(os.path.join(output, MANIFEST), json.dumps(
+        {'options': options, 'notebooks': entries}))
+    return converted, failed
+
+
+def main(argv=None):
+    """Entry point of the noteorganiser-export command"""
+    parser = argparse.ArgumentParser(
+        description="Convert all the notebooks under a folder to a static "
+        "website, skipping the ones unchanged since the previous export.")
+    parser.add_argument('root', help="folder containing the notebooks")
+    parser.add_argument('output', help="folder where the website is written")
+    parser.add_argument('-j', '--jobs', type=int, default=None,
+                        help="number of worker processes (default: the "
+                        "number of cpus)")
+    parser.add_argument('--tags', action='store_true',
+                        help="write as well a page for every tag of every "
+                        "notebook")
+    parser.add_argument('--toc', action='store_true',
+                        help="add a table of contents to the pages")
+    parser.add_argument('--no-server', action='store_true',
+                        help="start pandoc for every conversion, instead of "
+                        "keeping a server running")
+    parser.add_argument('-v', '--verbose', action='store_true')
+    args = parser.parse_args(argv)
+
+    log = create_logger('INFO' if args.verbose else 'WARNING', 'stream')
+    converted, failed = export(
+        args.root, args.output, args.jobs, args.tags, args.toc,
+        not args.no_server, log)
+    print("%i notebook(s) converted, %i failed" % (
+        len(converted), len(failed)))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -8,11 +8,11 @@ from __future__ import unicode_literals
 import os
 import shutil
 from collections import OrderedDict as od
-import pypandoc as pa
 import six  # Used to replace the od iteritems from py2
 import io
-import traceback  # For failure display
-import time  # for sleep
+import json
+import hashlib
+import threading
 
 from PySide import QtGui
 from PySide import QtCore
@@ -21,22 +21,29 @@ from PySide import QtWebKit
 os.environ['QT_API'] = 'PySide'
 import qtawesome
 
-from .utils import FlowLayout
-from .utils import fuzzySearch
+from .utils import FuzzyMatcher
 
 from subprocess import Popen
 
 # Local imports
-from .popups import NewEntry, NewNotebook, NewFolder
+from .popups import NewEntry, NewNotebook, NewFolder, SearchResults
 import noteorganiser.text_processing as tp
 from .constants import EXTENSION
 from .configuration import search_folder_recursively
+from .cache import HTMLCache
+from .rendering import Renderer, notebook_tag, style_version
+from .backends import create_backend
+from .workers import ConversionService
 from .syntax import ModifiedMarkdownHighlighter
-from .widgets import PicButton, VerticalScrollArea, LineEditWithClearButton
+from .widgets import ShelfModel, ShelfDelegate, ShelfView
+from .widgets import LineEditWithClearButton
 
 
 class CustomFrame(QtGui.QFrame):
     """Base class for all three tabbed frames"""
+    # Fired when a post found by the search engine is chosen, with the path of
+    # its notebook and the line where its body starts
+    openSearchResult = QtCore.Signal(str, int)
 
     def __init__(self, parent=None):
         """ Create the basic layout """
@@ -116,6 +123,26 @@ class CustomFrame(QtGui.QFrame):
                 else:
                     self.clearLayout(item.layout())
 
+    def addSearchEngineField(self):
+        """Add to the toolbar a field to search all the notebooks"""
+        self.searchEngineField = LineEditWithClearButton()
+        self.searchEngineField.setPlaceholderText('search the notebooks')
+        self.searchEngineField.setMaximumWidth(200)
+        self.searchEngineField.returnPressed.connect(self.searchNotebooks)
+        self.toolbar.addWidget(self.searchEngineField)
+
+    def searchNotebooks(self):
+        """Search all the notebooks, and let the user choose a post"""
+        query = self.searchEngineField.text()
+        if not query.strip():
+            return
+        self.log.info("searching the notebooks for '%s'" % query)
+        hits = self.info.search(query)
+        self.popup = SearchResults(hits, self)
+        if self.popup.exec_():
+            hit = self.popup.hit
+            self.openSearchResult.emit(hit.path, hit.line)
+
     def zoomIn(self):
         raise NotImplementedError
 
@@ -232,6 +259,15 @@ class Editing(CustomFrame):
     """
     # Launched when the previewer is desired
     loadNotebook = QtCore.Signal(str)
+    # Maximum number of notebooks kept in a text editor
+    max_loaded = 8
+
+    def initLogic(self):
+        """
+        Keep the loaded text editors, by source, the most recent one last
+
+        """
+        self.editors = od()
 
     def initUI(self):
         self.log.info("Starting UI init of %s" % self.__class__.__name__)
@@ -247,19 +283,81 @@ class Editing(CustomFrame):
         self.tabs = QtGui.QTabWidget(self)
         self.tabs.setTabPosition(QtGui.QTabWidget.West)
 
-        # The loop is over all the notebooks in the **current** folder
-        for notebook in self.info.notebooks:
-            editor = TextEditor(self)
-            # Set the source of the TextEditor to the desired notebook
-            editor.setSource(os.path.join(self.info.level, notebook))
-            # Add the text editor to the tabbed area
+        # The loop is over all the notebooks in the **current** folder. Only
+        # an empty placeholder is created for each of them, the notebook is
+        # read when its tab is shown for the first time, see loadTab. The
+        # editors kept from the previous drawing are reused.
+        sources = [os.path.join(self.info.level, notebook)
+                   for notebook in self.info.notebooks]
+        editors, self.editors = self.editors, od()
+        for source, editor in six.iteritems(editors):
+            if source in sources:
+                self.editors[source] = editor
+            else:
+                editor.deleteLater()
+        for notebook, source in zip(self.info.notebooks, sources):
+            editor = self.editors.get(source, None)
+            if editor is None:
+                editor = QtGui.QWidget()
             self.tabs.addTab(editor, os.path.splitext(notebook)[0])
 
+        self.tabs.currentChanged.connect(self.loadTab)
+        if self.tabs.count():
+            self.loadTab(self.tabs.currentIndex())
+
         hbox.addWidget(self.tabs)
         self.layout().addLayout(hbox)
 
         self.log.info("Finished UI init of %s" % self.__class__.__name__)
 
+    @QtCore.Slot(int)
+    def loadTab(self, index):
+        """Replace the placeholder of the tab by the editor of its notebook"""
+        if index < 0:
+            return
+        source = os.path.join(self.info.level, self.info.notebooks[index])
+        editor = self.tabs.widget(index)
+        if not isinstance(editor, TextEditor):
+            editor = TextEditor(self)
+            # Set the source of the TextEditor to the desired notebook
+            editor.setSource(source)
+            self.swapTab(index, editor).deleteLater()
+        # Mark it as the most recently used
+        self.editors.pop(source, None)
+        self.editors[source] = editor
+        self.evict()
+
+    def swapTab(self, index, widget):
+        """Put the widget in the tab, and return the previous one"""
+        old = self.tabs.widget(index)
+        text = self.tabs.tabText(index)
+        current = self.tabs.currentIndex()
+        self.tabs.blockSignals(True)
+        self.tabs.removeTab(index)
+        self.tabs.insertTab(index, widget, text)
+        self.tabs.setCurrentIndex(current)
+        self.tabs.blockSignals(False)
+        return old
+
+    def evict(self):
+        """
+        Unload the least recently used editors, above max_loaded
+
+        The current editor, and the ones with unsaved modifications, are kept.
+        """
+        current = self.tabs.currentWidget()
+        for source in list(self.editors):
+            if len(self.editors) <= self.max_loaded:
+                break
+            editor = self.editors[source]
+            if editor is current or editor.text.document().isModified():
+                continue
+            index = self.tabs.indexOf(editor)
+            if index != -1:
+                self.swapTab(index, QtGui.QWidget())
+            del self.editors[source]
+            editor.deleteLater()
+
     def initToolBar(self):
         """initialize the toolbar for this view"""
         if not hasattr(self, 'toolbar'):
@@ -323,8 +421,14 @@ class Editing(CustomFrame):
             self.imageInsertAction.triggered.connect(self.insertImage)
             self.toolbar.addAction(self.imageInsertAction)
 
+            self.toolbar.addSeparator()
+            self.addSearchEngineField()
+
     def refresh(self):
-        """Redraw the UI (time consuming...)"""
+        """Redraw the UI, reusing the loaded editors"""
+        # Take the editors out of the tabs, so that they survive the cleaning
+        for editor in self.editors.values():
+            editor.setParent(None)
         self.clearUI()
         self.initUI()
 
@@ -392,6 +496,11 @@ class Editing(CustomFrame):
         self.log.info('ask to preview notebook %s' % notebook)
         self.loadNotebook.emit(notebook)
 
+    def goToLine(self, line):
+        """Move the cursor of the current editor to the line"""
+        editor = self.tabs.currentWidget()
+        editor.goToLine(line)
+
     def zoomIn(self):
         """
         So far only applies to the inside editor, and not the global fonts
@@ -459,6 +568,8 @@ class Preview(CustomFrame):
     """
     # Launched when the editor is desired after failed conversion
     loadEditor = QtCore.Signal(str, str)
+    # Launched when a page is displayed, with the filters applied
+    pageLoaded = QtCore.Signal()
 
     def initLogic(self):
         """
@@ -474,7 +585,44 @@ class Preview(CustomFrame):
         for path in (self.website_root, self.temp_root):
             if not os.path.isdir(path):
                 os.mkdir(path)
+        # Set the css file. Note that the path to the css needs to be absolute,
+        # somehow...
+        path = os.path.abspath(os.path.dirname(__file__))
+        self.css = os.path.join(path, 'assets', 'style', 'bootstrap.css')
+        self.template = os.path.join(
+            path, 'assets', 'style', 'bootstrap-blog.html')
+        self.fragments_template = os.path.join(
+            path, 'assets', 'style', 'fragments.html')
+        # Any change to the style invalidates the cached pages
+        self.style_version = style_version(
+            self.css, self.template, self.fragments_template)
+
+        # The rendered pages are kept across notebooks, as long as the level
+        # does not change, and the rendered posts for the whole session
+        if getattr(self, 'cache', None) is None or \
+                self.cache.root != self.website_root:
+            self.cache = HTMLCache(self.website_root)
+        if not hasattr(self, 'renderer'):
+            self.renderer = Renderer(
+                self.template, self.css, self.temp_root,
+                backend=create_backend(
+                    self.fragments_template, self.log, self.temp_root,
+                    self.info.pandoc_server))
+            # Protects the caches from concurrent conversions
+            self.lock = threading.Lock()
+            # The conversions are done outside of the main thread, and the
+            # results or failures sent back by signals
+            self.service = ConversionService(self)
+            self.service.finished.connect(self.displayPage)
+            self.service.failed.connect(self.conversionFailed)
+            # Whether the page displayed gathers all the notebooks of the
+            # level, see :meth:`loadGlobal`
+            self.global_page = False
+        self.renderer.backend.temp_root = self.temp_root
         self.extracted_tags = od()
+        # Tags of every post of the current page, and their inverted index
+        self.posts_tags = []
+        self.tag_index = tp.TagIndex([])
         self.filters = []
 
         # Shortcuts for resizing
@@ -489,15 +637,11 @@ class Preview(CustomFrame):
         # toolbar on top
         self.initToolBar()
 
-        # Left hand side: html window
+        # Left hand side: html window. The filters are applied inside the page,
+        # once it is loaded
         self.web = QtWebKit.QWebView(self)
+        self.web.loadFinished.connect(self.filterPage)
 
-        # Set the css file. Note that the path to the css needs to be absolute,
-        # somehow...
-        path = os.path.abspath(os.path.dirname(__file__))
-        self.css = os.path.join(path, 'assets', 'style', 'bootstrap.css')
-        self.template = os.path.join(
-            path, 'assets', 'style', 'bootstrap-blog.html')
         self.web.settings().setUserStyleSheetUrl(QtCore.QUrl.fromLocalFile(
             self.css))
 
@@ -541,9 +685,11 @@ class Preview(CustomFrame):
                 tag.setMinimumSize(100, 40+5*value)
                 tag.setMaximumWidth(165)
                 tag.setCheckable(True)
+                tag.setChecked(key in self.filters)
                 tag.clicked.connect(self.addFilter)
                 self.tagButtons.append([key, tag])
                 vbox.addWidget(tag)
+        self.tagMatcher = FuzzyMatcher([key for key, _ in self.tagButtons])
         # Adding everything to the scroll area
         dummy.setLayout(vbox)
         scrollArea.setWidget(dummy)
@@ -571,12 +717,33 @@ class Preview(CustomFrame):
             self.reloadAction.triggered.connect(self.reload)
             self.toolbar.addAction(self.reloadAction)
 
+            # Global page, with all the notebooks of the level
+            globalIcon = qtawesome.icon('fa.globe')
+            self.globalAction = QtGui.QAction(
+                globalIcon, '&All notebooks', self)
+            self.globalAction.setIconText('&All notebooks')
+            self.globalAction.triggered.connect(self.loadGlobal)
+            self.toolbar.addAction(self.globalAction)
+
+            # Include the notebooks of the sub-folders in the global page
+            recursiveIcon = qtawesome.icon('fa.sitemap')
+            self.recursiveAction = QtGui.QAction(
+                recursiveIcon, '&Sub-folders', self)
+            self.recursiveAction.setIconText('&Sub-folders')
+            self.recursiveAction.setCheckable(True)
+            self.recursiveAction.toggled.connect(self.toggleRecursive)
+            self.toolbar.addAction(self.recursiveAction)
+
+            self.toolbar.addSeparator()
+            self.addSearchEngineField()
+
     def addFilter(self):
         """
         Filter out/in a certain tag
 
         From the status of the sender button, the associated tag will be
-        added/removed from the filter.
+        added/removed from the filter. The whole notebook being already
+        displayed, the posts are simply shown or hidden inside the page.
 
         """
         sender = self.sender()
@@ -590,16 +757,25 @@ class Preview(CustomFrame):
 
             self.log.info("filter %s out of %s" % (
                 ', '.join(self.filters), self.info.current_notebook))
-            url, self.remaining_tags = self.convert(
-                os.path.join(self.info.level, self.info.current_notebook),
-                self.filters)
-            # Grey out not useful buttons
-            for key, button in self.tagButtons:
-                if key in self.remaining_tags:
-                    self.enableButton(button)
-                else:
-                    self.disableButton(button)
-            self.setWebpage(url)
+            self.updateButtons()
+            self.filterPage()
+
+    def updateButtons(self):
+        """Grey out the buttons of tags absent from the filtered posts"""
+        self.remaining_tags = self.tag_index.remaining(
+            self.tag_index.select(self.filters))
+        for key, button in self.tagButtons:
+            if key in self.remaining_tags:
+                self.enableButton(button)
+            else:
+                self.disableButton(button)
+
+    def filterPage(self, ok=True):
+        """Show only the posts containing all the filters"""
+        self.web.page().mainFrame().evaluateJavaScript(
+            'filterPosts(%s);' % json.dumps(self.filters))
+        if ok:
+            self.pageLoaded.emit()
 
     def setWebpage(self, page):
         self.web.load(QtCore.QUrl.fromLocalFile(page))
@@ -608,37 +784,86 @@ class Preview(CustomFrame):
         """
         Load a given markdown file as an html page
 
+        The conversion is done in the background, and the page displayed by
+        :meth:`displayPage` once it is ready.
         """
         # TODO the dates should be recovered as well"
         self.initLogic()
+        self.global_page = False
         self.info.current_notebook = notebook
         self.log.info("Extracting markdown from %s" % notebook)
+        self.service.submit(self.render,
+                            os.path.join(self.info.level, notebook))
+        return True
 
-        try:
-            url, tags = self.convert(
-                os.path.join(self.info.level, notebook), ())
-        except ValueError:  # pragma: no cover
-            self.log.error("Markdown conversion failed, aborting")
-            return False
-        except SyntaxError:  # pragma: no cover
-            self.log.warning("Modified Markdown syntax error, aborting")
-            return False
-
-        self.extracted_tags = tags
+    def loadGlobal(self):
+        """
+        Load all the notebooks of the level as a single page
+
+        The name of every notebook is added to the tags of its posts, to filter
+        the page by notebook. With the sub-folders, see
+        :meth:`toggleRecursive`, their notebooks are gathered as well.
+        """
+        self.initLogic()
+        self.global_page = True
+        self.info.current_notebook = ''
+        self.log.info("Gathering all the notebooks of %s" % self.info.level)
+        self.service.submit(self.renderGlobal, self.info.level,
+                            self.recursiveAction.isChecked())
+        return True
+
+    def toggleRecursive(self, checked):
+        """Include or not the sub-folders in the displayed global page"""
+        if self.global_page:
+            self.reload()
+
+    @QtCore.Slot(object)
+    def displayPage(self, result):
+        """
+        Display a converted page, and redraw the tags if they changed
+
+        """
+        url, self.posts_tags = result
+        self.tag_index = tp.TagIndex(self.posts_tags)
+        self.extracted_tags = self.tag_index.remaining(self.tag_index.all)
+        if [key for key, _ in self.tagButtons] != list(self.extracted_tags):
+            self.clearUI()
+            self.initUI()
+        self.updateButtons()
         # Finally, set the url of the web viewer to the desired page
-        self.clearUI()
-        self.initUI()
         self.setWebpage(url)
-        return True
+
+    @QtCore.Slot(str, str)
+    def conversionFailed(self, kind, message):
+        """Inform the user, and go back to the editor"""
+        self.popup = QtGui.QMessageBox(self)
+        source = self.info.current_notebook
+        if self.global_page:
+            source = 'the notebooks of %s' % self.info.level
+        if kind == 'syntax':
+            self.log.warn(
+                "There was an expected error in converting"
+                " %s to markdown" % source)
+            self.popup.setIcon(QtGui.QMessageBox.Warning)
+            self.popup.setText(
+                "<b>Oups, you (probably) did a syntax error!</b>")
+        else:
+            self.log.error("Conversion of %s to markdown failed" % source)
+            self.popup.setIcon(QtGui.QMessageBox.Critical)
+            self.popup.setText(
+                "<b>The conversion to markdown has unexpectedly failed!</b>")
+        self.popup.setInformativeText(message)
+        self.popup.exec_()
+        # The message of the error tells which notebook to fix
+        if self.global_page:
+            return
+        self.loadEditor.emit('editing', os.path.splitext(
+            os.path.basename(self.info.current_notebook))[0])
 
     def convert(self, path, tags):
         """
         Convert a notebook to html, with entries corresponding to the tags
 
-        TODO: during the execution of this method, a check should be performed
-        to verify if the file already exists, or maybe inside the convert
-        function.
-
         Returns
         -------
         url : string
@@ -647,67 +872,93 @@ class Preview(CustomFrame):
             dictionary of the remaining tags (the ones appearing in posts where
             all the selected tags where appearing, for further refinment)
         """
-        # If the conversion fails, a popup should appear to inform the user
-        # about it
-        try:
-            markdown, remaining_tags = tp.from_notes_to_markdown(
-                path, input_tags=tags)
-        except (IndexError, UnboundLocalError):  # pragma: no cover
-            self.log.error("Conversion of %s to markdown failed" % path)
-            self.popup = QtGui.QMessageBox(self)
-            self.popup.setIcon(QtGui.QMessageBox.Critical)
-            self.popup.setText(
-                "<b>The conversion to markdown has unexpectedly failed!</b>")
-            self.popup.setInformativeText("%s" % traceback.format_exc())
-            ok = self.popup.exec_()
-            if ok:
-                raise ValueError("The conversion of the notebook failed")
-        except ValueError as e:  # pragma: no cover
-            self.log.warn(
-                "There was an expected error in converting"
-                " %s to markdown" % path)
-            self.popup = QtGui.QMessageBox(self)
-            self.popup.setIcon(QtGui.QMessageBox.Warning)
-            self.popup.setText(
-                "<b>Oups, you (probably) did a syntax error!</b>")
-            self.popup.setInformativeText("%s" % e.message)
-            ok = self.popup.exec_()
-            if ok:
-                raise SyntaxError("There was a syntax error")
-
-        # save a temp. The basename will be modified to reflect the selection
-        # of tags.
-        base = os.path.basename(path)[:-len(EXTENSION)]
-        if tags:
-            base += '_'+'_'.join(tags)
-        temp_path = os.path.join(self.temp_root, base+EXTENSION)
-        self.log.debug('Creating temp file %s' % temp_path)
-        with io.open(temp_path, 'w', encoding='utf-8') as temp:
-            temp.write('\n'.join(markdown))
-
-        # extra arguments for pandoc
-        extra_args = ['--highlight-style', 'pygments', '-s', '-c', self.css,
-                      '--template', self.template]
-
-        # use TOC if enabled
-        if self.info.use_TOC:
-            extra_args.append('--toc')
-
-        # Apply pandoc to this markdown file, from pypandoc thin wrapper, and
-        # recover the html
-        html = pa.convert(temp_path, 'html', encoding='utf-8',
-                          extra_args=extra_args)
-
-        # Convert the windows ending of lines to simple line breaks (\r\n to
-        # \n)
-        html = html.replace('\r\n', '\n')
+        url, posts_tags = self.render(path, tags)
+        _, remaining_tags = tp.select_posts(posts_tags)
+        return url, remaining_tags
+
+    def render(self, path, tags=()):
+        """
+        Produce the html page of a notebook, with entries corresponding to tags
+
+        The produced pages are stored in an :class:`HTMLCache`, keyed by the
+        SHA sum of the notebook, the selected tags, the use of the TOC and the
+        style version. If the page already exists, it is returned directly.
+        Otherwise, it is assembled by the :class:`Renderer` from the html of
+        every post, which is only computed by pandoc the first time a post is
+        encountered.
+
+        Returns
+        -------
+        url : string
+            path to the html page
+        posts_tags : list
+            tags of every post displayed in the page
+        """
+        with self.lock:
+            return self.renderPage(path, tags)
+
+    def renderPage(self, path, tags):
+        """Produce the page, see :meth:`render`"""
+        sha = self.info.get_sha(path)
+        options = (tuple(sorted(tags)), self.info.use_TOC, self.style_version)
+        cached = self.cache.get(path, sha, options)
+        if cached is not None:
+            self.log.debug('Loading %s from the cache' % cached[0])
+            return cached
+
+        # The errors are propagated, to be reported by the ConversionService
+        html, posts_tags = self.renderer.convert(path, tags, self.info.use_TOC)
 
         # Write the html to a file
-        url = os.path.join(self.website_root, base+'.html')
+        url = self.cache.url(path, sha, options)
         with io.open(url, 'w', encoding='utf-8') as page:
             page.write(html)
+        self.cache.store(path, sha, options, url, posts_tags)
 
-        return url, remaining_tags
+        return url, posts_tags
+
+    def renderGlobal(self, level, recursive=False):
+        """
+        Produce the html page of all the notebooks of a level
+
+        Like :meth:`render`, the page is stored in the :class:`HTMLCache`,
+        keyed by the SHA sums of all the notebooks. The notebooks are only
+        parsed again if their own SHA sum changed, see
+        :meth:`Renderer.convert_global`.
+
+        Returns
+        -------
+        url : string
+            path to the html page
+        posts_tags : list
+            tags of every post displayed in the page
+        """
+        with self.lock:
+            return self.renderGlobalPage(level, recursive)
+
+    def renderGlobalPage(self, level, recursive):
+        """Produce the global page, see :meth:`renderGlobal`"""
+        notebooks = [
+            (path, self.info.get_sha(path), notebook_tag(path, level))
+            for path in self.info.tree.notebooks(level, recursive)]
+        sha = hashlib.sha1(repr(notebooks).encode('utf-8')).hexdigest()
+        options = ('global', recursive, self.info.use_TOC,
+                   self.style_version)
+        cached = self.cache.get(level, sha, options)
+        if cached is not None:
+            self.log.debug('Loading %s from the cache' % cached[0])
+            return cached
+
+        html, posts_tags = self.renderer.convert_global(
+            os.path.basename(os.path.normpath(level)), notebooks,
+            use_TOC=self.info.use_TOC)
+
+        url = self.cache.url(level, sha, options)
+        with io.open(url, 'w', encoding='utf-8') as page:
+            page.write(html)
+        self.cache.store(level, sha, options, url, posts_tags)
+
+        return url, posts_tags
 
     def disableButton(self, button):
         """ TODO: this should also alter the style """
@@ -740,16 +991,33 @@ class Preview(CustomFrame):
 
         keep currently activated filters
         """
+        if self.global_page:
+            self.log.info('reloading the global page')
+            self.service.submit(self.renderGlobal, self.info.level,
+                                self.recursiveAction.isChecked())
+            return
+        if not self.info.current_notebook:
+            return
         self.log.info('reloading the current preview')
-        url, self.remaining_tags = self.convert(
-            os.path.join(self.info.level, self.info.current_notebook),
-            self.filters)
-        for key, button in self.tagButtons:
-            if key in self.remaining_tags:
-                self.enableButton(button)
-            else:
-                self.disableButton(button)
-        self.setWebpage(url)
+        self.service.submit(self.render, os.path.join(
+            self.info.level, self.info.current_notebook))
+
+    def forgetNotebooks(self, paths):
+        """Drop the pages and the parsed posts of removed notebooks"""
+        with self.lock:
+            for path in paths:
+                self.cache.forget(path)
+                self.renderer.states.pop(path, None)
+                self.renderer.notebooks.pop(path, None)
+
+    def setBackend(self):
+        """Choose how to run pandoc, depending on the settings"""
+        backend = create_backend(self.fragments_template, self.log,
+                                 self.temp_root, self.info.pandoc_server)
+        with self.lock:
+            self.renderer.backend.close()
+            self.renderer.backend = backend
+        self.log.info('pandoc backend set to %s' % backend.__class__.__name__)
 
     def filterButtons(self, filterText):
         """
@@ -757,18 +1025,23 @@ class Preview(CustomFrame):
 
         gets called when the text in the search field changes
         """
-        for key, button in self.tagButtons:
-            button.setVisible(fuzzySearch(filterText, key))
+        matching = set(index for index, _ in self.tagMatcher.match(filterText))
+        for index, (_, button) in enumerate(self.tagButtons):
+            visible = index in matching
+            # Only the buttons changing state are touched
+            if button.isHidden() == visible:
+                button.setVisible(visible)
 
     def searchFieldReturn(self):
         """
         return key was pressed in the searchField
 
-        hit the first visible tag button
+        hit the tag button best matching the search field
         """
-        button = [button for _, button in self.tagButtons
-                  if button.isVisible()][0]
-        button.click()
+        matches = self.tagMatcher.match(self.searchField.text())
+        if matches:
+            index, _ = min(matches, key=lambda match: match[1])
+            self.tagButtons[index][1].click()
 
 
 class Shelves(CustomFrame):
@@ -783,41 +1056,33 @@ class Shelves(CustomFrame):
     switchTabSignal = QtCore.Signal(str, str)
     previewSignal = QtCore.Signal(str)
 
+    # Size of the icons
+    iconSize = 128
+
     def initUI(self):
         """Create the physical shelves"""
         self.setFrameStyle(QtGui.QFrame.StyledPanel | QtGui.QFrame.Sunken)
 
-        self.path = os.path.dirname(__file__)
-        self.buttons = []
-
         # update state of UpAction when shelves get refreshed
         self.refreshSignal.connect(self.updateUpAction)
 
-        # Store the number of objects per line, for faster redrawing on
-        # resizing. Initially set to zero, it will, the first time, be set by
-        # the method createLines, and then be compared to.
-        self.objectsPerLine = 0
-        # Left hand side: Vertical layout for the notebooks and folders
-        scrollArea = VerticalScrollArea(self)
-
-        # Need to create a dummy Widget, because QScrollArea can not accept a
-        # layout, only a Widget
-        dummy = QtGui.QWidget()
-
-        vbox = QtGui.QVBoxLayout()
-        grid = self.createLines()
+        # The notebooks and folders are items of a model, and only the visible
+        # ones are painted by the view
+        self.model = ShelfModel(self)
+        self.delegate = ShelfDelegate(self.iconSize, self)
+        self.view = ShelfView(self.model, self.delegate, self)
+        self.view.notebookClicked.connect(self.notebookClicked)
+        self.view.folderClicked.connect(self.folderClicked)
+        self.view.deleteNotebookSignal.connect(self.removeNotebook)
+        self.view.deleteFolderSignal.connect(self.removeFolder)
+        self.view.previewSignal.connect(self.previewNotebook)
+        self.model.setItems(self.items())
 
-        vbox.addLayout(grid)
-        vbox.addStretch(1)
-        dummy.setLayout(vbox)
-        scrollArea.setWidget(dummy)
-
-        self.layout().addWidget(scrollArea)
+        self.layout().addWidget(self.view)
 
     def refresh(self):
-        # Redraw the graphical interface.
-        self.clearUI()
-        self.initUI()
+        # Only the items which changed are inserted or removed
+        self.model.setItems(self.items())
 
         # Broadcast a refreshSignal order
         self.refreshSignal.emit()
@@ -857,7 +1122,8 @@ class Shelves(CustomFrame):
             # browsed out.
             folder_path = os.path.join(self.info.root, folder_name)
             self.info.notebooks, self.info.folders = search_folder_recursively(
-                self.log, folder_path, self.info.display_empty)
+                self.log, folder_path, self.info.display_empty,
+                self.info.tree)
             # Update the current level as the folder_path, and refresh the
             # content of the window
             self.info.level = folder_path
@@ -867,7 +1133,8 @@ class Shelves(CustomFrame):
         self.info.display_empty = not self.info.display_empty
         # Read again the current folder
         self.info.notebooks, self.info.folders = search_folder_recursively(
-            self.log, self.info.level, self.info.display_empty)
+            self.log, self.info.level, self.info.display_empty,
+            self.info.tree)
         # save settings
         self.settings = QtCore.QSettings("audren", "NoteOrganiser")
         self.settings.setValue("display_empty", self.info.display_empty)
@@ -892,6 +1159,7 @@ class Shelves(CustomFrame):
 
         if self.reply == QtGui.QMessageBox.Yes:
             os.remove(path)
+            self.info.get_index(path).forget(path)
             # Delete the reference to the notebook
             index = self.info.notebooks.index(notebook+EXTENSION)
             self.info.notebooks.pop(index)
@@ -932,18 +1200,17 @@ class Shelves(CustomFrame):
         else:
             self.log.info("Aborting")
 
-    def notebookClicked(self):
-        sender = self.sender()
-        self.log.info('notebook '+sender.label+' button cliked')
+    @QtCore.Slot(str)
+    def notebookClicked(self, notebook):
+        self.log.info('notebook '+notebook+' button cliked')
         # Emit a signal asking for changing the tab
-        self.switchTabSignal.emit('editing', sender.label)
+        self.switchTabSignal.emit('editing', notebook)
 
-    def folderClicked(self):
-        sender = self.sender()
-        self.log.info('folder '+sender.label+' button cliked')
-        folder_path = os.path.join(self.info.root, sender.label)
+    @QtCore.Slot(str)
+    def folderClicked(self, folder_path):
+        self.log.info('folder '+os.path.basename(folder_path)+' button cliked')
         self.info.notebooks, self.info.folders = search_folder_recursively(
-            self.log, folder_path, self.info.display_empty)
+            self.log, folder_path, self.info.display_empty, self.info.tree)
         # Update the current level as the folder_path, and refresh the content
         # of the window
         self.info.level = folder_path
@@ -952,50 +1219,18 @@ class Shelves(CustomFrame):
     def upFolder(self):
         folder_path = os.path.dirname(self.info.level)
         self.info.notebooks, self.info.folders = search_folder_recursively(
-            self.log, folder_path, self.info.display_empty)
+            self.log, folder_path, self.info.display_empty, self.info.tree)
         # Update the current level as the folder_path, and refresh the content
         # of the window
         self.info.level = folder_path
         self.refresh()
 
-    def createLines(self):
-        # Defining the icon size used
-        self.size = 128
-
-        # Create the lines array
-        flow = FlowLayout()
-        for notebook in self.info.notebooks:
-            # distinguish between a notebook and a folder, stored as a tuple.
-            # When encountering a folder, simply put a different image for the
-            # moment.
-            button = PicButton(
-                QtGui.QPixmap(
-                    os.path.join(self.path, 'assets',
-                                 'notebook-%i.png' % self.size)),
-                os.path.splitext(notebook)[0], 'notebook', self)
-            button.setMinimumSize(self.size, self.size)
-            button.setMaximumSize(self.size, self.size)
-            button.clicked.connect(self.notebookClicked)
-            button.deleteNotebookSignal.connect(self.removeNotebook)
-            button.previewSignal.connect(self.previewNotebook)
-            self.buttons.append(button)
-            flow.addWidget(button)
-
-        for folder in self.info.folders:
-            button = PicButton(
-                QtGui.QPixmap(
-                    os.path.join(self.path, 'assets',
-                                 'folder-%i.png' % self.size)),
-                os.path.basename(folder), 'folder', self)
-            button.setMinimumSize(self.size, self.size)
-            button.setMaximumSize(self.size, self.size)
-            button.clicked.connect(self.folderClicked)
-            button.deleteFolderSignal.connect(self.removeFolder)
-            self.buttons.append(button)
-            flow.addWidget(button)
-
-        self.flow = flow
-        return flow
+    def items(self):
+        """Return the notebooks, then the folders, of the current level"""
+        return [('notebook', os.path.splitext(notebook)[0], notebook)
+                for notebook in self.info.notebooks] + [
+            ('folder', os.path.basename(folder), folder)
+            for folder in self.info.folders]
 
     @QtCore.Slot(str)
     def previewNotebook(self, notebook):
@@ -1014,8 +1249,20 @@ class Shelves(CustomFrame):
 
 
 class TextEditor(CustomFrame):
-    """Custom text editor"""
+    """
+    Custom text editor
+
+    When the notebook is modified on the disk, and the text was not, the
+    notebook is read again. The changes are collected for reloadDelay ms, so
+    that a burst of writes is read once, in a background thread, and only the
+    modified part of the text is replaced, which keeps the cursor and the
+    scrolling in place.
+    """
     defaultFontSize = 14
+    # Time without a change before reading the notebook again, in ms
+    reloadDelay = 200
+    # Fired when the text was updated from the disk
+    reloaded = QtCore.Signal()
 
     def initUI(self):
         """top menu bar and the text area"""
@@ -1036,6 +1283,14 @@ class TextEditor(CustomFrame):
 
         # watch notebooks on the filesystem for changes
         self.fileSystemWatcher = QtCore.QFileSystemWatcher(self)
+        self.fileSystemWatcher.fileChanged.connect(self.autoRefresh)
+        self.reloadTimer = QtCore.QTimer(self)
+        self.reloadTimer.setSingleShot(True)
+        self.reloadTimer.setInterval(self.reloadDelay)
+        self.reloadTimer.timeout.connect(self.startReload)
+        self.reader = ConversionService(self)
+        self.reader.finished.connect(self.applyText)
+        self.reader.failed.connect(self.reloadFailed)
 
         self.layout().addWidget(self.text)
 
@@ -1049,9 +1304,7 @@ class TextEditor(CustomFrame):
         if self.source:
             # Store the last cursor position
             oldCursor = self.text.textCursor()
-            text = io.open(self.source, 'r', encoding='utf-8',
-                           errors='replace').read()
-            self.text.setText(text)
+            self.text.setPlainText(read_text(self.source))
             self.text.setTextCursor(oldCursor)
             self.text.ensureCursorVisible()
             self.text.document().setModified(False)
@@ -1061,14 +1314,23 @@ class TextEditor(CustomFrame):
         text = self.text.toPlainText()
         with io.open(self.source, 'w', encoding='utf-8') as file_handle:
             file_handle.write(text)
+        # The editor can now be unloaded, and reloaded from the disk
+        self.text.document().setModified(False)
 
     def appendText(self, text):
-        self.text.append('\n'+text)
+        self.text.appendPlainText('\n'+text)
         self.saveText()
 
     def insertText(self, text):
         self.text.insertPlainText(text)
 
+    def goToLine(self, line):
+        """Put the cursor at the beginning of the line, and show it"""
+        block = self.text.document().findBlockByNumber(line)
+        self.text.setTextCursor(QtGui.QTextCursor(block))
+        self.text.ensureCursorVisible()
+        self.text.setFocus()
+
     def zoomIn(self):
         size = self.font.pointSize()
         self.font.setPointSize(size+1)
@@ -1085,34 +1347,93 @@ class TextEditor(CustomFrame):
 
     def setupAutoRefresh(self, source):
         """add current file to QFileSystemWatcher and refresh when needed"""
-        self.fileSystemWatcher.addPath(source)
-        self.fileSystemWatcher.fileChanged.connect(
-            self.autoRefresh)
+        if source not in self.fileSystemWatcher.files():
+            self.fileSystemWatcher.addPath(source)
         self.log.info("added file %s to FileSystemWatcher" % source)
 
     @QtCore.Slot(str)
     def autoRefresh(self, path=''):
-        """refresh editor when needed"""
-        # only refresh if wanted and the user didn't modify the text in the
-        # internal editor
+        """refresh editor when needed, once the changes are over"""
         if self.info.refreshEditor:
-            if not self.text.document().isModified():
-                # wait some time for the change to finish
-                time.sleep(0.1)
-                self.loadText()
-                self.fileSystemWatcher.removePath(path)
-                self.fileSystemWatcher.addPath(path)
-                self.log.info(
-                    'editor source reloaded because the file changed')
-            else:
-                self.log.info(
-                    "reload of editor source skipped because it's modified")
+            # Restart the delay at every change
+            self.reloadTimer.start()
+
+    def startReload(self):
+        """Read the notebook in the background, unless the text is modified"""
+        # Some editors replace the file when saving, which stops watching it
+        if os.path.exists(self.source) and \
+                self.source not in self.fileSystemWatcher.files():
+            self.fileSystemWatcher.addPath(self.source)
+        # only refresh if the user didn't modify the text in the internal
+        # editor
+        if self.text.document().isModified():
+            self.log.info(
+                "reload of editor source skipped because it's modified")
+            return
+        self.reader.submit(read_text, self.source)
+
+    @QtCore.Slot(object)
+    def applyText(self, text):
+        """Replace the part of the text which changed on the disk"""
+        document = self.text.document()
+        # The user may have typed while the notebook was read
+        if document.isModified():
+            self.log.info(
+                "reload of editor source skipped because it's modified")
+            return
+        old = self.text.toPlainText()
+        begin, end, replacement = tp.changed_range(old, text)
+        if begin != end or replacement:
+            scrollBar = self.text.verticalScrollBar()
+            scroll = scrollBar.value()
+            # The cursors outside of the replaced part keep their position.
+            # Like setPlainText, the reload can not be undone, and clears the
+            # history of the previous edits
+            document.setUndoRedoEnabled(False)
+            cursor = QtGui.QTextCursor(document)
+            cursor.setPosition(utf16_length(old[:begin]))
+            cursor.setPosition(utf16_length(old[:end]),
+                               QtGui.QTextCursor.KeepAnchor)
+            cursor.insertText(replacement)
+            document.setUndoRedoEnabled(True)
+            scrollBar.setValue(scroll)
+            document.setModified(False)
+        self.log.info('editor source reloaded because the file changed')
+        self.reloaded.emit()
+
+    @QtCore.Slot(str, str)
+    def reloadFailed(self, kind, message):
+        self.log.warning("%s could not be reloaded: %s" % (
+            self.source, message))
+
+
+def read_text(path):
+    """Return the content of a notebook"""
+    with io.open(path, 'r', encoding='utf-8', errors='replace') as notebook:
+        return notebook.read()
+
+
+def utf16_length(text):
+    """
+    Return the length of a text for Qt, in UTF-16 code units
+
+    The characters outside of the Basic Multilingual Plane, like the emojis,
+    count for two, while Python 3 counts them as one.
+    """
+    return len(text.encode('utf-16-le'))//2
+
 
+class CustomTextEdit(QtGui.QPlainTextEdit):
+    """
+    Plain text area, laid out block by block
 
-class CustomTextEdit(QtGui.QTextEdit):
+    Contrary to a QTextEdit, the text is never interpreted as html, and only
+    the visible blocks are laid out, which keeps the typing and the scrolling
+    fast on large notebooks.
+    """
 
     def toPlainText(self):
-        text = QtGui.QTextEdit.toPlainText(self)
+        text = QtGui.QPlainTextEdit.toPlainText(self)
         if isinstance(text, bytes):
             text = str(text)
         return text
@@ -0,0 +1,184 @@
+"""
+.. module:: index
+    :synopsys: Persistent summary of the notebooks of a folder
+
+"""
+from __future__ import unicode_literals
+import os
+import io
+import json
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict as od
+
+import noteorganiser.text_processing as tp
+
+# Name of the folder storing the index, inside the folder of the notebooks
+INDEX_FOLDER = '.noteorganiser'
+# Increased whenever the content of an entry changes
+VERSION = 3
+
+
+class NotebookIndex(object):
+    """
+    Summary of every notebook of a folder, stored on disk
+
+    For each notebook, the entry holds the size, modification time and SHA sum
+    of the file, its title, and for each post the span of its body in the
+    lines of the file, its title, date and tags. When only the tags were
+    needed, only their counts are stored. An entry is checked with a
+    single stat of the notebook: the SHA sum is only computed again if the
+    size or modification time changed, and the notebook is only parsed again
+    if the sum changed.
+
+    The index is written in `folder/.noteorganiser/index`, through a
+    temporary file moved over the previous one, so that an interrupted write
+    never leaves a corrupted index.
+
+    """
+    def __init__(self, folder, log):
+        self.folder = folder
+        self.log = log
+        self.path = os.path.join(folder, INDEX_FOLDER, 'index')
+        # The Preview accesses it from its own thread
+        self.lock = threading.RLock()
+        self.entries = {}
+        self.load()
+
+    def load(self):
+        """Read the index, starting from scratch if it is unusable"""
+        try:
+            with io.open(self.path, 'rb') as index:
+                data = json.loads(index.read().decode('utf-8'))
+            if data['version'] == VERSION:
+                self.entries = data['notebooks']
+        except (IOError, OSError, ValueError, KeyError, TypeError):
+            self.entries = {}
+
+    def save(self):
+        """Write the index atomically"""
+        with self.lock:
+            data = json.dumps({'version': VERSION, 'notebooks': self.entries})
+        try:
+            write_atomically(self.path, data)
+        except (IOError, OSError) as error:
+            # The index only saves time, the application works without it
+            self.log.warning("The index %s could not be written: %s" % (
+                self.path, error))
+
+    def entry(self, path):
+        """Return the up to date entry of a notebook, without parsing it"""
+        name = os.path.basename(path)
+        stat = os.stat(path)
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is not None and entry['size'] == stat.st_size and \
+                    entry['mtime'] == stat.st_mtime:
+                return entry
+        with io.open(path, 'rb') as notebook:
+            sha = hashlib.sha1(notebook.read()).hexdigest()
+        with self.lock:
+            if entry is None or entry['sha'] != sha:
+                entry = {'sha': sha, 'title': None, 'posts': None,
+                         'tags': None}
+            entry['size'], entry['mtime'] = stat.st_size, stat.st_mtime
+            self.entries[name] = entry
+        self.save()
+        return entry
+
+    def sha(self, path):
+        """Return the SHA sum of the notebook's content"""
+        return self.entry(path)['sha']
+
+    def posts(self, path):
+        """
+        Return the title of the notebook, and a summary of its posts
+
+        Returns
+        -------
+        title : str
+            title of the notebook
+        posts : list
+            body start, body end, title, date (ISO format) and tags of
+            every post
+        """
+        entry = self.entry(path)
+        if entry['posts'] is None:
+            with io.open(path, 'r', encoding='utf-8',
+                         errors='replace') as notebook:
+                title, posts = tp.parse_posts(notebook.readlines())
+            with self.lock:
+                entry['title'] = title
+                entry['posts'] = [
+                    [post.start, post.end, post.title, post.date.isoformat(),
+                     list(post.tags)] for post in posts]
+            self.save()
+        return entry['title'], entry['posts']
+
+    def tags(self, path):
+        """
+        Return the tags of the notebook, sorted as :func:`tp.sort_tags`
+
+        If the notebook was not parsed, only its lines of tags are read.
+        """
+        entry = self.entry(path)
+        if entry['posts'] is not None:
+            return tp.sort_tags(
+                tag for post in entry['posts'] for tag in post[4])
+        if entry['tags'] is None:
+            tags = tp.tags_from_notes(path)
+            with self.lock:
+                entry['tags'] = [[tag, count] for tag, count in tags.items()]
+            self.save()
+        return od((tag, count) for tag, count in entry['tags'])
+
+    def forget(self, path):
+        """Remove the entry of a notebook"""
+        with self.lock:
+            if self.entries.pop(os.path.basename(path), None) is None:
+                return
+        self.save()
+
+    def prune(self, notebooks):
+        """Remove the entries of the notebooks no longer in the folder"""
+        with self.lock:
+            removed = [name for name in self.entries if name not in notebooks]
+            for name in removed:
+                del self.entries[name]
+        if removed:
+            self.save()
+
+
+def write_atomically(path, data):
+    """
+    Write the text to path through a temporary file, moved over the previous
+    one, so that an interrupted write never leaves a corrupted file
+    """
+    folder = os.path.dirname(path)
+    if not os.path.isdir(folder):
+        os.makedirs(folder)
+    handle, temp_path = tempfile.mkstemp(
+        dir=folder, prefix=os.path.basename(path)+'.')
+    try:
+        with io.open(handle, 'wb') as output:
+            output.write(data.encode('utf-8'))
+            output.flush()
+            os.fsync(output.fileno())
+        replace(temp_path, path)
+    except Exception:
+        os.remove(temp_path)
+        raise
+
+
+def replace(source, destination):
+    """Move source over destination, atomically when possible"""
+    if hasattr(os, 'replace'):
+        os.replace(source, destination)
+    else:
+        try:
+            os.rename(source, destination)
+        except OSError:
+            # Windows refuses to rename over an existing file
+            os.remove(destination)
+            os.rename(source, destination)
@@ -182,7 +182,7 @@ class NewEntry(Dialog):
         index = self.parent.tabs.currentIndex()
         notebook = os.path.join(self.info.level, self.info.notebooks[index])
         self.log.info("reading tags from %s" % notebook)
-        _, tags = tp.from_notes_to_markdown(notebook)
+        tags = self.info.get_tags(notebook)
         tagsLineLayout = QtGui.QHBoxLayout()
         self.tagsLineLabel = QtGui.QLabel("Tags:")
         self.tagsLineLabel.setFixedWidth(40)
@@ -327,3 +327,51 @@ class SetExternalEditor(Dialog):
         self.settings = QtCore.QSettings("audren", "NoteOrganiser")
         self.settings.setValue("externalEditor", self.commandline)
         self.clean_accept()
+
+
+class SearchResults(Dialog):
+    """List the posts found by the search engine, to choose one"""
+
+    def __init__(self, hits, parent=None):
+        Dialog.__init__(self, parent)
+        self.hits = hits
+        self.hit = None
+        self.initUI()
+
+    def initUI(self):
+        self.log.info("Creating a 'Search Results' form")
+        self.setWindowTitle("Search results")
+
+        self.resultsList = QtGui.QListWidget()
+        for hit in self.hits:
+            self.resultsList.addItem("%s (%s)" % (
+                hit.title, os.path.relpath(hit.path, self.info.root)))
+        if self.hits:
+            self.resultsList.setCurrentRow(0)
+        self.resultsList.itemActivated.connect(self.open_result)
+        self.layout().addWidget(self.resultsList)
+
+        buttonLayout = QtGui.QHBoxLayout()
+
+        # Add the "Open" button, as a confirmation, and the "Cancel" one
+        self.openButton = QtGui.QPushButton("&Open")
+        self.openButton.setEnabled(bool(self.hits))
+        self.openButton.clicked.connect(self.open_result)
+        self.cancelButton = QtGui.QPushButton("C&ancel")
+        self.cancelButton.clicked.connect(self.clean_reject)
+
+        buttonLayout.addStretch()
+        buttonLayout.addWidget(self.openButton)
+        buttonLayout.addWidget(self.cancelButton)
+        self.layout().addLayout(buttonLayout)
+
+        # Create a status bar
+        self.statusBar = QtGui.QStatusBar()
+        if not self.hits:
+            self.statusBar.showMessage("no post found")
+        self.layout().addWidget(self.statusBar)
+
+    def open_result(self):
+        """Store the selected post, and close"""
+        self.hit = self.hits[self.resultsList.currentRow()]
+        self.clean_accept()
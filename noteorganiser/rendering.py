@@ -0,0 +1,461 @@
+"""
+.. module:: rendering
+    :synopsys: Convert the notebooks to html pages
+
+Every post is converted on its own to an html fragment with pandoc, and stored
+in a :class:`FragmentCache`. The pages are then assembled from these fragments
+and the template, without calling pandoc again, whatever the selected tags.
+The way pandoc is run is left to a backend, see :mod:`backends`.
+
+Several notebooks can also be gathered in a single page, see
+:meth:`Renderer.convert_global`.
+"""
+from __future__ import unicode_literals
+import os
+import io
+import re
+import hashlib
+import logging
+from collections import OrderedDict as od
+import six
+
+import noteorganiser.text_processing as tp
+from .cache import FragmentCache
+from .backends import PypandocBackend
+
+# Raw html inserted between the posts converted together, and recovered
+# untouched in the output of pandoc
+FRAGMENT_SEPARATOR = '<!-- noteorganiser-fragment -->'
+# Separates the highlighting css from the body in the fragments template
+BODY_SEPARATOR = '<!-- noteorganiser-body -->'
+
+TEMPLATE_TOKEN = re.compile(
+    r'\$(?:(if|for)\(([\w-]+)\)|(else|endif|endfor)|([\w-]+))?\$')
+HEADER = re.compile(r'<h([1-3])((?: [^>]*)?) id="([^"]*)"([^>]*)>(.*?)</h\1>',
+                    re.DOTALL)
+FOOTNOTE_ID = re.compile(r'(id="|href="#)(fn\d+|fnref\d+|footnotes)"')
+
+
+def parse_template(template):
+    """
+    Parse a pandoc template into a tree of nodes
+
+    Only the subset of the syntax used by the templates of the application is
+    understood: variables, `$if(...)$`, `$else$`, `$for(...)$` and `$$`.
+    Strings are kept as is, variables are stored as ('var', name), and blocks
+    as [kind, name, children, alternative children].
+
+    """
+    root = []
+    stack = [(root, None)]
+    position = 0
+    for match in TEMPLATE_TOKEN.finditer(template):
+        stack[-1][0].append(template[position:match.start()])
+        position = match.end()
+        block, name, keyword, variable = match.groups()
+        if block:
+            node = [block, name, [], []]
+            stack[-1][0].append(node)
+            stack.append((node[2], node))
+        elif keyword == 'else':
+            node = stack[-1][1]
+            stack[-1] = (node[3], node)
+        elif keyword:
+            stack.pop()
+        elif variable:
+            stack[-1][0].append(('var', variable))
+        else:
+            stack[-1][0].append('$')
+    stack[-1][0].append(template[position:])
+    return root
+
+
+def render_template(nodes, variables):
+    """Fill a parsed template with the values of the variables"""
+    output = []
+    for node in nodes:
+        if isinstance(node, tuple):
+            value = variables.get(node[1]) or ''
+            if isinstance(value, list):
+                value = ''.join(value)
+            output.append(value)
+        elif isinstance(node, list):
+            kind, name, children, alternative = node
+            value = variables.get(name)
+            if kind == 'if':
+                output.append(render_template(
+                    children if value else alternative, variables))
+            else:
+                for item in value or []:
+                    scope = dict(variables)
+                    scope[name] = item
+                    output.append(render_template(children, scope))
+        else:
+            output.append(node)
+    return ''.join(output)
+
+
+def unique_header_ids(body):
+    """
+    Rename the duplicated ids of the headers
+
+    The fragments are converted separately, so two posts with the same title
+    can have the same identifier.
+    """
+    seen = set()
+
+    def rename(match):
+        level, before, identifier, after, content = match.groups()
+        new, index = identifier, 0
+        while new in seen:
+            index += 1
+            new = '%s-%i' % (identifier, index)
+        seen.add(new)
+        return '<h%s%s id="%s"%s>%s</h%s>' % (
+            level, before, new, after, content, level)
+
+    return HEADER.sub(rename, body)
+
+
+def has_footnotes(markdown):
+    """Whether a post may contain footnotes, to be converted alone"""
+    return any('[^' in line for line in markdown)
+
+
+def local_footnotes(fragment, prefix):
+    """
+    Prefix the ids of the footnotes of a post converted alone
+
+    pandoc numbers the notes of every post from 1, so the notes of several
+    posts in a page would share their ids. The notes, written after the end
+    of the article, are also moved inside it, to be hidden with the post when
+    the page is filtered.
+    """
+    fragment = FOOTNOTE_ID.sub(
+        lambda match: '%s%s-%s"' % (match.group(1), prefix, match.group(2)),
+        fragment)
+    head, end, notes = fragment.rpartition('</article>')
+    if end and notes.strip():
+        fragment = '%s%s\n%s' % (head, notes.strip(), end)
+    return fragment
+
+
+def table_of_contents(body):
+    """Create the nested list of the headers found in the html body"""
+    toc = []
+    # Levels of the currently opened lists
+    levels = []
+    for match in HEADER.finditer(body):
+        level = int(match.group(1))
+        if levels:
+            # Nothing can be less nested than the first list
+            level = max(level, levels[0])
+            if level <= levels[-1]:
+                toc.append('</li>')
+            while level < levels[-1]:
+                toc.append('</ul></li>')
+                levels.pop()
+        if not levels or level > levels[-1]:
+            toc.append('<ul>')
+            levels.append(level)
+        toc.append('<li><a href="#%s">%s</a>' % (
+            match.group(3), match.group(5)))
+    if levels:
+        toc.append('</li>')
+        toc.extend(['</ul></li>']*(len(levels)-1))
+        toc.append('</ul>')
+    return '\n'.join(toc)
+
+
+def style_version(*assets):
+    """Return the SHA sum of the files of the style of the pages"""
+    style = hashlib.sha1()
+    for asset in assets:
+        with io.open(asset, 'rb') as asset_file:
+            style.update(asset_file.read())
+    return style.hexdigest()
+
+
+def notebook_tag(path, root):
+    """
+    Return the tag of a notebook in a page gathering several notebooks
+
+    It is the path of the notebook relative to the root, without extension,
+    with the separators of the tags removed.
+    """
+    name = os.path.splitext(os.path.relpath(path, root))[0]
+    return name.replace(os.sep, '/').replace(',', ' ')
+
+
+def parse_tagged_notebook(notebook):
+    """
+    Return the markdown and tags of every post of a notebook
+
+    notebook : tuple
+        path of the notebook, and the tag added to all its posts
+
+    Defined at the level of the module, to be called in a process pool. The
+    syntax errors are raised as plain ValueError, which can be sent back from
+    the workers.
+    """
+    path, tag = notebook
+    # The notebook is streamed, so that only one post at a time is kept in
+    # memory, see :func:`noteorganiser.text_processing.stream_notebook`
+    try:
+        _, posts = tp.stream_notebook(path)
+        markdowns = [tp.post_to_markdown(post, (tag, )) for post in posts]
+    except ValueError as error:
+        raise ValueError('In %s: %s' % (tag, error))
+    # A single string per post is much faster to send back than its lines
+    return [(['\n'.join(text)], tags) for text, tags in markdowns]
+
+
+def parse_tagged_notebooks(notebooks, pool=None):
+    """
+    Parse the notebooks with :func:`parse_tagged_notebook`
+
+    They are parsed in the calling thread, unless a process pool is given.
+    The pool is owned by the caller, which should start it once, from the
+    main thread: forking the application from one of its worker threads
+    would copy the locks held by the others.
+    """
+    if pool is None:
+        return [parse_tagged_notebook(notebook) for notebook in notebooks]
+    return pool.map(parse_tagged_notebook, notebooks)
+
+
+class Renderer(object):
+    """
+    Produce html pages from notebooks
+
+    Parameters
+    ----------
+    template : str
+        path to the pandoc template of the pages
+    css : str
+        path to the style sheet
+    temp_root : str
+        folder where the markdown sent to pandoc is written, when the default
+        backend is used
+    fragments : FragmentCache
+        optional cache to share between renderers
+    backend : Backend
+        how to run pandoc, by default a new process for every call
+    max_notebooks : int
+        number of notebooks whose parsed content is kept, to only parse again
+        what changed
+    """
+
+    def __init__(self, template, css, temp_root, fragments=None,
+                 backend=None, max_notebooks=8):
+        with io.open(template, 'r', encoding='utf-8') as template_file:
+            self.template = parse_template(template_file.read())
+        self.fragments_template = os.path.join(
+            os.path.dirname(template), 'fragments.html')
+        self.css = css
+        if backend is None:
+            backend = PypandocBackend(
+                self.fragments_template, logging.getLogger(__name__),
+                temp_root)
+        self.backend = backend
+        if fragments is None:
+            fragments = FragmentCache()
+        self.fragments = fragments
+        # Parse state of the most recently converted notebooks
+        self.states = od()
+        self.max_notebooks = max_notebooks
+        # SHA sum, tag, markdowns and fragment keys of the posts of every
+        # notebook of the last global page
+        self.notebooks = {}
+        # Set the first time pandoc highlights some code
+        self.highlighting_css = ''
+
+    def convert(self, path, tags=(), use_TOC=False, css=None):
+        """
+        Convert a notebook to html, with entries corresponding to the tags
+
+        The style sheet of the renderer is linked, unless another one is given.
+
+        Returns
+        -------
+        html : string
+            content of the page
+        posts_tags : list
+            tags of every post in the page, in order of appearance
+        """
+        state = self.state(path)
+        title, _ = state.read(path)
+        posts = state.markdowns
+        index = state.tag_index
+        posts = [posts[post] for post in index.posts(index.select(tags))]
+
+        fragments = self.render_fragments(
+            [tp.title_to_markdown(title)]+[text for text, _ in posts])
+        body = [fragments[0], "<article class='row'>",
+                "<article class='col-sm-12 blog-main'>"]
+        body.extend(fragments[1:])
+        body.extend(["</article>", "</article>"])
+        html = self.assemble(title, '\n'.join(body), use_TOC, css)
+        return html, [post_tags for _, post_tags in posts]
+
+    def convert_global(self, title, notebooks, tags=(), use_TOC=False,
+                       pool=None):
+        """
+        Convert several notebooks to a single html page
+
+        The posts of all the notebooks follow each other, the tag of their
+        notebook added to their own, so that the page can be filtered by
+        notebook. Only the notebooks whose SHA sum changed since the previous
+        page are parsed again, usually a few of them, and only their new posts
+        are converted by pandoc.
+
+        Parameters
+        ----------
+        title : str
+            title of the page
+        notebooks : list
+            path, SHA sum and tag of every notebook, see :func:`notebook_tag`
+        pool : multiprocessing.Pool
+            optional pool of processes parsing the notebooks, see
+            :func:`parse_tagged_notebooks`
+
+        Returns
+        -------
+        html : string
+            content of the page
+        posts_tags : list
+            tags of every post in the page, in order of appearance
+        """
+        self.update_notebooks(notebooks, pool)
+        posts, keys = [], []
+        for path, _, _ in notebooks:
+            _, _, markdowns, fragment_keys = self.notebooks[path]
+            posts.extend(markdowns)
+            keys.extend(fragment_keys)
+        if tags:
+            index = tp.TagIndex([post_tags for _, post_tags in posts])
+            selected = index.posts(index.select(tags))
+            posts = [posts[post] for post in selected]
+            keys = [keys[post] for post in selected]
+
+        header = tp.title_to_markdown(title)
+        fragments = self.render_fragments(
+            [header]+[text for text, _ in posts],
+            [FragmentCache.key(header)]+keys)
+        body = [fragments[0], "<article class='row'>",
+                "<article class='col-sm-12 blog-main'>"]
+        body.extend(fragments[1:])
+        body.extend(["</article>", "</article>"])
+        html = self.assemble(title, '\n'.join(body), use_TOC)
+        return html, [post_tags for _, post_tags in posts]
+
+    def update_notebooks(self, notebooks, pool=None):
+        """Parse the changed notebooks, and forget the absent ones"""
+        entries, changed = {}, []
+        for path, sha, tag in notebooks:
+            entry = self.notebooks.get(path)
+            if entry is not None and entry[:2] == (sha, tag):
+                entries[path] = entry
+            else:
+                changed.append((path, sha, tag))
+        # On a syntax error, the previous entries are kept
+        parsed = parse_tagged_notebooks(
+            [(path, tag) for path, _, tag in changed], pool)
+        for (path, sha, tag), markdowns in zip(changed, parsed):
+            entries[path] = (
+                sha, tag, markdowns,
+                [FragmentCache.key(text) for text, _ in markdowns])
+        self.notebooks = entries
+
+    def state(self, path):
+        """Return the parse state of a notebook, the least recent evicted"""
+        state = self.states.pop(path, None)
+        if state is None:
+            state = tp.NotebookState()
+        self.states[path] = state
+        while len(self.states) > self.max_notebooks:
+            self.states.popitem(last=False)
+        return state
+
+    def assemble(self, title, body, use_TOC=False, css=None):
+        """Fill the template with the html body, and the style sheet"""
+        body = unique_header_ids(body)
+        variables = {
+            'pagetitle': tp.escape_html(title),
+            'css': [css or self.css],
+            'highlighting-css': self.highlighting_css,
+            'body': body}
+        if use_TOC:
+            variables['toc'] = table_of_contents(body)
+        return render_template(self.template, variables)
+
+    def render_fragments(self, markdowns, keys=None):
+        """
+        Return the html of every markdown text, from the cache when possible
+
+        All the missing fragments are converted with a single call to pandoc.
+        The keys of the texts in the cache can be given, when already known.
+        """
+        if keys is None:
+            keys = [FragmentCache.key(markdown) for markdown in markdowns]
+        html = {}
+        missing = od()
+        for key, markdown in zip(keys, markdowns):
+            fragment = self.fragments.get(key)
+            if fragment is not None:
+                html[key] = fragment
+            else:
+                missing[key] = markdown
+        if missing:
+            html.update(self.run_pandoc(missing))
+        return [html[key] for key in keys]
+
+    def run_pandoc(self, markdowns):
+        """
+        Convert markdown texts to html fragments, and store them in the cache
+
+        The texts are separated with raw html comments, so that they can be
+        converted together. Footnotes being gathered at the end of the
+        document by pandoc, the posts containing some are converted alone.
+        """
+        batches = [[]]
+        for key, markdown in six.iteritems(markdowns):
+            if has_footnotes(markdown):
+                batches.append([(key, markdown)])
+            else:
+                batches[0].append((key, markdown))
+
+        batches = [batch for batch in batches if batch]
+        texts = []
+        for batch in batches:
+            text = []
+            for _, markdown in batch:
+                text.extend(['', FRAGMENT_SEPARATOR, ''])
+                text.extend(markdown)
+            texts.append('\n'.join(text))
+
+        # All the batches are sent at once, for the backends that can process
+        # them together
+        html = {}
+        for batch, output in zip(batches, self.backend.convert(texts)):
+            fragments = self.split(output)
+            if len(fragments) != len(batch):
+                raise ValueError(
+                    "pandoc did not preserve the separation of the posts")
+            for (key, markdown), fragment in zip(batch, fragments):
+                if has_footnotes(markdown):
+                    fragment = local_footnotes(fragment, key[:8])
+                html[key] = fragment
+                self.fragments.store(key, fragment)
+        return html
+
+    def split(self, output):
+        """Split the output of pandoc into the fragments"""
+        # Convert the windows ending of lines to simple line breaks (\r\n to
+        # \n)
+        output = output.replace('\r\n', '\n')
+        css, body = output.split(BODY_SEPARATOR, 1)
+        if css.strip():
+            self.highlighting_css = css.strip()
+        return [fragment.strip()
+                for fragment in body.split(FRAGMENT_SEPARATOR)[1:]]
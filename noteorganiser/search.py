@@ -0,0 +1,350 @@
+"""
+.. module:: search
+    :synopsys: Full-text search engine across the notebooks
+
+Every post of every notebook under the main folder is a document, made of the
+words of its title and body. The documents having a word are listed in an
+inverted index, and the documents matching a query are ranked with BM25, so
+that a query only reads the lists of its words.
+
+"""
+from __future__ import unicode_literals
+import os
+import io
+import re
+import json
+import math
+import heapq
+import hashlib
+import threading
+from collections import Counter, namedtuple
+
+import noteorganiser.text_processing as tp
+from .constants import EXTENSION
+from .index import INDEX_FOLDER, write_atomically
+
+# Increased whenever the content of the index changes
+VERSION = 1
+WORD = re.compile(r'\w+', re.UNICODE)
+# Parameters of BM25: saturation of the frequency of a word, and importance
+# of the length of the document
+K1 = 1.2
+B = 0.75
+# Every word of the title counts as many times as this
+TITLE_WEIGHT = 2
+
+# Result of a search: the body of the post starts at the line of the notebook
+Hit = namedtuple('Hit', ['score', 'path', 'title', 'line'])
+
+
+def tokenize(text):
+    """Return the lower case words of the text"""
+    return WORD.findall(text.lower())
+
+
+class SearchEngine(object):
+    """
+    Inverted index of the words of the posts of all the notebooks
+
+    The words of the posts of each notebook are stored in a file of
+    `root/.noteorganiser/search`, so that indexing a modified notebook only
+    writes its own file. The stored index is read, and the notebooks modified
+    since checked with a single stat, the first time the engine is refreshed,
+    see :meth:`refresh`. Afterwards, only the notebooks and folders reported
+    as changed are read again, see :meth:`notify` and :meth:`update`.
+
+    """
+    def __init__(self, root, log):
+        self.root = root
+        self.log = log
+        self.folder = os.path.join(root, INDEX_FOLDER, 'search')
+        # The index is built, and searched, from other threads
+        self.lock = threading.RLock()
+        self.loaded = False
+        # Changes reported since the last update: the notebooks to check, and
+        # all the notebooks under every changed folder
+        self.pending_notebooks = set()
+        self.pending_folders = {}
+        self.clear()
+
+    def clear(self):
+        # Size, modification time and documents of every notebook, by path
+        # relative to the root
+        self.notebooks = {}
+        # Notebook, title, first line of the body and word counts of every
+        # document
+        self.documents = {}
+        self.next_id = 0
+        # Documents having each word, with the number of occurrences
+        self.postings = {}
+        self.lengths = {}
+        self.total_length = 0
+        # Length normalization of every document, for the current average
+        self.norms = {}
+        self.norms_key = None
+
+    def path(self, key):
+        """File storing the words of the posts of a notebook"""
+        digest = hashlib.sha1(key.encode('utf-8')).hexdigest()
+        return os.path.join(self.folder, '%s.json' % digest[:16])
+
+    def load(self):
+        """Read the stored notebooks, ignoring the unusable ones"""
+        self.loaded = True
+        if not os.path.isdir(self.folder):
+            return
+        for name in os.listdir(self.folder):
+            if not name.endswith('.json'):
+                continue
+            try:
+                with io.open(os.path.join(self.folder, name), 'rb') as stored:
+                    data = json.loads(stored.read().decode('utf-8'))
+                if data['version'] != VERSION:
+                    continue
+                with self.lock:
+                    self.add_notebook(data['key'], data['size'],
+                                      data['mtime'], data['posts'])
+            except (IOError, OSError, ValueError, KeyError, TypeError):
+                continue
+
+    def save(self, key, size, mtime, posts):
+        """Write the words of the posts of a notebook, atomically"""
+        data = json.dumps({'version': VERSION, 'key': key, 'size': size,
+                           'mtime': mtime, 'posts': posts})
+        try:
+            write_atomically(self.path(key), data)
+        except (IOError, OSError) as error:
+            # The index only saves time, the search works without it
+            self.log.warning("The index of %s could not be written: %s" % (
+                key, error))
+
+    def refresh(self):
+        """
+        Index the notebooks created or modified since the last call
+
+        The whole library is walked, which takes a while: after the first
+        call, prefer :meth:`update`.
+
+        Returns
+        -------
+        changed : bool
+            whether the index changed
+        """
+        if not self.loaded:
+            self.load()
+        with self.lock:
+            self.pending_notebooks.clear()
+            self.pending_folders.clear()
+        found = set()
+        changed = False
+        for folder, folders, files in os.walk(self.root):
+            # Hidden folders, like the one of the index, are skipped
+            folders[:] = [name for name in folders if not name.startswith('.')]
+            for name in files:
+                if not name.endswith(EXTENSION):
+                    continue
+                key = os.path.relpath(os.path.join(folder, name), self.root)
+                found.add(key)
+                changed = self.check(key) or changed
+        with self.lock:
+            removed = set(self.notebooks)-found
+        for key in removed:
+            self.remove(key)
+        return changed or bool(removed)
+
+    def notify(self, notebooks=(), folders=None):
+        """
+        Remember the changes of the library, indexed by the next :meth:`update`
+
+        Parameters
+        ----------
+        notebooks : list
+            paths of the notebooks modified, created or removed
+        folders : dict
+            paths of all the notebooks under every changed folder, as listed
+            by the :class:`LibraryTree`
+        """
+        with self.lock:
+            self.pending_notebooks.update(
+                os.path.relpath(path, self.root) for path in notebooks)
+            for folder, paths in (folders or {}).items():
+                self.pending_folders[os.path.relpath(folder, self.root)] = \
+                    set(os.path.relpath(path, self.root) for path in paths)
+
+    def update(self):
+        """
+        Index the changes reported by :meth:`notify`
+
+        Only the reported notebooks are checked, with the notebooks directly
+        in the changed folders, and the ones new to the index. The first call
+        builds the whole index with :meth:`refresh`.
+
+        Returns
+        -------
+        changed : bool
+            whether the index changed
+        """
+        if not self.loaded:
+            return self.refresh()
+        with self.lock:
+            keys = self.pending_notebooks
+            folders = self.pending_folders
+            self.pending_notebooks, self.pending_folders = set(), {}
+            known = set(self.notebooks)
+        removed = set()
+        for folder, found in folders.items():
+            if folder == os.curdir:
+                removed.update(known-found)
+                inside = [key for key in found if os.sep not in key]
+            else:
+                prefix = os.path.join(folder, '')
+                removed.update(key for key in known-found
+                               if key.startswith(prefix))
+                inside = [key for key in found
+                          if os.path.dirname(key) == folder]
+            keys.update(inside)
+            keys.update(found-known)
+        changed = False
+        for key in removed:
+            self.remove(key)
+            changed = True
+        for key in keys-removed:
+            changed = self.check(key) or changed
+        return changed
+
+    def check(self, key):
+        """Index the notebook again if it changed, or forget it if removed"""
+        try:
+            stat = os.stat(os.path.join(self.root, key))
+        except OSError:
+            with self.lock:
+                known = key in self.notebooks
+            if known:
+                self.remove(key)
+            return known
+        with self.lock:
+            entry = self.notebooks.get(key)
+            if entry is not None and entry['size'] == stat.st_size \
+                    and entry['mtime'] == stat.st_mtime:
+                return False
+        self.index_notebook(key, stat)
+        return True
+
+    def remove(self, key):
+        """Forget a notebook removed from the library, and its stored words"""
+        with self.lock:
+            self.forget(key)
+        try:
+            os.remove(self.path(key))
+        except OSError:
+            pass
+
+    def index_notebook(self, key, stat):
+        """Replace the documents of a notebook by its current posts"""
+        path = os.path.join(self.root, key)
+        try:
+            with io.open(path, 'r', encoding='utf-8',
+                         errors='replace') as notebook:
+                _, posts = tp.parse_posts(notebook.readlines())
+        except (IOError, OSError, ValueError) as error:
+            # The notebook is indexed again once it is modified
+            self.log.warning("%s could not be indexed: %s" % (path, error))
+            posts = []
+        documents = []
+        for post in posts:
+            counts = Counter(tokenize(' '.join(post.body)))
+            for word in tokenize(post.title):
+                counts[word] += TITLE_WEIGHT
+            documents.append([post.title, post.start, dict(counts)])
+        with self.lock:
+            self.forget(key)
+            self.add_notebook(key, stat.st_size, stat.st_mtime, documents)
+        self.save(key, stat.st_size, stat.st_mtime, documents)
+
+    def add_notebook(self, key, size, mtime, documents):
+        """Add the documents of a notebook, as title, line and word counts"""
+        ids = []
+        for title, line, counts in documents:
+            doc_id = self.next_id
+            self.next_id += 1
+            self.documents[doc_id] = (key, title, line, counts)
+            for word, count in counts.items():
+                postings = self.postings.get(word)
+                if postings is None:
+                    self.postings[word] = {doc_id: count}
+                else:
+                    postings[doc_id] = count
+            length = sum(counts.values())
+            self.lengths[doc_id] = length
+            self.total_length += length
+            ids.append(doc_id)
+        self.notebooks[key] = {'size': size, 'mtime': mtime, 'posts': ids}
+
+    def forget(self, key):
+        """Remove the documents of a notebook"""
+        entry = self.notebooks.pop(key, None)
+        if entry is None:
+            return
+        for doc_id in entry['posts']:
+            _, _, _, counts = self.documents.pop(doc_id)
+            for word in counts:
+                postings = self.postings[word]
+                del postings[doc_id]
+                if not postings:
+                    del self.postings[word]
+            self.total_length -= self.lengths.pop(doc_id)
+
+    def search(self, query, limit=20, refresh=True):
+        """
+        Return the posts best matching the query, with BM25
+
+        Parameters
+        ----------
+        query : str
+            words to look for, in any order
+        limit : int
+            maximum number of results
+        refresh : bool
+            whether to walk the library first, to index the modified
+            notebooks, see :meth:`refresh`
+
+        Returns
+        -------
+        hits : list
+            the :class:`Hit` of the best posts, best first
+        """
+        if refresh:
+            self.refresh()
+        with self.lock:
+            count = len(self.documents)
+            if not count:
+                return []
+            # The normalization only changes with the documents
+            if self.norms_key != (count, self.total_length):
+                average = float(self.total_length)/count
+                self.norms = dict(
+                    (doc_id, K1*(1-B+B*length/average))
+                    for doc_id, length in self.lengths.items())
+                self.norms_key = (count, self.total_length)
+            norms = self.norms
+            scores = {}
+            get = scores.get
+            for word in set(tokenize(query)):
+                postings = self.postings.get(word)
+                if not postings:
+                    continue
+                weight = (K1+1)*math.log(
+                    1+(count-len(postings)+0.5)/(len(postings)+0.5))
+                for doc_id, frequency in postings.items():
+                    scores[doc_id] = get(doc_id, 0.)+weight*frequency/(
+                        frequency+norms[doc_id])
+            best = heapq.nlargest(limit, scores.items(),
+                                  key=lambda item: item[1])
+            hits = []
+            for doc_id, score in best:
+                key, title, line, _ = self.documents[doc_id]
+                hits.append(Hit(score, os.path.join(self.root, key), title,
+                                line))
+        # The ties do not depend on the order of indexing
+        hits.sort(key=lambda hit: (-hit.score, hit.path, hit.line))
+        return hits
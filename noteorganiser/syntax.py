@@ -1,127 +1,158 @@
+"""
+.. module:: syntax
+    :synopsys: Highlight the markdown of the notebooks in the editor
+
+"""
 from __future__ import unicode_literals
+import re
+
 import PySide.QtGui as QtGui
 import PySide.QtCore as QtCore
 
+# States of the blocks, as bits: the next line is in a code block, or the
+# line is some text, possibly underlined as a main title or as a section
+CODE = 1
+TEXT = 2
+MAIN_TITLE = 4
+SECTION = 8
+UNDERLINED = MAIN_TITLE | SECTION
+
+TAGS = re.compile(r'#\s?\w(?:[-\w .]*\w)?(?:,\s*\w(?:[-\w .]*\w)?)*$',
+                  re.UNICODE)
+# The rules within a line, looked for in a single pass
+INLINE = re.compile(
+    r'(?P<date>\*\d{1,2}/\d{2}/\d{4}\*)'
+    r'|(?P<bold>\*\*[^\n^*]+\*\*)'
+    r'|(?P<italics>\*[^\n^*]+\*)'
+    r'|(?P<code>`[^\n^`]+`)', re.UNICODE)
+CODE_START = re.compile(r'~~~(\s.*)?$', re.UNICODE)
+CODE_END = '~~~'
+UNDERLINES = ((re.compile(r'={2,}$'), MAIN_TITLE),
+              (re.compile(r'-{2,}$'), SECTION))
+
+
+def underline(text):
+    """Return MAIN_TITLE or SECTION if the line is an underline, else 0"""
+    for expression, level in UNDERLINES:
+        if expression.match(text):
+            return level
+    return 0
+
 
 class ModifiedMarkdownHighlighter(QtGui.QSyntaxHighlighter):
+    """
+    Highlight the markdown of a notebook, block by block
+
+    The state of every block tells whether it opens or continues a code
+    block, and whether it is a line of text, underlined by the next one. Qt
+    only highlights again the following blocks while their state changes, so
+    that typing in a post does not go through the rest of the notebook. When
+    an underline is added or removed below a title, the title alone is
+    highlighted again, see :meth:`rehighlightPending`.
+    """
 
     def __init__(self, parent=None):
         QtGui.QSyntaxHighlighter.__init__(self, parent)
 
-        # Initialise the highlighting rules
-        self.highlightingRules = []
-        self.underliningRules = []
-
-        # Date rules
         dateFormat = QtGui.QTextCharFormat()
         dateFormat.setForeground(QtCore.Qt.darkGray)
-        self.highlightingRules.append(
-            (QtCore.QRegExp("\*{1,1}(\\d{1,2}/\\d{2,2}/\\d{4,4}\*{1,1}"),
-             dateFormat))
 
-        # Italics rules
         italicsFormat = QtGui.QTextCharFormat()
         italicsFormat.setFontItalic(True)
         italicsFormat.setForeground(QtCore.Qt.darkGreen)
-        self.highlightingRules.append(
-            (QtCore.QRegExp("\*{1,1}([^\n^\*]+)\*{1,1}"), italicsFormat))
 
-        # Bold rules
         boldFormat = QtGui.QTextCharFormat()
         boldFormat.setForeground(QtCore.Qt.darkBlue)
         boldFormat.setFontWeight(QtGui.QFont.Bold)
-        self.highlightingRules.append(
-            (QtCore.QRegExp("\*{2,2}([^\n^\*]+)\*{2,2}"), boldFormat))
 
-        # Code rules
         self.codeFormat = QtGui.QTextCharFormat()
         self.codeFormat.setForeground(QtCore.Qt.darkBlue)
-        self.highlightingRules.append(
-            (QtCore.QRegExp("`{1,1}([^\n^`]+)`{1,1}"), self.codeFormat))
-
-        # Tags
-        tagFormat = QtGui.QTextCharFormat()
-        tagFormat.setForeground(QtCore.Qt.darkRed)
-        self.highlightingRules.append(
-            (QtCore.QRegExp(
-                "^#\s?((\w(?:[-\w .]*\w)?)+)(,\s*(\w(?:[-\w .]*\w)?)+)*$"),
-                tagFormat))
-
-        # Code blocks (several lines)
-        self.blockStartExpression = QtCore.QRegExp("^~~~(\s.*)?$")
-        self.blockEndExpression = QtCore.QRegExp("^~~~$")
-
-        # Main title rule
-        self.mainTitleUnderlineExpression = QtCore.QRegExp("^={2,}$")
+
+        self.tagFormat = QtGui.QTextCharFormat()
+        self.tagFormat.setForeground(QtCore.Qt.darkRed)
+
+        # Formats of the groups of INLINE
+        self.inlineFormats = {'date': dateFormat, 'bold': boldFormat,
+                              'italics': italicsFormat,
+                              'code': self.codeFormat}
+
         mainTitleFormat = QtGui.QTextCharFormat()
         mainTitleFormat.setForeground(QtCore.Qt.darkGreen)
-        # Sections rule
-        self.sectionUnderlineExpression = QtCore.QRegExp("^-{2,}$")
         sectionFormat = QtGui.QTextCharFormat()
         sectionFormat.setForeground(QtCore.Qt.darkBlue)
-        self.underliningRules.extend(
-            [(self.mainTitleUnderlineExpression, mainTitleFormat),
-             (self.sectionUnderlineExpression, sectionFormat)])
+        self.underlineFormats = {MAIN_TITLE: mainTitleFormat,
+                                 SECTION: sectionFormat}
+
+        # Numbers of the blocks to highlight again, once the current
+        # highlighting is done
+        self.pending = set()
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(0)
+        self.timer.timeout.connect(self.rehighlightPending)
 
     def highlightBlock(self, text):
-        # Deal first with simple expressions (one line)
+        previous = max(self.previousBlockState(), 0)
+        if previous & CODE:
+            self.setFormat(0, len(text), self.codeFormat)
+            self.setCurrentBlockState(0 if text == CODE_END else CODE)
+            return
+
+        if CODE_START.match(text):
+            self.checkTitle(previous, 0)
+            self.setFormat(0, len(text), self.codeFormat)
+            self.setCurrentBlockState(CODE)
+            return
+
+        level = underline(text)
+        if level and previous & TEXT:
+            self.checkTitle(previous, level)
+            self.setFormat(0, len(text), self.underlineFormats[level])
+            self.setCurrentBlockState(0)
+            return
+        self.checkTitle(previous, 0)
+
+        if TAGS.match(text):
+            self.setFormat(0, len(text), self.tagFormat)
+            self.setCurrentBlockState(0)
+            return
+
         # Note: the _format syntax is there to avoid naming conflict with the
         # restricted word `format`.
-        for pattern, _format in self.highlightingRules:
-            expression = QtCore.QRegExp(pattern)
-            index = expression.indexIn(text)
-            while index >= 0:
-                length = expression.matchedLength()
-                self.setFormat(index, length, _format)
-                index = expression.indexIn(text, index + length)
-
-        # Deal with block type highlighting
-        self.setCurrentBlockState(0)
-        startIndex = 0
-        if self.previousBlockState() != 1:
-            startIndex = self.blockStartExpression.indexIn(text)
-
-        while startIndex >= 0:
-            endIndex = self.blockEndExpression.indexIn(
-                text, startIndex)
-
-            if endIndex == -1:
-                self.setCurrentBlockState(1)
-                blockLength = len(text) - startIndex
-            elif endIndex == 0:
-                # This is a symmetric code block
-                if self.previousBlockState() == 0:
-                    self.setCurrentBlockState(1)
-                blockLength = len(text) - startIndex
-            else:
-                blockLength = endIndex - startIndex + \
-                    self.blockEndExpression.matchedLength()
-
-            self.setFormat(startIndex, blockLength,
-                           self.codeFormat)
-            startIndex = self.blockStartExpression.indexIn(
-                text, startIndex + blockLength)
-
-        # Match the underlines
-        if startIndex == -1:  # If outside of a block
-            if self.previousBlockState() != 2:
-                for pattern, _format in self.underliningRules:
-                    expression = QtCore.QRegExp(pattern)
-                    # Match the next line for underlines
-                    index = expression.indexIn(
-                        self.currentBlock().next().text())
-                    if index >= 0:
-                        length = expression.matchedLength()
-                        self.setFormat(index, length, _format)
-                        index = expression.indexIn(text, index + length)
-                        self.setCurrentBlockState(2)
-            # If the title has already been highlighted, the state is '2'
-            else:
-                for pattern, _format in self.underliningRules:
-                    expression = QtCore.QRegExp(pattern)
-                    # Match the next line for underlines
-                    index = expression.indexIn(text)
-                    if index >= 0:
-                        length = expression.matchedLength()
-                        self.setFormat(index, length, _format)
-                        index = expression.indexIn(text, index + length)
+        for match in INLINE.finditer(text):
+            _format = self.inlineFormats[match.lastgroup]
+            self.setFormat(match.start(), match.end()-match.start(), _format)
+
+        state = 0
+        if text.strip():
+            state = TEXT
+            # Reading the next line does not depend on its highlighting
+            level = underline(self.currentBlock().next().text())
+            if level:
+                self.setFormat(0, len(text), self.underlineFormats[level])
+                state |= level
+        self.setCurrentBlockState(state)
+
+    def checkTitle(self, previous, level):
+        """
+        Highlight the previous block again, if it assumed another underline
+
+        Parameters
+        ----------
+        previous : int
+            state of the previous block
+        level : int
+            underline of the current block, if it underlines the previous one
+        """
+        if previous & TEXT and (previous & UNDERLINED) != level:
+            self.pending.add(self.currentBlock().blockNumber()-1)
+            self.timer.start()
+
+    def rehighlightPending(self):
+        """Highlight again the titles whose underline changed"""
+        numbers, self.pending = sorted(self.pending), set()
+        document = self.document()
+        for number in numbers:
+            block = document.findBlockByNumber(number)
+            if block.isValid():
+                self.rehighlightBlock(block)
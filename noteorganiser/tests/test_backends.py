@@ -0,0 +1,64 @@
+"""tests for the ways of running pandoc"""
+from __future__ import unicode_literals
+import os
+import pytest
+import pypandoc
+
+from ..backends import PypandocBackend, ServerBackend, FallbackBackend
+from ..backends import ServerError, SERVERS
+from ..logger import create_logger
+
+TEMPLATE = os.path.abspath(os.path.join(
+    os.path.dirname(__file__), '..', 'assets', 'style', 'fragments.html'))
+TEXTS = ['# First\n\nSome *text*', '```python\nprint(1)\n```']
+
+
+def test_pypandoc(tmpdir):
+    log = create_logger('CRITICAL', 'stream')
+    backend = PypandocBackend(TEMPLATE, log, str(tmpdir))
+    outputs = backend.convert(TEXTS)
+    assert len(outputs) == 2
+    assert '<em>text</em>' in outputs[0]
+    assert backend.calls == 1 and backend.documents == 2
+    # The temporary files are removed
+    assert not tmpdir.listdir()
+
+
+def test_server(tmpdir):
+    log = create_logger('CRITICAL', 'stream')
+    server = ServerBackend(TEMPLATE, log)
+    try:
+        outputs = server.convert(TEXTS)
+    except ServerError:
+        pytest.skip("pandoc does not support the server mode")
+    # The server is kept running between the calls
+    process = server.process
+    assert server.convert(TEXTS) == outputs
+    assert server.process is process
+    # Only the running servers are kept, to be stopped at exit
+    assert server in SERVERS
+    server.close()
+    assert server.process is None
+    assert server not in SERVERS
+
+    reference = PypandocBackend(TEMPLATE, log, str(tmpdir)).convert(TEXTS)
+    assert [output.strip() for output in outputs] == \
+        [output.strip() for output in reference]
+
+
+def test_fallback(tmpdir, mocker):
+    log = create_logger('CRITICAL', 'stream')
+    backend = FallbackBackend(TEMPLATE, log, str(tmpdir))
+    mocker.patch.object(pypandoc, 'get_pandoc_path',
+                        return_value=str(tmpdir.join('missing-pandoc')),
+                        create=True)
+    convert = mocker.spy(pypandoc, 'convert')
+
+    outputs = backend.convert(TEXTS)
+    assert len(outputs) == 2
+    assert convert.call_count == 2
+    # The server is not tried again
+    assert backend.current is backend.pypandoc
+    backend.convert(TEXTS[:1])
+    assert convert.call_count == 3
+    assert backend.pypandoc.documents == 3
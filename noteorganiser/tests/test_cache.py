@@ -0,0 +1,51 @@
+"""tests for the caches"""
+from __future__ import unicode_literals
+import os
+import io
+
+from ..cache import HTMLCache
+
+
+def write_page(url):
+    with io.open(url, 'w', encoding='utf-8') as page:
+        page.write('<html></html>')
+
+
+def test_html_cache(tmpdir):
+    root = str(tmpdir)
+    # Pages left by a previous session are removed
+    write_page(os.path.join(root, 'old.html'))
+    cache = HTMLCache(root, max_entries=2)
+    assert not os.listdir(root)
+
+    notebook = os.path.join(root, 'toto.md')
+    options = (('tag',), False, 'style')
+    assert cache.get(notebook, 'sha1', options) is None
+
+    url = cache.url(notebook, 'sha1', options)
+    write_page(url)
+    cache.store(notebook, 'sha1', options, url, {'tag': 1})
+    assert cache.get(notebook, 'sha1', options) == (url, {'tag': 1})
+    # Different options should give a different page
+    assert cache.url(notebook, 'sha1', ((), False, 'style')) != url
+
+    # A new version of the notebook removes the stale page
+    new_url = cache.url(notebook, 'sha2', options)
+    write_page(new_url)
+    cache.store(notebook, 'sha2', options, new_url, {'tag': 1})
+    assert cache.get(notebook, 'sha1', options) is None
+    assert not os.path.isfile(url)
+
+    # Least recently used pages are evicted when the cache is full
+    other = os.path.join(root, 'other.md')
+    for index in range(2):
+        other_url = cache.url(other, 'sha', (index, ))
+        write_page(other_url)
+        cache.store(other, 'sha', (index, ), other_url, {})
+    assert cache.get(notebook, 'sha2', options) is None
+    assert not os.path.isfile(new_url)
+    assert len(os.listdir(root)) == 2
+
+    # A page removed from the disk is not returned
+    os.remove(other_url)
+    assert cache.get(other, 'sha', (1, )) is None
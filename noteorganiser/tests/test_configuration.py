@@ -0,0 +1,60 @@
+"""tests for the configuration"""
+from __future__ import unicode_literals
+import os
+
+from .. import configuration as conf
+from ..logger import create_logger
+
+
+def test_library_tree(tmpdir, mocker):
+    log = create_logger('CRITICAL', 'stream')
+    tmpdir.join('first.md').write('')
+    tmpdir.mkdir('empty')
+    tmpdir.mkdir('.hidden').join('hidden.md').write('')
+    tmpdir.mkdir('deep').mkdir('inner').join('second.md').write('')
+    root = str(tmpdir)
+
+    tree = conf.LibraryTree(log)
+    notebooks, folders = tree.listing(root)
+    assert notebooks == ['first.md']
+    assert sorted(folders) == [os.path.join(root, 'deep'),
+                               os.path.join(root, 'empty')]
+    # A folder containing only a non-empty folder is not empty
+    notebooks, folders = conf.search_folder_recursively(log, root, False, tree)
+    assert folders == [os.path.join(root, 'deep')]
+    # Same result as without the cache
+    assert (notebooks, folders) == conf.search_folder_recursively(
+        log, root, False)
+
+    # Browsing again does not read the unchanged folders
+    scan = mocker.spy(conf, 'list_folder')
+    tree.listing(os.path.join(root, 'deep'))
+    tree.listing(root, False)
+    assert scan.call_count == 0
+
+    # Only the modified folder is read again, and its parents updated
+    tmpdir.join('empty').join('third.md').write('')
+    notebooks, folders = tree.listing(root, False)
+    assert sorted(folders) == [os.path.join(root, 'deep'),
+                               os.path.join(root, 'empty')]
+    assert scan.call_count == 1
+    tmpdir.join('deep', 'inner', 'second.md').remove()
+    assert tree.listing(os.path.join(root, 'deep'), False) == ([], [])
+    assert tree.is_empty(os.path.join(root, 'deep'))
+    assert tree.listing(root, False)[1] == [os.path.join(root, 'empty')]
+
+
+def test_library_notebooks(tmpdir):
+    log = create_logger('CRITICAL', 'stream')
+    tmpdir.join('b.md').write('')
+    tmpdir.join('a.md').write('')
+    tmpdir.mkdir('empty')
+    tmpdir.mkdir('.hidden').join('hidden.md').write('')
+    tmpdir.mkdir('deep').mkdir('inner').join('c.md').write('')
+    root = str(tmpdir)
+
+    tree = conf.LibraryTree(log)
+    assert tree.notebooks(root) == [os.path.join(root, 'a.md'),
+                                    os.path.join(root, 'b.md')]
+    assert tree.notebooks(root, recursive=True)[2:] == [
+        os.path.join(root, 'deep', 'inner', 'c.md')]
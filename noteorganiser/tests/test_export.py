@@ -0,0 +1,74 @@
+"""tests for the export to a static website"""
+from __future__ import unicode_literals
+import os
+import shutil
+import pypandoc
+
+from .. import export
+
+
+def create_library(tmpdir):
+    """Copy the example twice at the root, and once in a sub-folder"""
+    root = tmpdir.mkdir('library')
+    example = os.path.join(os.getcwd(), 'example', 'example.md')
+    shutil.copy(example, str(root))
+    shutil.copyfile(example, str(root.join('second.md')))
+    shutil.copy(example, str(root.mkdir('toto')))
+    return root
+
+
+def test_export(tmpdir, mocker):
+    root = create_library(tmpdir)
+    output = tmpdir.join('site')
+    options = {'jobs': 1, 'with_tags': True, 'use_server': False}
+    converted, failed = export.export(str(root), str(output), **options)
+    assert converted == ['example', 'second', 'toto/example']
+    assert not failed
+    assert output.join('toto', 'example.tags', 'layout.html').check()
+    assert 'href="../bootstrap.css"' in output.join(
+        'toto', 'example.html').read()
+    assert 'href="toto/example.tags/layout.html"' in output.join(
+        'index.html').read()
+
+    # The unchanged notebooks are skipped
+    convert = mocker.spy(pypandoc, 'convert')
+    assert export.export(str(root), str(output), **options) == ([], {})
+    assert convert.call_count == 0
+
+    # Only the modified notebook is converted, and the pages of the removed
+    # one are deleted
+    with open(str(root.join('second.md')), 'a') as notebook:
+        notebook.write('\nNew\n---\n# fresh\n*01/01/2015*\nText\n')
+    root.join('toto', 'example.md').remove()
+    converted, _ = export.export(str(root), str(output), **options)
+    assert converted == ['second']
+    assert output.join('second.tags', 'fresh.html').check()
+    assert not output.join('toto').check()
+
+    # A broken notebook is reported, and its previous pages kept
+    with open(str(root.join('second.md')), 'a') as notebook:
+        notebook.write('\nBad\n---\n#  ,\n*01/01/2015*\ntext\n')
+    assert export.main([str(root), str(output), '-j', '1', '--tags',
+                        '--no-server']) == 1
+    assert output.join('second.tags', 'fresh.html').check()
+
+
+def test_export_collisions(tmpdir):
+    root = create_library(tmpdir)
+    # The index page is reserved, and the tags of the same slug both kept
+    root.join('second.md').move(root.join('index.md'))
+    root.join('tags.md').write(
+        'Tags\n====\n\nA\n---\n# C++, C#, a b, a-b\n*01/01/2015*\nText\n')
+    output = tmpdir.join('site')
+    converted, failed = export.export(
+        str(root), str(output), jobs=2, with_tags=True, use_server=False)
+    assert converted == ['example', 'index', 'tags', 'toto/example']
+    assert not failed
+    assert output.join('index-2.html').check()
+    assert output.join('index-2.tags', 'layout.html').check()
+    assert "Tags" in output.join('tags.html').read()
+    index = output.join('index.html').read()
+    assert 'href="index-2.html"' in index
+    for page in ('c-', 'c--2', 'a-b', 'a-b-2'):
+        assert 'href="tags.tags/%s.html"' % page in index
+        assert output.join('tags.tags', '%s.html' % page).check()
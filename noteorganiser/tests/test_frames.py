@@ -4,6 +4,7 @@ import datetime
 from PySide import QtGui
 from PySide import QtCore
 import pytest
+import pypandoc
 
 # Frames to test
 from ..frames import CustomFrame
@@ -14,7 +15,6 @@ from ..frames import Editing
 from ..frames import Preview
 from .custom_fixtures import parent
 
-from ..widgets import PicButton
 from ..constants import EXTENSION
 
 
@@ -66,16 +66,23 @@ def test_shelves(qtbot, parent, mocker):
     shelves = library.shelves
     qtbot.addWidget(shelves)
 
-    # Checking if the buttons list was created, and that it contains only two
-    # elements (the notebook, and the folder)
-    assert hasattr(shelves, 'buttons'), 'buttons attribute not created'
-    assert len(shelves.buttons) == 3, 'not all buttons were created'
-    for button in shelves.buttons:
-        assert isinstance(button, PicButton)
-    # Asserting that left clicking on the notebook icon (first element of the
-    # buttons attribute) sends the proper signal.
+    # Checking if the items were created: the two notebooks, and the folder
+    assert shelves.model.rowCount() == 3, 'not all items were created'
+    assert [kind for kind, _, _ in shelves.model.items] == [
+        'notebook', 'notebook', 'folder']
+
+    def click(row, button=QtCore.Qt.LeftButton,
+              modifier=QtCore.Qt.NoModifier):
+        """Click on the item of the shelves at the row"""
+        shelves.view.doItemsLayout()
+        rect = shelves.view.visualRect(shelves.model.index(row))
+        qtbot.mouseClick(shelves.view.viewport(), button, modifier,
+                         rect.center())
+
+    # Asserting that left clicking on the notebook icon (first item) sends the
+    # proper signal.
     with qtbot.waitSignal(shelves.switchTabSignal, timeout=1000) as switch:
-        qtbot.mouseClick(shelves.buttons[0], QtCore.Qt.LeftButton)
+        click(0)
     assert switch.signal_triggered, \
         "clicking on a notebook should trigger a switchTabSignal"
 
@@ -86,7 +93,7 @@ def test_shelves(qtbot, parent, mocker):
 
     # Checking the behaviour when clicking on a folder
     with qtbot.waitSignal(shelves.refreshSignal, timeout=1000) as way_down:
-        qtbot.mouseClick(shelves.buttons[2], QtCore.Qt.LeftButton)
+        click(2)
         # Check that the info.level has changed properly
         assert shelves.info.level != shelves.info.root, "did not change dir"
         # Check that now, the upButton is enabled
@@ -109,7 +116,7 @@ def test_shelves(qtbot, parent, mocker):
 
     # Test right click on the notebook. It should **not** trigger a switch tab
     with qtbot.waitSignal(shelves.refreshSignal, timeout=100) as right:
-        qtbot.mouseClick(shelves.buttons[0], QtCore.Qt.RightButton)
+        click(0, QtCore.Qt.RightButton)
     assert not right.signal_triggered
 
     # Test right click, should open the menu TODO
@@ -120,7 +127,7 @@ def test_shelves(qtbot, parent, mocker):
                                    return_value=QtGui.QMessageBox.No)
     shelves.removeNotebook('example')
     # Check that nothing happened
-    assert len(shelves.buttons) == 3, \
+    assert shelves.model.rowCount() == 3, \
         "Saying no to the question did not stop the removal"
 
     with qtbot.waitSignal(shelves.refreshSignal, timeout=2000) as remove:
@@ -129,7 +136,7 @@ def test_shelves(qtbot, parent, mocker):
         shelves.removeNotebook('example')
     assert remove.signal_triggered
     # Check that the file was indeed removed
-    assert len(shelves.buttons) == 2, \
+    assert shelves.model.rowCount() == 2, \
         "Saying yes to the question did not remove the notebook"
 
     # Adding a notebook
@@ -146,7 +153,7 @@ def test_shelves(qtbot, parent, mocker):
             library.toolbar.widgetForAction(library.newNotebookAction),
             QtCore.Qt.LeftButton)
 
-        assert len(shelves.buttons) == 3, "the notebook was not created"
+        assert shelves.model.rowCount() == 3, "the notebook was not created"
         assert shelves.info.notebooks[-1] == 'toto'+EXTENSION, \
             "the notebook was not added to the information instance"
     assert newN.signal_triggered
@@ -165,7 +172,7 @@ def test_shelves(qtbot, parent, mocker):
             library.toolbar.widgetForAction(library.newNotebookAction),
             QtCore.Qt.LeftButton)
 
-        assert len(shelves.buttons) == 3, "Same names are not checked"
+        assert shelves.model.rowCount() == 3, "Same names are not checked"
     assert not existingN.signal_triggered
 
     # Trying to add a notebook with a name too short
@@ -182,7 +189,7 @@ def test_shelves(qtbot, parent, mocker):
             library.toolbar.widgetForAction(library.newNotebookAction),
             QtCore.Qt.LeftButton)
 
-        assert len(shelves.buttons) == 3, "Too short names are not checked"
+        assert shelves.model.rowCount() == 3, "Too short names are not checked"
     assert not tooShortN.signal_triggered
 
     # Adding a folder
@@ -195,7 +202,7 @@ def test_shelves(qtbot, parent, mocker):
         qtbot.mouseClick(
             library.toolbar.widgetForAction(library.newFolderAction),
             QtCore.Qt.LeftButton)
-        assert len(shelves.buttons) == 0, \
+        assert shelves.model.rowCount() == 0, \
             "the folder was not created, or the level was not changed"
         # Create a notebook called toto inside the titi folder
         QtCore.QTimer.singleShot(200, interact_newN)
@@ -203,7 +210,7 @@ def test_shelves(qtbot, parent, mocker):
             library.toolbar.widgetForAction(library.newNotebookAction),
             QtCore.Qt.LeftButton)
 
-        assert len(shelves.buttons) == 1, "the notebook was not created"
+        assert shelves.model.rowCount() == 1, "the notebook was not created"
         assert shelves.info.notebooks == ['toto'+EXTENSION], \
             "the notebook was not added to the information instance"
 
@@ -223,7 +230,7 @@ def test_shelves(qtbot, parent, mocker):
         qtbot.mouseClick(
             library.toolbar.widgetForAction(library.newFolderAction),
             QtCore.Qt.LeftButton)
-        assert len(shelves.buttons) == 1, \
+        assert shelves.model.rowCount() == 1, \
             "the existing folder was overwritten"
     assert existingF.signal_triggered
 
@@ -234,8 +241,7 @@ def test_shelves(qtbot, parent, mocker):
     new_index = 0
     with qtbot.waitSignal(shelves.refreshSignal, timeout=100) as right:
         with qtbot.waitSignal(shelves.previewSignal, timeout=1000) as switch:
-            qtbot.mouseClick(shelves.buttons[new_index], QtCore.Qt.LeftButton,
-                             QtCore.Qt.ShiftModifier)
+            click(new_index, QtCore.Qt.LeftButton, QtCore.Qt.ShiftModifier)
         assert switch.signal_triggered, \
             "shift-clicking on a notebook should trigger a previewSignal"
     assert not right.signal_triggered, \
@@ -308,6 +314,43 @@ def test_text_editor(qtbot, parent):
     check_font_size(text_editor.defaultFontSize)
 
 
+def test_auto_refresh(qtbot, parent):
+    parent.info.refreshEditor = True
+    editing = Editing(parent)
+    qtbot.addWidget(editing)
+    text_editor = editing.tabs.currentWidget()
+    source = text_editor.source
+    content = text_editor.text.toPlainText()
+    cursor = text_editor.text.textCursor()
+    cursor.setPosition(5)
+    text_editor.text.setTextCursor(cursor)
+
+    reloads = []
+    text_editor.reloaded.connect(lambda: reloads.append(True))
+    # An exterior editor saving several times is followed by a single reload
+    with qtbot.waitSignal(text_editor.reloaded, timeout=3000) as reloaded:
+        for index in range(5):
+            with open(source, 'a') as notebook:
+                notebook.write('line %i\n' % index)
+    assert reloaded.signal_triggered
+    qtbot.wait(500)
+    assert len(reloads) == 1
+    assert text_editor.text.toPlainText() == content+''.join(
+        'line %i\n' % index for index in range(5))
+    # Only the end was replaced, so the cursor did not move
+    assert text_editor.text.textCursor().position() == 5
+    assert not text_editor.text.document().isModified()
+
+    # The emojis count for two characters in Qt, and the reloads can not be
+    # undone
+    text = u'\U0001F600 '+content
+    text_editor.applyText(text)
+    text_editor.applyText(text+'end\n')
+    assert text_editor.text.toPlainText() == text+'end\n'
+    assert not text_editor.text.document().isUndoAvailable()
+    assert not text_editor.text.document().isModified()
+
+
 def test_editing(qtbot, parent, mocker):
     """Test the editing tab"""
     editing = Editing(parent)
@@ -316,6 +359,30 @@ def test_editing(qtbot, parent, mocker):
     # Check that there is only one tab
     assert editing.tabs.count() == 2, "the tabs were not created properly"
 
+    # Only the notebook shown is read
+    assert isinstance(editing.tabs.widget(0), TextEditor)
+    assert not isinstance(editing.tabs.widget(1), TextEditor)
+
+    # Showing the other one unloads the first, above the maximum
+    editing.max_loaded = 1
+    editing.tabs.setCurrentIndex(1)
+    assert isinstance(editing.tabs.widget(1), TextEditor)
+    assert not isinstance(editing.tabs.widget(0), TextEditor)
+    assert list(editing.editors) == [
+        os.path.join(editing.info.level, editing.info.notebooks[1])]
+    editing.tabs.setCurrentIndex(0)
+    assert isinstance(editing.tabs.widget(0), TextEditor)
+
+    # An editor with unsaved modifications is kept, until it is saved
+    editing.tabs.currentWidget().insertText('Modified ')
+    editing.tabs.setCurrentIndex(1)
+    assert isinstance(editing.tabs.widget(0), TextEditor)
+    editing.tabs.widget(0).saveText()
+    assert not editing.tabs.widget(0).text.document().isModified()
+    editing.evict()
+    assert not isinstance(editing.tabs.widget(0), TextEditor)
+    editing.tabs.setCurrentIndex(0)
+
     # Test the new entry button
     def interact_newEntry():
         # Create a post called toto, with tags tata and tutu and entry titi
@@ -389,24 +456,27 @@ def test_editing(qtbot, parent, mocker):
 
     # Fontsize should be bigger
     editing.zoomIn()
-    assert editor.text.currentFont().pointSize() > editor.defaultFontSize
+    assert editor.text.font().pointSize() > editor.defaultFontSize
 
     # Zoom out twice should get the Point size smaller
     editing.zoomOut()
     editing.zoomOut()
-    assert editor.text.currentFont().pointSize() < editor.defaultFontSize
+    assert editor.text.font().pointSize() < editor.defaultFontSize
 
     # Reset should reset it...
     editing.resetSize()
-    assert editor.text.currentFont().pointSize() == editor.defaultFontSize
+    assert editor.text.font().pointSize() == editor.defaultFontSize
 
 
-def test_preview(qtbot, parent):
+def test_preview(qtbot, parent, mocker):
+    # Launch pandoc for every conversion, to count them
+    parent.info.pandoc_server = False
     preview = Preview(parent)
     qtbot.addWidget(preview)
 
-    # Load a notebook
-    preview.loadNotebook(preview.info.notebooks[0])
+    # Load a notebook, converted in the background
+    with qtbot.waitSignal(preview.pageLoaded, timeout=10000):
+        preview.loadNotebook(preview.info.notebooks[0])
 
     # assert tagButtons contains six elements
     assert len(preview.tagButtons) == 6
@@ -419,6 +489,12 @@ def test_preview(qtbot, parent):
     assert len(preview.filters) == 1
     assert preview.filters[0] == first_key
 
+    # The posts are filtered inside the page, without loading another one
+    visible = preview.web.page().mainFrame().evaluateJavaScript(
+        "[].filter.call(document.querySelectorAll('article.blog-post'), "
+        "function (post) {return post.style.display != 'none';}).length")
+    assert visible == 1
+
     # Click on another, disabled button
     for key, button in preview.tagButtons:
         if key not in preview.remaining_tags:
@@ -444,7 +520,9 @@ def test_preview(qtbot, parent):
     preview.resetSize()
 
     # Reload should work (how to test that it truly works?)
-    preview.reload()
+    with qtbot.waitSignal(preview.pageLoaded, timeout=10000) as reload:
+        preview.reload()
+    assert reload.signal_triggered
 
     # check searchField
     # isVisibleTo(preview) is needed because qtbot doesn't show the actual
@@ -468,3 +546,50 @@ def test_preview(qtbot, parent):
     preview.searchField.clear()
     assert len([key for key, button in preview.tagButtons if
                button.isVisibleTo(preview)]) == 6
+
+    # Converting again with an already used set of filters should reuse the
+    # cached page, without calling pandoc
+    convert = mocker.spy(pypandoc, 'convert')
+    path = os.path.join(preview.info.level, preview.info.current_notebook)
+    url, remaining_tags = preview.convert(path, [first_key])
+    assert os.path.isfile(url)
+    assert first_key in remaining_tags
+    assert convert.call_count == 0
+
+    # Modifying the notebook invalidates the page
+    with open(path, 'a') as notebook:
+        notebook.write('\nsomething new\n')
+    new_url, _ = preview.convert(path, [first_key])
+    assert convert.call_count == 1
+    assert new_url != url
+    assert not os.path.isfile(url)
+
+    # A new selection of tags reuses the converted posts
+    preview.convert(path, [])
+    assert convert.call_count == 1
+
+
+def test_preview_global(qtbot, parent, mocker):
+    parent.info.pandoc_server = False
+    preview = Preview(parent)
+    qtbot.addWidget(preview)
+
+    # All the notebooks of the level in a single page, tagged with their name
+    with qtbot.waitSignal(preview.pageLoaded, timeout=10000):
+        preview.loadGlobal()
+    keys = [key for key, _ in preview.tagButtons]
+    assert 'example' in keys and 'second' in keys
+    assert 'toto/example' not in keys
+    assert preview.extracted_tags['layout'] == 2
+
+    # The notebooks of the sub-folders are added
+    with qtbot.waitSignal(preview.pageLoaded, timeout=10000):
+        preview.recursiveAction.setChecked(True)
+    assert preview.extracted_tags['toto/example'] == 2
+    assert preview.extracted_tags['layout'] == 3
+
+    # The unchanged page is loaded from the cache
+    convert = mocker.spy(pypandoc, 'convert')
+    url, _ = preview.renderGlobal(preview.info.level, True)
+    assert os.path.isfile(url)
+    assert convert.call_count == 0
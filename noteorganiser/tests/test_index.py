@@ -0,0 +1,56 @@
+"""tests for the index of the notebooks"""
+from __future__ import unicode_literals
+import os
+import io
+import shutil
+
+import noteorganiser.text_processing as tp
+from ..index import NotebookIndex, INDEX_FOLDER
+from ..logger import create_logger
+
+
+def test_index(tmpdir, mocker):
+    log = create_logger('CRITICAL', 'stream')
+    source = os.path.join(os.getcwd(), 'example', 'example.md')
+    path = str(tmpdir.join('example.md'))
+    shutil.copy(source, path)
+    parse = mocker.spy(tp, 'parse_posts')
+
+    index = NotebookIndex(str(tmpdir), log)
+    # The tags alone do not need to parse the notebook
+    assert list(index.tags(path))[:3] == ['layout', 'widget', 'clear']
+    assert parse.call_count == 0
+
+    title, posts = index.posts(path)
+    assert title == 'Pyside'
+    assert [post[2] for post in posts] == [
+        'Deleting all items in a layout', 'Disabling buttons']
+    assert posts[1][3:] == ['2014-09-08', ['button', 'disable', 'scroll']]
+    assert list(index.tags(path))[:3] == ['layout', 'widget', 'clear']
+    assert parse.call_count == 1
+    # Only the index remains in the folder
+    assert tmpdir.join(INDEX_FOLDER).listdir() == [
+        tmpdir.join(INDEX_FOLDER, 'index')]
+
+    # A new session reads the index instead of parsing the notebook
+    index = NotebookIndex(str(tmpdir), log)
+    assert index.posts(path)[1] == posts
+    assert parse.call_count == 1
+
+    # A modified notebook is parsed again
+    sha = index.sha(path)
+    with io.open(path, 'a', encoding='utf-8') as notebook:
+        notebook.write(
+            '\n' + tp.create_post_from_entry('New', ['toto'], 'text'))
+    assert index.sha(path) != sha
+    assert len(index.posts(path)[1]) == 3
+    assert parse.call_count == 2
+
+    # A corrupted index is ignored
+    tmpdir.join(INDEX_FOLDER, 'index').write('{"version": 1, "noteb')
+    index = NotebookIndex(str(tmpdir), log)
+    assert len(index.posts(path)[1]) == 3
+    assert parse.call_count == 3
+
+    index.forget(path)
+    assert not NotebookIndex(str(tmpdir), log).entries
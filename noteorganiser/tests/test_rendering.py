@@ -0,0 +1,124 @@
+"""tests for the conversion to html"""
+from __future__ import unicode_literals
+import os
+import re
+import pypandoc
+
+from ..rendering import parse_template, render_template
+from ..rendering import unique_header_ids, table_of_contents
+from ..rendering import Renderer, notebook_tag
+from .. import rendering
+from .custom_fixtures import parent
+
+
+def test_template():
+    template = parse_template(
+        '<title>$title$</title>$if(toc)$<div>$toc$</div>$endif$'
+        '$for(css)$<link href="$css$" $if(html5)$$else$type="text/css" '
+        '$endif$/>$endfor$ 10$$')
+    assert render_template(template, {'title': 'Toto', 'css': ['a', 'b']}) \
+        == ('<title>Toto</title><link href="a" type="text/css" />'
+            '<link href="b" type="text/css" /> 10$')
+    assert render_template(template, {'toc': 'T', 'html5': True}) == \
+        '<title></title><div>T</div> 10$'
+
+
+def test_headers():
+    body = ('<h1 id="a">A</h1><h2 id="b" class="x">B</h2>'
+            '<h2 id="b">B</h2><h3 id="c">C</h3><h2 id="d">D</h2>')
+    body = unique_header_ids(body)
+    assert '<h2 id="b" class="x">B</h2><h2 id="b-1">B</h2>' in body
+
+    toc = table_of_contents(body).replace('\n', '')
+    assert toc == ('<ul><li><a href="#a">A</a><ul>'
+                   '<li><a href="#b">B</a></li>'
+                   '<li><a href="#b-1">B</a><ul>'
+                   '<li><a href="#c">C</a></li></ul></li>'
+                   '<li><a href="#d">D</a></li></ul></li></ul>')
+    assert table_of_contents('<p>nothing</p>') == ''
+
+
+def test_renderer(parent, mocker):
+    path = os.path.abspath(os.path.join(
+        os.path.dirname(__file__), '..', 'assets', 'style'))
+    renderer = Renderer(os.path.join(path, 'bootstrap-blog.html'),
+                        os.path.join(path, 'bootstrap.css'), parent.info.root)
+    source = os.path.join(parent.info.root, parent.info.notebooks[0])
+    convert = mocker.spy(pypandoc, 'convert')
+
+    # All the posts are converted with a single call to pandoc
+    html, posts_tags = renderer.convert(source)
+    assert convert.call_count == 1
+    assert len(renderer.fragments) == 3
+    assert html.count("<article class='blog-post'") == 2
+    assert 'data-tags="layout,widget,clear"' in html
+    assert 'Deleting all items in a layout' in html
+    assert posts_tags == [('layout', 'widget', 'clear'),
+                          ('button', 'disable', 'scroll')]
+
+    # Filtering only assembles the cached posts
+    html, posts_tags = renderer.convert(source, ['layout'], use_TOC=True)
+    assert convert.call_count == 1
+    assert html.count("<article class='blog-post'") == 1
+    assert 'Disabling buttons' not in html
+    assert 'href="#deleting-all-items-in-a-layout"' in html
+    assert posts_tags == [('layout', 'widget', 'clear')]
+
+
+def test_footnotes(tmpdir):
+    path = os.path.abspath(os.path.join(
+        os.path.dirname(__file__), '..', 'assets', 'style'))
+    renderer = Renderer(os.path.join(path, 'bootstrap-blog.html'),
+                        os.path.join(path, 'bootstrap.css'), str(tmpdir))
+    source = tmpdir.join('notes.md')
+    source.write('Notes\n=====\n\nA\n---\n# a\n*01/01/2015*\n'
+                 'First[^1]\n\n[^1]: One\n\nB\n---\n# b\n*01/01/2015*\n'
+                 'Second[^1]\n\n[^1]: Two\n')
+    html, _ = renderer.convert(str(source))
+
+    # The notes of both posts are numbered from 1, with distinct ids
+    ids = re.findall(r'id="([^"]*fn[^"]*)"', html)
+    assert len(ids) == 4
+    assert len(set(ids)) == 4
+    for identifier in ids:
+        assert 'href="#%s"' % identifier in html
+
+    # The notes are inside the article of their post, to be filtered with it
+    articles = re.split('<article class=.blog-post', html)[1:]
+    assert len(articles) == 2
+    for article in articles:
+        assert article.split('</article>')[0].count('class="footnotes') == 1
+
+
+def test_global_renderer(parent, mocker):
+    path = os.path.abspath(os.path.join(
+        os.path.dirname(__file__), '..', 'assets', 'style'))
+    renderer = Renderer(os.path.join(path, 'bootstrap-blog.html'),
+                        os.path.join(path, 'bootstrap.css'), parent.info.root)
+    root = parent.info.root
+    paths = parent.info.tree.notebooks(root, recursive=True)
+    notebooks = [(source, parent.info.get_sha(source),
+                  notebook_tag(source, root)) for source in paths]
+    assert [tag for _, _, tag in notebooks] == [
+        'example', 'second', 'toto/example']
+    convert = mocker.spy(pypandoc, 'convert')
+    parse = mocker.spy(rendering, 'parse_tagged_notebook')
+
+    # The posts of all the notebooks, tagged with their notebook
+    html, posts_tags = renderer.convert_global('All', notebooks)
+    assert convert.call_count == 1
+    assert parse.call_count == 3
+    assert html.count("<article class='blog-post'") == 6
+    assert 'data-tags="layout,widget,clear,toto/example"' in html
+    assert posts_tags[2] == ('layout', 'widget', 'clear', 'second')
+
+    # Only the modified notebook is parsed again, and its new post converted
+    with open(paths[1], 'a') as notebook:
+        notebook.write('\nNew\n---\n# layout\n*01/01/2015*\nText\n')
+    notebooks[1] = (paths[1], parent.info.get_sha(paths[1]), 'second')
+    html, posts_tags = renderer.convert_global('All', notebooks, ['second'])
+    assert parse.call_count == 4
+    assert convert.call_count == 2
+    assert len(renderer.fragments) == 8
+    assert posts_tags[-1] == ('layout', 'second')
+    assert html.count("<article class='blog-post'") == 3
@@ -0,0 +1,94 @@
+"""tests for the full-text search engine"""
+from __future__ import unicode_literals
+import os
+import io
+import shutil
+
+from ..search import SearchEngine, tokenize
+from ..index import INDEX_FOLDER
+from ..logger import create_logger
+
+
+def test_tokenize():
+    assert tokenize("Deleting all items, in a QLayout!") == [
+        'deleting', 'all', 'items', 'in', 'a', 'qlayout']
+
+
+def test_search_engine(tmpdir, mocker):
+    log = create_logger('CRITICAL', 'stream')
+    source = os.path.join(os.getcwd(), 'example', 'example.md')
+    path = str(tmpdir.join('example.md'))
+    shutil.copy(source, path)
+    tmpdir.mkdir('toto')
+    shutil.copy(source, str(tmpdir.join('toto', 'other.md')))
+
+    engine = SearchEngine(str(tmpdir), log)
+    hits = engine.search('disabling buttons')
+    # The post is found in both notebooks
+    assert [hit.title for hit in hits] == ['Disabling buttons']*2
+    assert set(hit.path for hit in hits) == set([
+        path, str(tmpdir.join('toto', 'other.md'))])
+    lines = io.open(path, encoding='utf-8').readlines()
+    assert lines[hits[0].line-2].startswith('*08/09/2014*')
+    assert engine.search('absent') == []
+    # Every notebook is stored in its own file
+    assert len(tmpdir.join(INDEX_FOLDER, 'search').listdir()) == 2
+
+    # A new session reads the index instead of the notebooks
+    index = mocker.spy(SearchEngine, 'index_notebook')
+    engine = SearchEngine(str(tmpdir), log)
+    assert engine.search('disabling buttons') == hits
+    assert index.call_count == 0
+
+    # Only the modified notebook is read again
+    with io.open(path, 'a', encoding='utf-8') as notebook:
+        notebook.write('\nNew post\n--------\n# new\n\n*01/01/2016*\n\n'
+                       'Something about buttons\n')
+    hits = engine.search('disabling buttons')
+    assert len(hits) == 3
+    assert hits[-1].title == 'New post'
+    assert index.call_count == 1
+
+    # The removed notebooks are forgotten
+    shutil.rmtree(str(tmpdir.join('toto')))
+    assert len(engine.search('disabling buttons')) == 2
+    assert len(tmpdir.join(INDEX_FOLDER, 'search').listdir()) == 1
+
+
+def test_search_engine_update(tmpdir, mocker):
+    log = create_logger('CRITICAL', 'stream')
+    source = os.path.join(os.getcwd(), 'example', 'example.md')
+    path = str(tmpdir.join('example.md'))
+    shutil.copy(source, path)
+    engine = SearchEngine(str(tmpdir), log)
+    # The first update builds the index
+    assert engine.update()
+    assert len(engine.search('disabling buttons', refresh=False)) == 1
+
+    # Only the reported changes are read, without walking the library
+    walk = mocker.spy(os, 'walk')
+    index = mocker.spy(SearchEngine, 'index_notebook')
+    folder = tmpdir.mkdir('toto')
+    other = str(folder.join('other.md'))
+    shutil.copy(source, other)
+    engine.notify([], {str(tmpdir): [path, other]})
+    assert engine.update()
+    assert index.call_count == 1
+    assert len(engine.search('disabling buttons', refresh=False)) == 2
+
+    # The notebooks of a removed folder are forgotten
+    folder.remove()
+    engine.notify([], {str(tmpdir): [path]})
+    assert engine.update()
+    assert len(engine.search('disabling buttons', refresh=False)) == 1
+    assert len(tmpdir.join(INDEX_FOLDER, 'search').listdir()) == 1
+
+    with io.open(path, 'a', encoding='utf-8') as notebook:
+        notebook.write('\nNew post\n--------\n# new\n\n*01/01/2016*\n\n'
+                       'Something about buttons\n')
+    engine.notify([path])
+    assert engine.update()
+    assert not engine.update()
+    assert len(engine.search('disabling buttons', refresh=False)) == 2
+    assert index.call_count == 2
+    assert walk.call_count == 0
@@ -0,0 +1,32 @@
+from __future__ import unicode_literals
+from PySide import QtGui
+
+from ..syntax import ModifiedMarkdownHighlighter
+from ..syntax import CODE, TEXT, MAIN_TITLE, SECTION
+
+
+def test_highlighter(qtbot):
+    document = QtGui.QTextDocument()
+    highlighter = ModifiedMarkdownHighlighter(document)
+    document.setPlainText('\n'.join([
+        'Title', '=====', '', 'Post', '----', '# tag, other', '*01/02/2015*',
+        '', 'Some *text*', '~~~ python', '---', '~~~', 'end']))
+    highlighter.rehighlight()
+
+    def states():
+        return [document.findBlockByNumber(number).userState()
+                for number in range(document.blockCount())]
+
+    assert states() == [TEXT | MAIN_TITLE, 0, 0, TEXT | SECTION, 0, 0, TEXT,
+                        0, TEXT, CODE, CODE, 0, TEXT]
+    # Only the italics are highlighted in the text
+    formats = document.findBlockByNumber(8).layout().additionalFormats()
+    assert [(each.start, each.length) for each in formats] == [(5, 6)]
+
+    # Underlining the last line highlights it again as a title
+    cursor = QtGui.QTextCursor(document)
+    cursor.movePosition(QtGui.QTextCursor.End)
+    cursor.insertText('\n---')
+    highlighter.rehighlightPending()
+    assert states()[-2:] == [TEXT | SECTION, 0]
+    assert not highlighter.pending
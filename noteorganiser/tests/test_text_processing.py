@@ -1,5 +1,6 @@
 from __future__ import unicode_literals
 import os
+import io
 import pytest
 from datetime import date
 from ..text_processing import *
@@ -36,6 +37,176 @@ def test_full_file(parent):
     assert set(reduced_keys) == set(['layout', 'widget', 'clear'])
 
 
+def test_parse_notebook(parent):
+    source = os.path.join(parent.info.root, parent.info.notebooks[-1])
+    text = open(source).readlines()
+    assert parse_notebook(text) == extract_title_and_posts_from_text(text)
+
+    text = ['Title\n', '=====\n', '\n', 'Code\n', '----\n', '# code\n',
+            '*01/02/2015*\n', '\n', '~~~\n', 'a = 1\n', '-----\n',
+            '# comment\n', '~~~\n', '\n', 'Second\n', '------\n',
+            '# bla\n', '\n', '*02/02/2015*\n', 'Some text\n']
+    title, posts = parse_notebook(text)
+    assert title == 'Title'
+    # The dashes inside the code do not start a new post
+    assert len(posts) == 2
+    assert posts[0][-6:] == ['~~~', 'a = 1', '-----', '# comment', '~~~', '']
+    assert posts[1] == ['Second', '------', '# bla', '*02/02/2015*',
+                        'Some text']
+
+    with pytest.raises(MarkdownSyntaxError):
+        parse_notebook(['Toto\n', 'Something\n'])
+    with pytest.raises(MarkdownSyntaxError):
+        parse_notebook(['Title\n', '=====\n', '\n', 'Toto\n', '----\n',
+                        '# tag\n', 'no date\n', '\n'])
+
+
+def test_parse_posts(parent):
+    source = os.path.join(parent.info.root, parent.info.notebooks[-1])
+    text = open(source).readlines()
+    title, posts = parse_posts(text)
+    _, reference = parse_notebook(text)
+    assert title == 'Pyside'
+    assert [post.title for post in posts] == [
+        'Deleting all items in a layout', 'Disabling buttons']
+    assert posts[1].tags == ('button', 'disable', 'scroll')
+    assert posts[1].date == date(2014, 9, 8)
+    # The markdown is the same as the one of the list of lines
+    for post, lines in zip(posts, reference):
+        assert post.body == lines[4:]
+        assert post_to_markdown(post)[0] == post_to_markdown(lines)[0]
+
+    # The tags are shared between the posts of the notebook
+    _, shared = parse_posts(['Title\n', '=====\n', '\n', 'A\n', '---\n',
+                             '# a, b\n', '*01/01/2015*\n', 'text\n', '\n',
+                             'B\n', '---\n', '# a, b\n', '*01/01/2015*\n',
+                             'text\n'])
+    assert shared[0].tags is shared[1].tags
+
+    # Only the body is pickled
+    copy = six.moves.cPickle.loads(six.moves.cPickle.dumps(posts[0], 2))
+    assert copy == posts[0]
+    assert len(copy.source) == len(copy.body)
+
+    with pytest.raises(MarkdownSyntaxError):
+        parse_posts(['Title\n', '=====\n', '\n', 'Toto\n', '----\n',
+                     '#  ,\n', '*01/01/2015*\n', 'text\n', '\n'])
+
+
+def test_notebook_state(parent):
+    source = os.path.join(parent.info.root, parent.info.notebooks[-1])
+    content = io.open(source, encoding='utf-8').read()
+    state = NotebookState()
+    title, posts = state.update(content)
+    assert title == 'Pyside'
+    assert len(posts) == 2
+    assert state.tags['layout'] == 1
+    first = posts[0]
+
+    # Appending an entry only parses the new one
+    entry = create_post_from_entry('New entry', ['layout'], 'Some text')
+    title, posts = state.update(content+'\n'+entry)
+    assert len(posts) == 3
+    assert posts[0] is first
+    assert posts[2].title == 'New entry'
+    assert posts[2].body == ['Some text']
+    assert state.tags['layout'] == 2
+
+    # Modifying the first post keeps the others
+    second = posts[1]
+    content = state.content.replace('refreshing', 'updating')
+    _, posts = state.update(content)
+    assert posts[0] is not first
+    assert posts[1].tags is second.tags
+    assert posts == parse_posts(split_lines(content))[1]
+    assert [text for text, _ in state.markdowns] == [
+        post_to_markdown(post)[0] for post in posts]
+
+    # A broken notebook is parsed from scratch at the next update
+    with pytest.raises(MarkdownSyntaxError):
+        state.update(content.replace('=====', ''))
+    assert state.update(content)[1] == posts
+
+    # The tags of the removed posts are eventually forgotten
+    for index in range(100):
+        state.update(content+'\n'+create_post_from_entry(
+            'Entry', ['tag%i' % index], 'text'))
+    assert len(state.interned) < 100
+
+
+def test_stream_notebook(parent):
+    source = os.path.join(parent.info.root, parent.info.notebooks[-1])
+    title, posts = stream_notebook(source)
+    reference = parse_posts(open(source).readlines())
+    assert title == reference[0]
+    assert list(posts) == reference[1]
+
+    # Only the posts with the tags are produced
+    title, posts = stream_notebook(source, ['layout', 'clear'])
+    assert [post.title for post in posts] == ['Deleting all items in a layout']
+
+    # The result does not depend on the size of the blocks
+    with io.open(source, encoding='utf-8') as notebook:
+        posts = list(iter_posts(iter_blocks(notebook, 3)))
+    assert posts == reference[1]
+
+
+def test_tags_from_notes(parent):
+    source = os.path.join(parent.info.root, parent.info.notebooks[-1])
+    _, tags = from_notes_to_markdown(source)
+    assert tags_from_notes(source) == tags
+
+
+def test_tags_from_notes_like_parser(tmpdir):
+    # The lines of dashes in code blocks do not start a post
+    source = tmpdir.join('notebook.md')
+    source.write('Title\n===\n\nA\n---\n# a, b\n\n*01/01/2015*\n\n'
+                 '```\nB\n---\n# comment\n```\n\nC\n---\n# b\n'
+                 '*01/01/2015*\ntext\n')
+    _, tags = from_notes_to_markdown(str(source))
+    assert tags_from_notes(str(source)) == tags == od([('b', 2), ('a', 1)])
+
+
+def test_common_prefix():
+    assert common_prefix([1, 2, 3], [1, 2]) == 2
+    assert common_prefix(list(range(1000)), list(range(700))+[0]) == 700
+    assert common_prefix([], [1]) == 0
+
+
+def test_changed_range():
+    assert changed_range('abc\ndef\n', 'abc\nxyz\ndef\n') == (4, 4, 'xyz\n')
+    assert changed_range('aaa', 'aa') == (2, 3, '')
+    assert changed_range('same', 'same') == (4, 4, '')
+    for old, new in (('', 'text'), ('a\nb', 'b'), ('one two', 'one three')):
+        begin, end, replacement = changed_range(old, new)
+        assert old[:begin]+replacement+old[end:] == new
+
+
+def test_classify_lines():
+    lines, kinds = classify_lines(
+        ['Title\n', '===\n', '  \n', '---\n', '# a, b\n', '*01/02/2015*\n',
+         '``` python\n', '---\n', '```\n', 'text\n'])
+    assert lines[0] == 'Title'
+    assert kinds == [BODY, TITLE, BLANK, DASHES, TAGS, DATE, FENCE, BODY,
+                     FENCE, BODY]
+
+
+def test_unclosed_fence():
+    # The following posts would be merged in the one opening the code block
+    text = ['Title\n', '===\n', '\n', 'A\n', '---\n', '# a\n',
+            '*01/02/2015*\n', '``` unclosed\n', '\n', 'B\n', '---\n',
+            '# b\n', '*01/02/2015*\n', 'text\n']
+    with pytest.raises(MarkdownSyntaxError) as error:
+        parse_notebook(text)
+    assert 'line 8' in '%s' % error.value
+    state = NotebookState()
+    with pytest.raises(MarkdownSyntaxError):
+        state.update(''.join(text))
+    text.insert(9, '```\n')
+    _, posts = state.update(''.join(text))
+    assert [post.tags for post in posts] == [('a', ), ('b', )]
+
+
 def test_tag_sorting():
     source = ['toto', 'toto', 'toto', 'tata', 'titi', 'titi', 'titi', 'titi']
     ordered_keys = ['titi', 'toto', 'tata']
@@ -118,3 +289,30 @@ def test_post_to_markdown():
     normalized = normalize_post(no_blank_line)
     text, tags = post_to_markdown(normalized)
     assert 'post' in text
+
+
+def test_select_posts():
+    posts_tags = [['toto', 'tata'], ['toto'], ['titi']]
+    selected, remaining_tags = select_posts(posts_tags, ['toto'])
+    assert selected == [0, 1]
+    assert [k for k in remaining_tags.keys()] == ['toto', 'tata']
+
+    selected, remaining_tags = select_posts(posts_tags)
+    assert selected == [0, 1, 2]
+    assert len(remaining_tags) == 3
+
+
+def test_tag_index():
+    posts_tags = [['toto', 'tata'], ['toto'], ['titi'], ['tata', 'toto']]
+    index = TagIndex(posts_tags)
+    selection = index.select(['toto'])
+    assert index.posts(selection) == [0, 1, 3]
+    assert index.remaining(selection) == od([('toto', 3), ('tata', 2)])
+    assert index.posts(index.select(['toto', 'titi'])) == []
+    assert index.posts(index.select(['absent'])) == []
+    # Same result as counting the tags of the selected posts
+    for tags in ([], ['tata'], ['titi']):
+        selected, remaining_tags = select_posts(posts_tags, tags)
+        assert list(index.remaining(index.select(tags)).items()) == list(
+            sort_tags(tag for post in selected
+                      for tag in posts_tags[post]).items())
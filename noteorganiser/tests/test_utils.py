@@ -8,6 +8,8 @@ from PySide import QtCore
 
 #utils to test
 from ..utils import fuzzySearch
+from ..utils import FuzzyMatcher, PREFIX, WORD_START, SUBSTRING, SUBSEQUENCE
+from ..utils import FlowLayout
 from .custom_fixtures import parent
 
 
@@ -34,3 +36,54 @@ def test_fuzzySearch():
     assert not fuzzySearch('bot', 'git got gut')
     #searchstring not found
     assert not fuzzySearch('gran', 'this is a great neat thing')
+
+
+def test_FuzzyMatcher():
+    tags = ['non-linear', 'layout', 'clear', 'widget', 'lazy loading']
+    matcher = FuzzyMatcher(tags)
+    assert matcher.match('') == [(index, PREFIX) for index in range(5)]
+    # prefix, then word start, then substring, then subsequence
+    assert matcher.ranked('l') == [
+        'layout', 'lazy loading', 'non-linear', 'clear']
+    assert matcher.match('lin') == [(0, WORD_START), (4, SUBSEQUENCE)]
+    assert matcher.match('ear') == [(0, SUBSTRING), (2, SUBSTRING)]
+    assert matcher.match('lyt') == [(1, SUBSEQUENCE)]
+    # every word should match
+    assert matcher.ranked('la  lo') == ['lazy loading', 'layout']
+    assert matcher.ranked('bot') == []
+    # the previous inputs are remembered
+    assert 'la lo' in matcher.history
+    assert matcher.match('LA lo') is matcher.match('la lo')
+
+
+def test_FlowLayout(qtbot):
+    widget = QtGui.QWidget()
+    qtbot.addWidget(widget)
+    flow = FlowLayout(widget, spacing=10)
+    buttons = []
+    for index in range(5):
+        button = QtGui.QPushButton('%i' % index)
+        button.setFixedSize(40, 20)
+        buttons.append(button)
+        flow.addWidget(button)
+    # The hidden widgets take no space
+    widget.show()
+
+    def positions():
+        return [(button.x(), button.y()) for button in buttons]
+
+    # Three buttons fit in 150 pixels
+    assert flow.heightForWidth(150) == 50
+    flow.setGeometry(QtCore.QRect(0, 0, 150, 100))
+    assert positions() == [(0, 0), (50, 0), (100, 0), (0, 30), (50, 30)]
+
+    # The rows are computed again for another width
+    flow.setGeometry(QtCore.QRect(0, 0, 100, 100))
+    assert positions() == [(0, 0), (50, 0), (0, 30), (50, 30), (0, 60)]
+
+    # Removing an item moves the following ones
+    flow.takeAt(1)
+    buttons.pop(1).setParent(None)
+    flow.setGeometry(QtCore.QRect(0, 0, 100, 100))
+    assert positions() == [(0, 0), (50, 0), (0, 30), (50, 30)]
+    assert flow.heightForWidth(150) == 50
@@ -0,0 +1,35 @@
+"""tests for the watcher of the library"""
+from __future__ import unicode_literals
+import os
+import io
+
+from ..watcher import LibraryWatcher
+from .custom_fixtures import parent
+
+
+def test_library_watcher(qtbot, parent):
+    info = parent.info
+    watcher = LibraryWatcher(info, parent.log, delay=100)
+    # All the folders, and the notebooks of the current one, are watched
+    assert os.path.join(info.root, 'toto') in watcher.watcher.directories()
+    assert os.path.join(info.root, 'example.md') in watcher.watcher.files()
+
+    changes = []
+    watcher.changed.connect(
+        lambda folders, notebooks: changes.append((folders, notebooks)))
+    # Many changes are reported at once
+    with qtbot.waitSignal(watcher.changed, timeout=5000):
+        for index in range(50):
+            with io.open(os.path.join(info.root, 'toto', 'new%i.md' % index),
+                         'w', encoding='utf-8') as notebook:
+                notebook.write('Title\n=====\n')
+        with io.open(os.path.join(info.root, 'example.md'), 'a',
+                     encoding='utf-8') as notebook:
+            notebook.write('\n')
+    qtbot.wait(300)
+    assert len(changes) == 1
+    folders, notebooks = changes[0]
+    assert folders == [os.path.join(info.root, 'toto')]
+    assert notebooks == [os.path.join(info.root, 'example.md')]
+    # The tree of the library is already up to date
+    assert len(info.tree.listing(os.path.join(info.root, 'toto'))[0]) == 51
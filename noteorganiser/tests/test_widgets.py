@@ -6,6 +6,8 @@ from PySide import QtCore
 #widgets to test
 from ..widgets import LineEditWithClearButton
 from ..widgets import TagCompletion
+from ..widgets import ShelfModel, KIND_ROLE
+from ..widgets import shelf_pixmap, label_pixmap
 from ..utils import MultiCompleter
 from .custom_fixtures import parent
 
@@ -78,3 +80,39 @@ def test_TagCompletion(qtbot, parent):
     assert tagCompletion.completer.separators == [';', ',']
     assert tagCompletion.getTextWithNormalizedSeparators() == \
         ' tata; toto; tata'
+
+
+def test_ShelfModel(qtbot):
+    model = ShelfModel()
+    inserted, removed = [], []
+    model.rowsInserted.connect(
+        lambda parent, first, last: inserted.append((first, last)))
+    model.rowsRemoved.connect(
+        lambda parent, first, last: removed.append((first, last)))
+    items = [('notebook', 'a', 'a.md'), ('notebook', 'b', 'b.md'),
+             ('folder', 'c', '/c')]
+    model.setItems(items)
+    assert inserted == [(0, 2)]
+    assert model.data(model.index(2), KIND_ROLE) == 'folder'
+
+    # Creating a notebook only inserts its row
+    model.setItems(items[:2]+[('notebook', 'd', 'd.md')]+items[2:])
+    assert inserted[-1] == (2, 2)
+    assert not removed
+    # Deleting it only removes its row
+    model.setItems(items)
+    assert removed == [(2, 2)]
+    assert model.items == items
+
+
+def test_shelf_pixmaps(qtbot):
+    # The pictures and the labels are rendered once, and then shared
+    picture = shelf_pixmap('notebook', 128)
+    assert not picture.isNull()
+    assert shelf_pixmap('notebook', 128).cacheKey() == picture.cacheKey()
+    assert shelf_pixmap('folder', 128).cacheKey() != picture.cacheKey()
+    assert shelf_pixmap('folder', 64).width() == 64
+
+    label = label_pixmap('notebook', 'toto', 128)
+    assert label_pixmap('notebook', 'toto', 128).cacheKey() == label.cacheKey()
+    assert label_pixmap('folder', 'toto', 128).cacheKey() != label.cacheKey()
@@ -0,0 +1,36 @@
+"""tests for the background workers"""
+import time
+
+from ..workers import ConversionService
+from ..text_processing import MarkdownSyntaxError
+
+
+def slow(value):
+    time.sleep(0.2)
+    return value
+
+
+def fail():
+    raise MarkdownSyntaxError("Post does not contain dashes", [])
+
+
+def test_conversion_service(qtbot):
+    service = ConversionService()
+    results = []
+    service.finished.connect(results.append)
+
+    # Submitting a second job cancels the first one
+    with qtbot.waitSignal(service.finished, timeout=2000) as finished:
+        service.submit(slow, 1)
+        service.submit(slow, 2)
+    assert finished.signal_triggered
+    service.waitForDone()
+    qtbot.wait(100)
+    assert results == [2]
+
+    # Errors are reported by signal
+    failures = []
+    service.failed.connect(lambda kind, message: failures.append(kind))
+    with qtbot.waitSignal(service.failed, timeout=2000):
+        service.submit(fail)
+    assert failures == ['syntax']
@@ -6,14 +6,31 @@
 # date)
 # They should be extracted recursively, and fed to the different routines
 # `_from_post`.
+# The parser of whole notebooks, :func:`parse_posts`, directly produces
+# :class:`Post` records instead, that point to the lines of the source.
 # Note that all doctests are commented, and now executed in the py.test suite,
 # for compatibility reasons between py2.7 and py3.3
 from __future__ import unicode_literals
 from datetime import date
 from collections import Counter
 from collections import OrderedDict as od
+from itertools import chain, islice
+from bisect import bisect_left
+from collections import deque
 import re
 import io
+import binascii
+
+
+# Patterns recognising the lines of a notebook, see :func:`classify_lines`
+TITLE_LINE = re.compile(r'={2,}$')
+DASH_LINE = re.compile(r'-{2,}$')
+DATE_LINE = re.compile(r"\*([0-9]{2})/([0-1][0-9])/([0-9]{4})\*")
+FULL_DATE_LINE = re.compile(r"\*[0-9]{2}/[0-1][0-9]/[0-9]{4}\*$")
+FENCE_LINE = re.compile(r'(`{3,}|~{3,})[^`]*$')
+
+# Kinds of lines
+BLANK, TITLE, DASHES, TAGS, DATE, FENCE, BODY = range(7)
 
 
 def is_valid_post(post):
@@ -30,22 +47,18 @@ def is_valid_post(post):
         raise MarkdownSyntaxError("Post contains under four lines", post)
     else:
         # Recover the index of the line of dashes, in case of long titles
-        index = 0
-        dashes = [e for e in temp if re.match('^-{2,}$', e)]
-        try:
-            index = temp.index(dashes[0])
-        except IndexError:
+        for index, line in enumerate(temp):
+            if DASH_LINE.match(line):
+                break
+        else:
             raise MarkdownSyntaxError("Post does not contain dashes", post)
         if index:
             if not temp[0]:
                 raise MarkdownSyntaxError("Post title is empty", post)
-            if not re.match('^#.*$', temp[index+1]):
+            if not temp[index+1].startswith('#'):
                 raise MarkdownSyntaxError(
                     "Tags were not found after the dashes", post)
-            match = re.match(
-                r"^\*[0-9]{2}/[0-1][0-9]/[0-9]{4}\*$",
-                temp[index+2])
-            if not match:
+            if not FULL_DATE_LINE.match(temp[index+2]):
                 raise MarkdownSyntaxError(
                     "The date could not be read", temp)
     return True
@@ -64,7 +77,7 @@ def extract_tags_from_post(post):
     """
     tag_line = post[2].strip()
     if tag_line and tag_line[0] == '#':
-        tags = [elem.strip().lower() for elem in tag_line[1:].split(',')]
+        tags = split_tags(tag_line)
 
     if any(tags):
         return tags, post[:2]+post[3:]
@@ -72,6 +85,11 @@ def extract_tags_from_post(post):
         raise MarkdownSyntaxError("No tags specified in the post", post)
 
 
+def split_tags(tag_line):
+    """Recover the tags from a line of tags, starting with #"""
+    return [elem.strip().lower() for elem in tag_line.strip()[1:].split(',')]
+
+
 def extract_title_from_post(post):
     """
     Recover the title from an extracted post
@@ -85,9 +103,7 @@ def extract_date_from_post(post):
     Recover the date from an extracted post, and return the correct post
 
     """
-    match = re.match(
-        r"\*([0-9]{2})/([0-1][0-9])/([0-9]{4})\*",
-        post[2])
+    match = DATE_LINE.match(post[2])
     if match:
         assert len(match.groups()) == 3
         day, month, year = match.groups()
@@ -104,32 +120,44 @@ def normalize_post(post):
     - If a title has several lines, merge them
     - If there are missing/added blank lines in the headers, remove them
     """
-    # Remove trailing \n
-    post = [line.rstrip('\n') for line in post]
+    lines, kinds = classify_lines(post)
+    return normalize_lines(lines, kinds, 0, len(lines))
 
-    # Recover the dashline (title of the post)
-    dashes = [e for e in post if re.match('^-{2,}$', e)]
-    dashline_index = post.index(dashes[0])
 
-    title = ' '.join([post[index] for index in range(dashline_index)])
-    normalized_post = [title]+[post[dashline_index]]
+def normalize_lines(lines, kinds, start, end):
+    """
+    Normalize the post spanning lines[start:end], see :func:`normalize_post`
 
-    # Recover the tag line
-    tags = [e for e in post if re.match('^\#(.*)$', e)]
-    tag_line_index = post.index(tags[0])
-    normalized_post.append(post[tag_line_index])
+    The kinds of the lines, computed by :func:`classify_lines`, are used to
+    find the headers of the post in a single pass.
+    """
+    dashes, tags, date_line = None, None, None
+    for index in range(start, end):
+        kind = kinds[index]
+        if kind == DASHES and dashes is None:
+            dashes = index
+        elif kind == TAGS and tags is None:
+            tags = index
+        elif kind == DATE and date_line is None:
+            date_line = index
+        if None not in (dashes, tags, date_line):
+            break
+    post = lines[start:end]
+    if dashes is None:
+        raise MarkdownSyntaxError("Post does not contain dashes", post)
+    if tags is None:
+        raise MarkdownSyntaxError("Post does not contain tags", post)
+    if date_line is None:
+        raise MarkdownSyntaxError("The date could not be read", post)
 
-    # Recover the date
-    dates = [e for e in post if re.match(
-        r"\*([0-9]{2})/([0-1][0-9])/([0-9]{4})\*", e)]
-    date_line_index = post.index(dates[0])
-    normalized_post.append(post[date_line_index])
+    title = ' '.join(lines[start:dashes])
+    normalized_post = [title, lines[dashes], lines[tags], lines[date_line]]
 
     # Append the rest, starting from the first non-empty line
-    non_empty = [e for e in post[date_line_index+1:] if e]
-    if non_empty:
-        non_empty_index = post.index(non_empty[0])
-        normalized_post.extend(post[non_empty_index:])
+    for index in range(date_line+1, end):
+        if kinds[index] != BLANK:
+            normalized_post.extend(lines[index:end])
+            break
 
     return normalized_post
 
@@ -200,31 +228,379 @@ def extract_title_and_posts_from_text(text):
     return title, posts
 
 
-def post_to_markdown(post):
+def classify_lines(text):
+    """
+    Recognise the kind of every line of a text, in a single pass
+
+    The lines inside fenced code blocks are always considered as BODY, so
+    that a line of dashes in a piece of code does not start a new post.
+
+    Returns
+    -------
+    lines : list
+        lines of the text, stripped of their end of line
+    kinds : list
+        kind of every line: BLANK, TITLE (underlined with = signs), DASHES,
+        TAGS, DATE, FENCE (delimiting code) or BODY
+    """
+    lines = [line.rstrip('\n') for line in text]
+    kinds, _ = classify(lines)
+    return lines, kinds
+
+
+def classify(lines, fence=''):
+    """
+    Classify lines stripped of their end of line, see :func:`classify_lines`
+
+    fence : str
+        delimiter of the code block opened before the first line, if any
+
+    Returns
+    -------
+    kinds : list
+        kind of every line
+    fences : list
+        delimiter of the code block opened after every line, or ''
+    """
+    kinds = []
+    fences = []
+    append_kind, append_fence = kinds.append, fences.append
+    for line in lines:
+        first = line[:1]
+        if not line.strip():
+            append_kind(BLANK)
+        elif fence:
+            stripped = line.strip()
+            if stripped.startswith(fence) and not stripped.strip(fence[0]):
+                fence = ''
+                append_kind(FENCE)
+            else:
+                append_kind(BODY)
+        elif first == '-' and DASH_LINE.match(line):
+            append_kind(DASHES)
+        elif first == '#':
+            append_kind(TAGS)
+        elif first == '*' and DATE_LINE.match(line):
+            append_kind(DATE)
+        elif first == '=' and TITLE_LINE.match(line):
+            append_kind(TITLE)
+        elif first in ('`', '~') and FENCE_LINE.match(line):
+            fence = FENCE_LINE.match(line).group(1)
+            append_kind(FENCE)
+        else:
+            append_kind(BODY)
+        append_fence(fence)
+    return kinds, fences
+
+
+def check_fences(lines, kinds, fences):
+    """
+    Raise a MarkdownSyntaxError if the last code block is never closed
+
+    All the posts following it would otherwise be merged in the current one.
+    """
+    if not fences or not fences[-1]:
+        return
+    index = len(lines)-1
+    while kinds[index] != FENCE:
+        index -= 1
+    raise MarkdownSyntaxError(
+        "The code block opened at line %i is never closed with %s" % (
+            index+1, fences[-1]), lines[index:index+5])
+
+
+def split_lines(content):
+    """Split a text into lines, as :func:`classify_lines` would return them"""
+    lines = content.split('\n')
+    # The text ends with an end of line, or is empty
+    if not lines[-1]:
+        lines.pop()
+    return lines
+
+
+def find_title(lines, kinds, begin=0):
+    """
+    Recover the title of the notebook, underlined with = signs
+
+    The title is searched from the line `begin` onwards.
+
+    Returns
+    -------
+    title : str
+        the title, merged if it spans several lines
+    index : int
+        index of the line of = signs
+    """
+    try:
+        index = kinds.index(TITLE, begin)
+    except ValueError:
+        raise MarkdownSyntaxError(
+            "You should specify a title to your file"
+            ", underlined with = signs", [])
+    return '\n '.join(lines[:index]).strip(), index
+
+
+def find_post_starts(lines, kinds, begin, end, last_blank=-1):
+    """
+    Find the posts announced by the lines of dashes in lines[begin:end]
+
+    last_blank : int
+        index of the latest blank line before begin, if it is less than ten
+        lines away, -1 otherwise
+
+    Returns
+    -------
+    dashes : list
+        index of every line of dashes starting a post
+    starts : list
+        index of the first line of every post
+    """
+    dashes = []
+    starts = []
+    length = len(lines)
+    for index in range(begin, end):
+        kind = kinds[index]
+        if kind == BLANK:
+            last_blank = index
+        elif kind == DASHES and index+1 < length-1:
+            # Check that the lines surrounding this line of dashes are
+            # non-empty, otherwise it could be the beginning or end of a table.
+            if lines[index-1] and lines[index+1] and index-last_blank < 10:
+                dashes.append(index)
+                starts.append(last_blank+1)
+    return dashes, starts
+
+
+def split_notebook(text):
+    """
+    Find the title of a notebook, and where its posts start and end
+
+    Returns
+    -------
+    title : str
+        title of the notebook
+    lines, kinds : list
+        see :func:`classify_lines`
+    spans : list of tuples
+        starting and ending indices of every post in lines
+    """
+    lines = [line.rstrip('\n') for line in text]
+    kinds, fences = classify(lines)
+    check_fences(lines, kinds, fences)
+    title, _ = find_title(lines, kinds)
+    _, starts = find_post_starts(lines, kinds, 0, len(lines))
+    ends = starts[1:]+[len(lines)]
+    return title, lines, kinds, list(zip(starts, ends))
+
+
+def parse_notebook(text):
+    """
+    From an entire text (array), recover each posts and the file's title
+
+    Produces the same output as :func:`extract_title_and_posts_from_text`,
+    but every line is matched against the patterns only once, by
+    :func:`classify_lines`.
+    """
+    title, lines, kinds, spans = split_notebook(text)
+    posts = []
+    for start, end in spans:
+        post = normalize_lines(lines, kinds, start, end)
+        assert is_valid_post(post) is True
+        posts.append(post)
+
+    return title, posts
+
+
+def parse_posts(text):
+    """
+    From an entire text (array), recover the title and the :class:`Post`s
+
+    """
+    title, lines, kinds, spans = split_notebook(text)
+    # The posts of the notebook share their tags
+    interned = {}
+    return title, [Post.from_lines(lines, kinds, start, end, interned)
+                   for start, end in spans]
+
+
+def iter_blocks(source, size=1024):
+    """
+    Read and classify the lines of a file by blocks
+
+    Yields
+    ------
+    lines, kinds : list
+        lines of the block, and their kinds, see :func:`classify_lines`
+    """
+    fence = ''
+    while True:
+        lines = [line.rstrip('\n') for line in islice(source, size)]
+        if not lines:
+            if fence:
+                raise MarkdownSyntaxError(
+                    "A code block is never closed with %s" % fence, [])
+            return
+        kinds, fences = classify(lines, fence)
+        fence = fences[-1]
+        yield lines, kinds
+
+
+def iter_posts(blocks, input_tags=()):
+    """
+    Yield the posts containing all the input tags, from classified blocks
+
+    Only the lines of the post being read are kept in memory, so that the
+    memory used does not depend on the size of the notebook. A post is
+    yielded when the line of dashes of the next one is found.
+    """
+    # Lines and kinds of the current post, or of the beginning of the file
+    lines, kinds = [], []
+    # Tags shared between the posts, see :func:`intern_tags`
+    interned = {}
+    # Index of the first buffered line, and whether it starts a post
+    start, in_post = 0, False
+    # The ten lines before a line of dashes, and the one after, are needed to
+    # know if it starts a new post
+    recent = deque(maxlen=12)
+    index = -1
+    for block_lines, block_kinds in blocks:
+        for line, kind in zip(block_lines, block_kinds):
+            index += 1
+            lines.append(line)
+            kinds.append(kind)
+            recent.append((line, kind))
+            # Check the line of dashes two lines before, like
+            # :func:`find_post_starts` (which also excludes the last two
+            # lines of the file)
+            if len(recent) < 4 or recent[-3][1] != DASHES or \
+                    not recent[-4][0] or not recent[-2][0]:
+                continue
+            dashes = index-2
+            for back in range(1, 10):
+                if dashes-back < 0:
+                    new_start = 0
+                    break
+                if recent[-3-back][1] == BLANK:
+                    new_start = dashes-back+1
+                    break
+            else:
+                continue
+            cut = new_start-start
+            if in_post:
+                post = Post.from_lines(
+                    lines[:cut], kinds[:cut], 0, cut, interned)
+                if all(tag in post.tags for tag in input_tags):
+                    yield post
+            del lines[:cut]
+            del kinds[:cut]
+            start, in_post = new_start, True
+    if in_post:
+        post = Post.from_lines(lines, kinds, 0, len(lines), interned)
+        if all(tag in post.tags for tag in input_tags):
+            yield post
+
+
+def stream_notebook(path, input_tags=()):
+    """
+    Read a notebook post after post, without loading it entirely
+
+    Returns
+    -------
+    title : str
+        title of the notebook
+    posts : generator
+        the :class:`Post` containing all the input tags
+    """
+    source = io.open(path, 'r', encoding='utf-8', errors='replace')
+    try:
+        blocks = iter_blocks(source)
+        # Read until the title
+        head = []
+        for lines, kinds in blocks:
+            head.append((lines, kinds))
+            if TITLE in kinds:
+                break
+        else:
+            raise MarkdownSyntaxError(
+                "You should specify a title to your file"
+                ", underlined with = signs", [])
+        before = [line for lines, _ in head[:-1] for line in lines]
+        title = '\n '.join(
+            before+head[-1][0][:head[-1][1].index(TITLE)]).strip()
+    except Exception:
+        source.close()
+        raise
+
+    def posts():
+        with source:
+            for post in iter_posts(chain(head, blocks), input_tags):
+                yield post
+
+    return title, posts()
+
+
+def post_to_markdown(post, extra_tags=()):
     """
     Write the markdown for a given post
 
-    post : list
-        lines constituting the post
+    post : Post or list
+        the post, or the lines constituting it
+    extra_tags : tuple
+        tags added to the ones of the post, like the name of its notebook in
+        a page gathering several notebooks
 
     """
-    title = post[0]
-    text = ["", "<article class='blog-post' markdown=1>",
-            "## %s {.blog-post-title}" % title, ""]
+    if isinstance(post, Post):
+        title, tags, edit_date = post.title, post.tags, post.date
+        corpus = post.body
+    else:
+        title = post[0]
+        tags, post = extract_tags_from_post(post)
+        edit_date, post = extract_date_from_post(post)
+        corpus = extract_corpus_from_post(post)
+    if extra_tags:
+        tags = tuple(tags)+tuple(
+            tag for tag in extra_tags if tag not in tags)
+    # The tags are stored in the article, for filtering inside the page
+    article = "<article class='blog-post' data-tags=\"%s\" markdown=1>" % (
+        escape_html(','.join(tags)))
+    text = ["", article, "## %s {.blog-post-title}" % title, ""]
 
-    tags, post = extract_tags_from_post(post)
-    edit_date, post = extract_date_from_post(post)
     text.extend(["<p class='blog-post-meta'>",
                  "%s:" % edit_date,
                  "%s" % ", ".join(["**%s**" % tag for tag in tags]),
                  "</p>"])
-    corpus = extract_corpus_from_post(post)
     text.extend(corpus)
     text.extend(["</article>", "", ""])
 
     return text, tags
 
 
+def title_to_markdown(title):
+    """
+    Write the markdown for the header of a notebook
+
+    """
+    return ["<article class='blog-header'>",
+            "# %s {.blog-title}" % title, "</article>", ""]
+
+
+def from_notes_to_posts(path):
+    """
+    From a file, produce the markdown of every post, with their tags
+
+    Returns
+    -------
+    title : str
+        title of the notebook
+    posts : list of tuples
+        markdown text and tags of each post, in order of appearance
+    """
+    text = io.open(path, 'r', encoding='utf-8', errors='replace').readlines()
+    title, posts = parse_posts(text)
+    return title, [post_to_markdown(post) for post in posts]
+
+
 def from_notes_to_markdown(path, input_tags=()):
     """
     From a file, given tags, produce an output markdown file.
@@ -243,30 +619,144 @@ def from_notes_to_markdown(path, input_tags=()):
         list of tags extracted from the text, with their importance
     """
     # Create the array to return
-    text = io.open(path, 'r', encoding='utf-8', errors='replace').readlines()
-    title, posts = extract_title_and_posts_from_text(text)
-    markdown = ["<article class='blog-header'>",
-                "# %s {.blog-title}" % title, "</article>", "",
-                "<article class='row'>", "<article class='col-sm-12 blog-main'>"]
-    extracted_tags = []
+    title, posts = stream_notebook(path, input_tags)
+    markdown = title_to_markdown(title)
+    markdown.extend(["<article class='row'>",
+                     "<article class='col-sm-12 blog-main'>"])
+    # Counted as they come, in the same order as :func:`sort_tags` would
+    extracted_tags = Counter()
     for post in posts:
         text, tags = post_to_markdown(post)
-        if all([tag in tags for tag in input_tags]):
-            # Store the recovered tags
-            extracted_tags.extend(tags)
-            markdown.extend(text)
+        # Store the recovered tags
+        extracted_tags.update(tags)
+        markdown.extend(text)
 
     markdown.extend(["</article>", "</article>"])
-    cleaned_tags = sort_tags(extracted_tags)
+    cleaned_tags = od(extracted_tags.most_common())
     return markdown, cleaned_tags
 
 
+def tags_from_notes(path):
+    """
+    Recover the tags of a notebook, with their importance, from a file
+
+    The posts are found like :func:`parse_posts` does, from the kinds of the
+    lines, but only their lines of tags are read: the posts are neither
+    built nor checked, which makes it much faster than
+    :func:`from_notes_to_markdown`.
+
+    Returns
+    -------
+    tags : OrderedDict
+        as returned by :func:`sort_tags`
+    """
+    with io.open(path, 'r', encoding='utf-8', errors='replace') as notebook:
+        lines, kinds = classify_lines(notebook)
+    _, starts = find_post_starts(lines, kinds, 0, len(lines))
+    tags = []
+    for start, end in zip(starts, starts[1:]+[len(lines)]):
+        try:
+            index = kinds.index(TAGS, start, end)
+        except ValueError:
+            continue
+        post_tags = split_tags(lines[index])
+        if any(post_tags):
+            tags.extend(post_tags)
+    return sort_tags(tags)
+
+
+def select_posts(posts_tags, input_tags=()):
+    """
+    Select the posts containing all the input tags
+
+    posts_tags : list
+        tags of every post
+
+    Returns
+    -------
+    selected : list
+        indices of the selected posts
+    remaining_tags : OrderedDict
+        tags of the selected posts, with their importance
+    """
+    index = TagIndex(posts_tags)
+    selection = index.select(input_tags)
+    return index.posts(selection), index.remaining(selection)
+
+
+class TagIndex(object):
+    """
+    Inverted index from every tag to the posts having it
+
+    The posts having a tag are stored as the bits of an integer, the post `i`
+    being the bit `i`. Selecting the posts with several tags is then a bitwise
+    and of their integers, and the number of selected posts having a tag is
+    the number of bits set in the intersection, so that no post is read again
+    when a filter is added.
+
+    posts_tags : list
+        tags of every post
+    """
+    def __init__(self, posts_tags):
+        self.posts_tags = posts_tags
+        self.all = (1 << len(posts_tags))-1
+        indices = od()
+        for index, tags in enumerate(posts_tags):
+            for tag in tags:
+                indices.setdefault(tag, []).append(index)
+        self.bits = od(
+            (tag, to_bitset(values, len(posts_tags)))
+            for tag, values in indices.items())
+
+    def select(self, input_tags=()):
+        """Return the bitset of the posts having all the input tags"""
+        selection = self.all
+        for tag in input_tags:
+            selection &= self.bits.get(tag, 0)
+        return selection
+
+    def posts(self, selection):
+        """Return the indices of the posts of a bitset, in order"""
+        return [index for index, bit in enumerate(reversed(bin(selection)))
+                if bit == '1']
+
+    def remaining(self, selection):
+        """
+        Count the tags of the selected posts
+
+        Returns
+        -------
+        remaining_tags : OrderedDict
+            tags of the selected posts, with their importance, in the order of
+            :func:`sort_tags`
+        """
+        counts = []
+        for tag, bits in self.bits.items():
+            common = bits & selection
+            if common:
+                # Ties are broken by the first appearance of the tag
+                first = (common & -common).bit_length()-1
+                counts.append((-bin(common).count('1'), first,
+                               list(self.posts_tags[first]).index(tag), tag))
+        counts.sort()
+        return od((tag, -count) for count, _, _, tag in counts)
+
+
+def to_bitset(indices, size):
+    """Return the integer whose bits at the indices are set"""
+    bits = bytearray((size+7)//8)
+    for index in indices:
+        bits[index >> 3] |= 1 << (index & 7)
+    bits.reverse()
+    return int(binascii.hexlify(bytes(bits)) or b'0', 16)
+
+
 def sort_tags(source):
     """
     return a sorted version of source, with the biggests tags first
     """
-    output = od(sorted(Counter([e for e in source]).items(),
-                key=lambda t: -t[1]))
+    # most_common is a stable sort, so that equal counts keep their order
+    output = od(Counter(source).most_common())
     return output
 
 
@@ -292,6 +782,341 @@ def create_image_markdown(filename):
     return text
 
 
+def escape_html(text):
+    """Escape the html special characters"""
+    return text.replace('&', '&amp;').replace('<', '&lt;').replace(
+        '>', '&gt;').replace('"', '&quot;')
+
+
+def intern_tags(tags, interned):
+    """
+    Return a tuple of tags, shared with the posts having the same tags
+
+    interned : dict
+        tags and tuples of tags already seen, owned by the caller, so that
+        they are forgotten with the posts
+    """
+    tags = tuple(interned.setdefault(tag, tag) for tag in tags)
+    return interned.setdefault(tags, tags)
+
+
+class Post(object):
+    """
+    A post of a notebook
+
+    The body is not copied out of the notebook: it is stored as the span
+    [start, end) of the lines of the source.
+
+    """
+    __slots__ = ('title', 'tags', 'date', 'source', 'start', 'end')
+
+    def __init__(self, title, tags, post_date, source, start=0, end=None,
+                 interned=None):
+        self.title = title
+        if interned is None:
+            self.tags = tuple(tags)
+        else:
+            self.tags = intern_tags(tags, interned)
+        self.date = post_date
+        self.source = source
+        self.start = start
+        self.end = len(source) if end is None else end
+
+    @classmethod
+    def from_lines(cls, lines, kinds, start, end, interned=None):
+        """
+        Create the post spanning lines[start:end]
+
+        The checks are the same as the ones of :func:`normalize_post` followed
+        by :func:`is_valid_post`, without building the normalized post. The
+        tags are shared with the other posts through `interned`, see
+        :func:`intern_tags`.
+        """
+        dashes, tags, date_line = None, None, None
+        for index in range(start, end):
+            kind = kinds[index]
+            if kind == DASHES and dashes is None:
+                dashes = index
+            elif kind == TAGS and tags is None:
+                tags = index
+            elif kind == DATE and date_line is None:
+                date_line = index
+            if None not in (dashes, tags, date_line):
+                break
+        if dashes is None:
+            raise MarkdownSyntaxError(
+                "Post does not contain dashes", lines[start:end])
+        if tags is None:
+            raise MarkdownSyntaxError(
+                "Post does not contain tags", lines[start:end])
+        if date_line is None:
+            raise MarkdownSyntaxError(
+                "The date could not be read", lines[start:end])
+
+        title = ' '.join(lines[start:dashes])
+        body = end
+        for index in range(date_line+1, end):
+            if kinds[index] != BLANK:
+                body = index
+                break
+        if not title and body == end:
+            raise MarkdownSyntaxError(
+                "Post contains under four lines", lines[start:end])
+        if title and not FULL_DATE_LINE.match(lines[date_line]):
+            raise MarkdownSyntaxError(
+                "The date could not be read", lines[start:end])
+
+        tag_list = split_tags(lines[tags])
+        if not any(tag_list):
+            raise MarkdownSyntaxError(
+                "No tags specified in the post", lines[start:end])
+        day, month, year = DATE_LINE.match(lines[date_line]).groups()
+        return cls(title, tag_list, date(int(year), int(month), int(day)),
+                   lines, body, end, interned)
+
+    @property
+    def body(self):
+        """Lines of the post after the date"""
+        return self.source[self.start:self.end]
+
+    def shifted(self, delta):
+        """Copy of the post, whose body moved by delta lines in the source"""
+        post = Post.__new__(Post)
+        post.title, post.tags, post.date = self.title, self.tags, self.date
+        post.source = self.source
+        post.start, post.end = self.start+delta, self.end+delta
+        return post
+
+    def __getstate__(self):
+        # Only the body is kept, not the whole notebook
+        return self.title, self.tags, self.date, self.body
+
+    def __setstate__(self, state):
+        title, tags, post_date, body = state
+        Post.__init__(self, title, tags, post_date, body)
+
+    def __eq__(self, other):
+        return isinstance(other, Post) and \
+            self.__getstate__() == other.__getstate__()
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return 'Post(%r, %r, %r)' % (self.title, self.tags, self.date)
+
+
+def common_prefix(first, second, chunk=256):
+    """Return the number of leading elements shared by two lists"""
+    limit = min(len(first), len(second))
+    index = 0
+    # Compare whole chunks first, which is done much faster
+    while index+chunk <= limit and \
+            first[index:index+chunk] == second[index:index+chunk]:
+        index += chunk
+    while index < limit and first[index] == second[index]:
+        index += 1
+    return index
+
+
+def changed_range(old, new):
+    """
+    Return the part of the old text to replace to obtain the new one
+
+    The texts can also be lists, like the items of the shelves.
+
+    Returns
+    -------
+    begin, end : int
+        the text to replace is old[begin:end]
+    replacement : str or list
+        the text replacing it
+    """
+    begin = common_prefix(old, new)
+    # The common end can not overlap the common beginning
+    end = min(common_prefix(old[::-1], new[::-1]),
+              min(len(old), len(new))-begin)
+    return begin, len(old)-end, new[begin:len(new)-end]
+
+
+class NotebookState(object):
+    """
+    Parsed content of a notebook, updated incrementally
+
+    The lines of the previous version, their kinds, and the posts are kept.
+    When the content changes, only the lines between the common beginning and
+    end of the two versions are classified again, and the posts outside of
+    this region are reused, with their markdown and tags. Appending to the
+    notebook, which is how the new entries are added, is detected without
+    comparing the lines, so that its cost only depends on the new entry.
+
+    .. note::
+
+        The posts share the lines stored in the state, which are modified in
+        place: the posts are only valid until the next update.
+
+    """
+    def __init__(self):
+        self.content = None
+        self.title = None
+        self.title_index = None
+        self.lines = []
+        self.kinds = []
+        self.fences = []
+        # Line of dashes announcing every post, and its first line
+        self.dashes = []
+        self.starts = []
+        self.posts = []
+        # Markdown and tags of every post, see :func:`post_to_markdown`
+        self.markdowns = []
+        # Number of posts for every tag
+        self.tags = Counter()
+        # Tags and tuples of tags shared between the posts, see
+        # :func:`intern_tags`
+        self.interned = {}
+        self._tag_index = None
+
+    def read(self, path):
+        """Update the state from the notebook file"""
+        with io.open(path, 'r', encoding='utf-8', errors='replace') as source:
+            return self.update(source.read())
+
+    def update(self, content):
+        """
+        Parse the new content of the notebook
+
+        Returns
+        -------
+        title : str
+            title of the notebook
+        posts : list
+            the :class:`Post` of the notebook
+        """
+        if content == self.content:
+            return self.title, self.posts
+        old = self.content or ''
+        try:
+            if content.startswith(old):
+                if not old or old.endswith('\n'):
+                    begin = len(self.lines)
+                    region = split_lines(content[len(old):])
+                else:
+                    # The last line was not terminated, and goes on
+                    begin = len(self.lines)-1
+                    region = split_lines(
+                        self.lines[-1]+content[len(old):])
+                self.replace(begin, len(self.lines), region)
+            else:
+                lines = split_lines(content)
+                prefix = common_prefix(lines, self.lines)
+                suffix = common_prefix(
+                    lines[prefix:][::-1], self.lines[prefix:][::-1])
+                self.replace(prefix, len(self.lines)-suffix,
+                             lines[prefix:len(lines)-suffix])
+            check_fences(self.lines, self.kinds, self.fences)
+        except Exception:
+            # Start from scratch next time
+            self.__init__()
+            raise
+        self.content = content
+        self._tag_index = None
+        return self.title, self.posts
+
+    @property
+    def tag_index(self):
+        """:class:`TagIndex` of the posts, built on the first access"""
+        if self._tag_index is None:
+            self._tag_index = TagIndex(
+                [tags for _, tags in self.markdowns])
+        return self._tag_index
+
+    def replace(self, begin, end, region):
+        """Replace the lines[begin:end] by the region, and update the posts"""
+        old_length = len(self.lines)
+        # Classify the new lines. The lines after them only need to be
+        # classified again if they end in a different code block
+        kinds, fences = classify(region, self.fences[begin-1] if begin else '')
+        region = list(region)
+        fence = fences[-1] if fences else (
+            self.fences[begin-1] if begin else '')
+        stable = end
+        while stable < old_length and \
+                fence != (self.fences[stable-1] if stable else ''):
+            line = self.lines[stable]
+            line_kinds, line_fences = classify([line], fence)
+            region.append(line)
+            kinds.extend(line_kinds)
+            fences.extend(line_fences)
+            fence = line_fences[0]
+            stable += 1
+        self.lines[begin:stable] = region
+        self.kinds[begin:stable] = kinds
+        self.fences[begin:stable] = fences
+        new_stable = begin+len(region)
+        delta = new_stable-stable
+        length = len(self.lines)
+
+        if self.title_index is None or self.title_index >= begin:
+            self.title, self.title_index = find_title(
+                self.lines, self.kinds, begin)
+
+        # The lines of dashes before `first` are surrounded by the same lines
+        # as before, and the ones after `last` too
+        first = max(0, begin-3)
+        last = min(length, new_stable+10)
+        last_blank = -1
+        for index in range(first-1, max(first-11, -1), -1):
+            if self.kinds[index] == BLANK:
+                last_blank = index
+                break
+        dashes, starts = find_post_starts(
+            self.lines, self.kinds, first, last, last_blank)
+        head = bisect_left(self.dashes, first)
+        tail = bisect_left(self.dashes, last-delta)
+        end = self.starts[tail]+delta if tail < len(self.starts) else length
+        # The last post before the region is kept only if it still ends at
+        # the same line, before the modified ones
+        reused = head
+        if head:
+            old_end = self.starts[head] if head < len(self.starts) \
+                else old_length
+            if (starts+[end])[0] != old_end or old_end > begin:
+                reused = head-1
+                dashes.insert(0, self.dashes[reused])
+                starts.insert(0, self.starts[reused])
+
+        for post in self.posts[reused:tail]:
+            for tag in post.tags:
+                self.tags[tag] -= 1
+                if not self.tags[tag]:
+                    del self.tags[tag]
+        posts = []
+        markdowns = []
+        for start, post_end in zip(starts, starts[1:]+[end]):
+            post = Post.from_lines(
+                self.lines, self.kinds, start, post_end, self.interned)
+            posts.append(post)
+            markdowns.append(post_to_markdown(post))
+            self.tags.update(post.tags)
+
+        self.posts[reused:] = posts+[
+            post.shifted(delta) for post in self.posts[tail:]]
+        self.markdowns[reused:] = markdowns+self.markdowns[tail:]
+        self.dashes[reused:] = dashes+[
+            dash+delta for dash in self.dashes[tail:]]
+        self.starts[reused:] = starts+[
+            start+delta for start in self.starts[tail:]]
+
+        # Forget the tags of the removed posts, once there are many of them
+        if len(self.interned) > 2*(len(self.tags)+len(self.posts))+64:
+            interned = {}
+            for post in self.posts:
+                intern_tags(post.tags, interned)
+            self.interned = interned
+
+
 class MarkdownSyntaxError(ValueError):
 
     def __init__(self, message, post):
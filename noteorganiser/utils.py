@@ -6,6 +6,7 @@ from PySide import QtGui
 from PySide import QtCore
 
 import re
+from bisect import bisect_right
 
 
 def fuzzySearch(searchInput, baseString):
@@ -28,6 +29,88 @@ def fuzzySearch(searchInput, baseString):
     return False
 
 
+# Ranks of a match in the FuzzyMatcher, the best first
+PREFIX, WORD_START, SUBSTRING, SUBSEQUENCE = range(4)
+
+
+class FuzzyMatcher(object):
+    """
+    Find and rank the strings of a vocabulary matching a search input
+
+    The vocabulary is normalized once. Every word of the input must match the
+    string, which is ranked by its worst word: the string starts with the
+    word, one of its words starts with it, it contains it, or it contains its
+    letters in order. As a longer input can only match fewer strings, the
+    strings matching the longest known beginning of the input are the only
+    ones checked.
+
+    example:
+        matcher = FuzzyMatcher(['layout', 'widget', 'clear'])
+        matcher.ranked('la')  # ['layout', 'clear']
+    """
+    # Number of inputs whose matches are remembered
+    max_history = 64
+
+    def __init__(self, vocabulary):
+        self.vocabulary = list(vocabulary)
+        self.normalized = []
+        for string in self.vocabulary:
+            text = re.sub(r'\s', ' ', string.lower())
+            starts = [match.start() for match in re.finditer(r'\w+', text)]
+            self.normalized.append((text, starts))
+        # Indices of the strings matching the previous inputs, with their rank
+        self.history = {'': [(index, PREFIX) for index in
+                             range(len(self.vocabulary))]}
+
+    def match(self, searchInput):
+        """
+        Return the indices of the matching strings, with their rank
+
+        Returns
+        -------
+        matches : list
+            (index in the vocabulary, rank) of every matching string, in the
+            order of the vocabulary
+        """
+        searchInput = ' '.join(searchInput.lower().split())
+        if searchInput in self.history:
+            return self.history[searchInput]
+        known = max((previous for previous in self.history
+                     if searchInput.startswith(previous)), key=len)
+        words = searchInput.split(' ')
+        matches = []
+        for index, _ in self.history[known]:
+            rank = self.rank(words, *self.normalized[index])
+            if rank is not None:
+                matches.append((index, rank))
+        if len(self.history) >= self.max_history:
+            self.history = {'': self.history['']}
+        self.history[searchInput] = matches
+        return matches
+
+    def rank(self, words, text, starts):
+        """Rank of the normalized string, or None if a word is absent"""
+        worst = PREFIX
+        for word in words:
+            if text.startswith(word):
+                continue
+            if any(text.startswith(word, start) for start in starts):
+                worst = max(worst, WORD_START)
+            elif word in text:
+                worst = max(worst, SUBSTRING)
+            else:
+                letters = iter(text)
+                if not all(letter in letters for letter in word):
+                    return None
+                worst = SUBSEQUENCE
+        return worst
+
+    def ranked(self, searchInput):
+        """Return the matching strings, the best ranked first"""
+        return [self.vocabulary[index] for index, _ in sorted(
+            self.match(searchInput), key=lambda match: match[1])]
+
+
 class MultiCompleter(QtGui.QCompleter):
     """
     Custom completer for multiple items
@@ -87,7 +170,14 @@ class FlowLayout(QtGui.QLayout):
 
     this class is taken from the pyside examples:
     https://github.com/PySide/Examples/tree/master/examples/layouts
+
+    The size hints of the items are read once per activation of the layout,
+    and the rows are computed once per width. When items are inserted,
+    removed, or change size, only the rows from the first one affected are
+    computed again, and only the items which moved are placed again.
     """
+    # Number of widths whose rows are kept
+    max_widths = 16
 
     def __init__(self, parent=None, margin=0, spacing=-1):
 
@@ -99,6 +189,15 @@ class FlowLayout(QtGui.QLayout):
         self.setSpacing(spacing)
 
         self.itemList = []
+        # Size hint of every item, as (width, height), or None if unknown
+        self.hints = []
+        # Last geometry given to every item, as (x, y, width, height)
+        self.geometries = []
+        # Whether the size hints must be read again
+        self.stale = True
+        self.minimum = None
+        # Rows for every width, see flow
+        self.rows = {}
 
     def __del__(self):
         item = self.takeAt(0)
@@ -107,6 +206,10 @@ class FlowLayout(QtGui.QLayout):
 
     def addItem(self, item):
         self.itemList.append(item)
+        self.hints.append(None)
+        self.geometries.append(None)
+        self.stale = True
+        self.changed(len(self.itemList)-1)
 
     def count(self):
         return len(self.itemList)
@@ -119,16 +222,23 @@ class FlowLayout(QtGui.QLayout):
 
     def takeAt(self, index):
         if index >= 0 and index < len(self.itemList):
+            del self.hints[index]
+            del self.geometries[index]
+            self.changed(index)
             return self.itemList.pop(index)
 
         return None
 
+    def invalidate(self):
+        # Called by Qt when the items may have changed
+        self.stale = True
+        QtGui.QLayout.invalidate(self)
+
     def expandingDirections(self):
         return QtCore.Qt.Orientations(QtCore.Qt.Orientation(0))
 
     def heightForWidth(self, width):
-        height = self.doLayout(QtCore.QRect(0, 0, width, 0), True)
-        return height
+        return self.flow(width)['height']
 
     def setGeometry(self, rect):
         QtGui.QLayout.setGeometry(self, rect)
@@ -138,36 +248,106 @@ class FlowLayout(QtGui.QLayout):
         return self.minimumSize()
 
     def minimumSize(self):
-        size = QtCore.QSize()
-
-        for item in self.itemList:
-            size = size.expandedTo(item.minimumSize())
-
-        size += QtCore.QSize(2*self.contentsMargins().top(),
-                             2*self.contentsMargins().top())
-        return size
-
-    def doLayout(self, rect, testOnly):
-        x = rect.x()
-        y = rect.y()
+        self.updateHints()
+        if self.minimum is None:
+            size = QtCore.QSize()
+
+            for item in self.itemList:
+                size = size.expandedTo(item.minimumSize())
+
+            size += QtCore.QSize(2*self.contentsMargins().top(),
+                                 2*self.contentsMargins().top())
+            self.minimum = size
+        return QtCore.QSize(self.minimum)
+
+    def changed(self, index):
+        """Forget the rows from the one of the item at index"""
+        self.minimum = None
+        for rows in self.rows.values():
+            starts = rows['starts']
+            # Keep the rows before the one of the previous item, which could
+            # now end with this one, and is computed again from its beginning
+            row = max(bisect_right(starts, index-1)-1, 0)
+            del starts[row+1:]
+            del rows['tops'][row+1:]
+            del rows['positions'][starts[row] if starts else 0:]
+            rows['height'] = None
+
+    def updateHints(self):
+        """Read the size hints again, if they may have changed"""
+        if not self.stale:
+            return
+        self.stale = False
+        first = None
+        for index, item in enumerate(self.itemList):
+            size = item.sizeHint()
+            hint = (size.width(), size.height())
+            if hint != self.hints[index]:
+                self.hints[index] = hint
+                if first is None:
+                    first = index
+        if first is not None:
+            self.changed(first)
+
+    def flow(self, width):
+        """
+        Return the rows of the items for a width
+
+        Returns
+        -------
+        rows : dict
+            'positions' of the items relative to the top left corner, indices
+            of the items starting the rows ('starts'), ordinate of the rows
+            ('tops'), and total 'height', None while they are not computed
+        """
+        self.updateHints()
+        spacing = self.spacing()
+        rows = self.rows.get((width, spacing))
+        if rows is None:
+            if len(self.rows) >= self.max_widths:
+                self.rows.clear()
+            rows = self.rows[(width, spacing)] = {
+                'positions': [], 'starts': [], 'tops': [], 'height': None}
+        if rows['height'] is not None:
+            return rows
+        positions, starts, tops = rows['positions'], rows['starts'], \
+            rows['tops']
+
+        # Compute again the last row, and the following ones
+        if starts:
+            index, y = starts.pop(), tops.pop()
+        else:
+            index, y = 0, 0
+        del positions[index:]
+        x = 0
         lineHeight = 0
-
-        for item in self.itemList:
-            spaceX = self.spacing()
-            spaceY = self.spacing()
-
-            nextX = x + item.sizeHint().width() + spaceX
-            if nextX - spaceX > rect.right() and lineHeight > 0:
-                x = rect.x()
-                y = y + lineHeight + spaceY
-                nextX = x + item.sizeHint().width() + spaceX
+        starts.append(index)
+        tops.append(y)
+        for itemWidth, itemHeight in self.hints[index:]:
+            if x+itemWidth > width-1 and lineHeight > 0:
+                x = 0
+                y = y + lineHeight + spacing
                 lineHeight = 0
+                starts.append(len(positions))
+                tops.append(y)
+            positions.append((x, y))
+            x += itemWidth + spacing
+            lineHeight = max(lineHeight, itemHeight)
+        rows['height'] = y + lineHeight
+        return rows
 
-            if not testOnly:
-                item.setGeometry(QtCore.QRect(QtCore.QPoint(x, y),
-                                 item.sizeHint()))
-
-            x = nextX
-            lineHeight = max(lineHeight, item.sizeHint().height())
-
-        return y + lineHeight - rect.y()
+    def doLayout(self, rect, testOnly):
+        rows = self.flow(rect.width())
+        if not testOnly:
+            left, top = rect.x(), rect.y()
+            geometries = self.geometries
+            for index, ((x, y), (width, height)) in enumerate(
+                    zip(rows['positions'], self.hints)):
+                geometry = (left+x, top+y, width, height)
+                # Only the items which moved are placed again
+                if geometries[index] != geometry:
+                    geometries[index] = geometry
+                    self.itemList[index].setGeometry(
+                        QtCore.QRect(*geometry))
+
+        return rows['height']
@@ -0,0 +1,87 @@
+"""
+.. module:: watcher
+    :synopsys: Follow the changes of the library on the disk
+
+"""
+from __future__ import unicode_literals
+import os
+import time
+
+from PySide import QtCore
+
+
+class LibraryWatcher(QtCore.QObject):
+    """
+    Watch all the folders of the library, and the notebooks of the current one
+
+    The changes are collected, and reported at once when no new change came
+    for `delay` ms, or at the latest `max_delay` ms after the first one, so
+    that a synchronisation client rewriting hundreds of files causes a single
+    refresh. Before that, the changed folders are read again in the cached
+    tree of the library (see :class:`LibraryTree`), and the new folders are
+    watched.
+    """
+    # changed folders, and changed notebooks
+    changed = QtCore.Signal(list, list)
+
+    def __init__(self, info, log, parent=None, delay=300, max_delay=2000):
+        QtCore.QObject.__init__(self, parent)
+        self.info = info
+        self.log = log
+        self.max_delay = max_delay
+        self.pending = set()
+        self.first = 0.
+
+        self.watcher = QtCore.QFileSystemWatcher(self)
+        self.watcher.directoryChanged.connect(self.onChange)
+        self.watcher.fileChanged.connect(self.onChange)
+
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.setInterval(delay)
+        self.timer.timeout.connect(self.flush)
+
+        self.restart()
+
+    def restart(self):
+        """Watch the library, from its main folder"""
+        # Read the whole tree once, to know all the folders
+        self.info.tree.entry(os.path.normpath(self.info.root))
+        self.watch()
+
+    def watch(self):
+        """Watch the known folders of the library, and the current notebooks"""
+        wanted = set(self.info.tree.entries)
+        wanted.add(os.path.normpath(self.info.root))
+        wanted.update(os.path.join(self.info.level, notebook)
+                      for notebook in self.info.notebooks)
+        wanted = set(path for path in wanted if os.path.exists(path))
+        watched = set(self.watcher.directories()+self.watcher.files())
+        if watched-wanted:
+            self.watcher.removePaths(list(watched-wanted))
+        if wanted-watched:
+            self.watcher.addPaths(list(wanted-watched))
+
+    @QtCore.Slot(str)
+    def onChange(self, path):
+        """Remember the change, and wait for the next ones"""
+        self.pending.add(path)
+        if not self.timer.isActive():
+            self.first = time.time()
+            self.timer.start()
+        elif 1000*(time.time()-self.first) < self.max_delay:
+            # Restart the delay
+            self.timer.start()
+
+    def flush(self):
+        """Update the tree of the library, and report all the changes"""
+        paths, self.pending = sorted(self.pending), set()
+        folders = [path for path in paths
+                   if path in self.info.tree.entries or os.path.isdir(path)]
+        notebooks = [path for path in paths if path not in folders]
+        for folder in folders:
+            self.info.tree.entry(os.path.normpath(folder))
+        self.watch()
+        self.log.info("%i folder(s) and %i notebook(s) changed on the disk" % (
+            len(folders), len(notebooks)))
+        self.changed.emit(folders, notebooks)
@@ -9,88 +9,219 @@ os.environ['QT_API'] = 'pyside'
 import qtawesome
 
 from .utils import MultiCompleter
+import noteorganiser.text_processing as tp
 
 
-class PicButton(QtGui.QPushButton):
-    """Button with a picture"""
-    deleteNotebookSignal = QtCore.Signal(str)
-    deleteFolderSignal = QtCore.Signal(str)
-    previewSignal = QtCore.Signal(str)
+# Roles of the items of the shelves, besides their label
+KIND_ROLE = QtCore.Qt.UserRole
+PATH_ROLE = QtCore.Qt.UserRole+1
 
-    def __init__(self, pixmap, text, style, parent=None):
-        QtGui.QPushButton.__init__(self, parent)
-        self.parent = parent
-        self.label = str(text)
-        # Define the tooltip
-        self.setToolTip(self.label)
-        self.pixmap = pixmap
-        self.style = style
-
-        # Default fontsize
-        self.default = 9
-        self.fontsize = self.default
-
-        # Define behaviour under right click
-        self.setContextMenuPolicy(QtCore.Qt.ActionsContextMenu)
-        delete = QtGui.QAction(self)
-        delete.setText("delete")
-        delete.triggered.connect(self.removeButton)
-        self.addAction(delete)
 
-        # use the preview action only on notebook
-        if self.style == 'notebook':
-            # Define behaviour for direct preview
-            preview = QtGui.QAction(self)
-            preview.setText("preview")
-            preview.triggered.connect(self.previewNotebook)
-            self.addAction(preview)
+class ShelfModel(QtCore.QAbstractListModel):
+    """
+    Notebooks and folders of the shelves, as (kind, label, path)
 
-    def paintEvent(self, event):
-        painter = QtGui.QPainter(self)
-        painter.setFont(QtGui.QFont('unicode', self.fontsize))
+    The kind is 'notebook' or 'folder'. The items are changed with
+    :meth:`setItems`, which only inserts and removes the rows that differ.
+    """
 
+    def __init__(self, parent=None):
+        QtCore.QAbstractListModel.__init__(self, parent)
+        self.items = []
+
+    def rowCount(self, parent=QtCore.QModelIndex()):
+        if parent.isValid():
+            return 0
+        return len(self.items)
+
+    def data(self, index, role=QtCore.Qt.DisplayRole):
+        if not index.isValid() or index.row() >= len(self.items):
+            return None
+        kind, label, path = self.items[index.row()]
+        if role in (QtCore.Qt.DisplayRole, QtCore.Qt.ToolTipRole):
+            return label
+        elif role == KIND_ROLE:
+            return kind
+        elif role == PATH_ROLE:
+            return path
+        return None
+
+    def flags(self, index):
+        return QtCore.Qt.ItemIsEnabled
+
+    def setItems(self, items):
+        """Replace the items, removing and inserting only the changed rows"""
+        begin, end, replacement = tp.changed_range(self.items, items)
+        if begin < end:
+            self.beginRemoveRows(QtCore.QModelIndex(), begin, end-1)
+            del self.items[begin:end]
+            self.endRemoveRows()
+        if replacement:
+            self.beginInsertRows(QtCore.QModelIndex(), begin,
+                                 begin+len(replacement)-1)
+            self.items[begin:begin] = replacement
+            self.endInsertRows()
+
+
+# Size of the pictures of the assets
+ASSET_SIZE = 128
+# Default fontsize of the labels, and the one of the labels too long for it
+LABEL_FONTSIZE = 9
+SMALL_LABEL_FONTSIZE = 7
+
+
+def cached_pixmap(key, render):
+    """
+    Return the pixmap stored in the QPixmapCache under key
+
+    If it is missing, it is created by calling render, and stored.
+    """
+    pixmap = QtGui.QPixmapCache.find(key)
+    if pixmap is None or pixmap.isNull():
+        pixmap = render()
+        QtGui.QPixmapCache.insert(key, pixmap)
+    return pixmap
+
+
+def shelf_pixmap(kind, size):
+    """Picture of a 'notebook' or a 'folder', decoded once per size"""
+    def render():
+        pixmap = QtGui.QPixmap(os.path.join(
+            os.path.dirname(__file__), 'assets',
+            '%s-%i.png' % (kind, ASSET_SIZE)))
+        if size != ASSET_SIZE:
+            pixmap = pixmap.scaled(size, size, QtCore.Qt.KeepAspectRatio,
+                                   QtCore.Qt.SmoothTransformation)
+        return pixmap
+    return cached_pixmap('noteorganiser-%s-%i' % (kind, size), render)
+
+
+def label_pixmap(kind, label, size):
+    """
+    Label of an item of the shelves, rendered once on a transparent pixmap
+
+    Long labels are written smaller, and elided. The label of a notebook is
+    written vertically, on its side.
+    """
+    def render():
         # If the width of the text is too large, reduce the fontsize
-        metrics = QtGui.QFontMetrics(self.font())
-        if metrics.width(self.label) > 76:
-            self.fontsize = 7
-            painter.setFont(QtGui.QFont('unicode', self.fontsize))
-
+        font = QtGui.QFont('unicode', LABEL_FONTSIZE)
+        metrics = QtGui.QFontMetrics(font)
+        if metrics.width(label) > 76:
+            font = QtGui.QFont('unicode', SMALL_LABEL_FONTSIZE)
+            metrics = QtGui.QFontMetrics(font)
         # If the width is still too large, elide the text
-        elided = metrics.elidedText(
-            self.label, QtCore.Qt.ElideRight, 90)
+        elided = metrics.elidedText(label, QtCore.Qt.ElideRight, 90)
 
-        painter.drawPixmap(event.rect(), self.pixmap)
-        if self.style == 'notebook':
+        pixmap = QtGui.QPixmap(size, size)
+        pixmap.fill(QtCore.Qt.transparent)
+        painter = QtGui.QPainter(pixmap)
+        painter.setFont(font)
+        if kind == 'notebook':
             painter.translate(42, 102)
             painter.rotate(-90)
-        elif self.style == 'folder':
-            painter.translate(10, 100+self.default-self.fontsize)
-        painter.drawText(event.rect(), elided)
-
-    def sizeHint(self):
-        return self.pixmap.size()
+        else:
+            painter.translate(
+                10, 100+LABEL_FONTSIZE-font.pointSize())
+        painter.drawText(QtCore.QRect(0, 0, size, size), elided)
+        painter.end()
+        return pixmap
+    return cached_pixmap(
+        'noteorganiser-label-%s-%i-%s' % (kind, size, label), render)
+
+
+class ShelfDelegate(QtGui.QStyledItemDelegate):
+    """
+    Paint the items of the shelves as a picture with their label
+
+    The pictures and the labels are rendered once, and shared through the
+    QPixmapCache, so that painting an item only draws two pixmaps.
+    """
+
+    def __init__(self, size, parent=None):
+        QtGui.QStyledItemDelegate.__init__(self, parent)
+        self.size = size
+
+    def paint(self, painter, option, index):
+        label = index.data(QtCore.Qt.DisplayRole)
+        kind = index.data(KIND_ROLE)
+        position = option.rect.topLeft()
+        painter.drawPixmap(position, shelf_pixmap(kind, self.size))
+        painter.drawPixmap(position, label_pixmap(kind, label, self.size))
+
+    def sizeHint(self, option, index):
+        return QtCore.QSize(self.size, self.size)
+
+
+class ShelfView(QtGui.QListView):
+    """
+    Grid of the notebooks and folders of a ShelfModel
+
+    Only the visible items are painted, by a ShelfDelegate. A left click
+    opens an item, or previews a notebook with shift, and a right click shows
+    a menu to delete it, or to preview a notebook.
+    """
+    notebookClicked = QtCore.Signal(str)
+    folderClicked = QtCore.Signal(str)
+    deleteNotebookSignal = QtCore.Signal(str)
+    deleteFolderSignal = QtCore.Signal(str)
+    previewSignal = QtCore.Signal(str)
 
-    def mouseReleaseEvent(self, ev):
+    def __init__(self, model, delegate, parent=None):
+        QtGui.QListView.__init__(self, parent)
+        self.setModel(model)
+        self.setItemDelegate(delegate)
+        self.setViewMode(QtGui.QListView.IconMode)
+        self.setMovement(QtGui.QListView.Static)
+        self.setResizeMode(QtGui.QListView.Adjust)
+        self.setWrapping(True)
+        self.setUniformItemSizes(True)
+        self.setSpacing(6)
+        self.setSelectionMode(QtGui.QAbstractItemView.NoSelection)
+
+    def mouseReleaseEvent(self, event):
         """Define a behaviour under click"""
+        index = self.indexAt(event.pos())
         # only fire event, when left button is clicked
-        if ev.button() == QtCore.Qt.LeftButton:
+        if index.isValid() and event.button() == QtCore.Qt.LeftButton:
+            kind = index.data(KIND_ROLE)
+            label = index.data(QtCore.Qt.DisplayRole)
             # check for shift-key
             modifiers = QtGui.QApplication.keyboardModifiers()
-            if modifiers == QtCore.Qt.ShiftModifier:
-                self.previewNotebook()
+            if kind == 'notebook':
+                if modifiers == QtCore.Qt.ShiftModifier:
+                    self.previewSignal.emit(label)
+                else:
+                    self.notebookClicked.emit(label)
             else:
-                self.click()
-
-    def removeButton(self):
-        """Delegate to the parent to deal with the situation"""
-        if self.style == 'notebook':
-            self.deleteNotebookSignal.emit(self.label)
-        else:
-            self.deleteFolderSignal.emit(self.label)
-
-    def previewNotebook(self):
-        """emmit signal to preview the current notebook"""
-        self.previewSignal.emit(self.label)
+                self.folderClicked.emit(index.data(PATH_ROLE))
+        QtGui.QListView.mouseReleaseEvent(self, event)
+
+    def contextMenuEvent(self, event):
+        """Offer to delete the item, or to preview the notebook"""
+        index = self.indexAt(event.pos())
+        if not index.isValid():
+            # Let the library show its own menu, outside of the items
+            event.ignore()
+            return
+        kind = index.data(KIND_ROLE)
+        label = index.data(QtCore.Qt.DisplayRole)
+        menu = QtGui.QMenu(self)
+        delete = menu.addAction("delete")
+        preview = None
+        # use the preview action only on notebook
+        if kind == 'notebook':
+            preview = menu.addAction("preview")
+        chosen = menu.exec_(event.globalPos())
+        if chosen is None:
+            return
+        if chosen == preview:
+            self.previewSignal.emit(label)
+        elif chosen == delete:
+            if kind == 'notebook':
+                self.deleteNotebookSignal.emit(label)
+            else:
+                self.deleteFolderSignal.emit(label)
 
 
 class VerticalScrollArea(QtGui.QScrollArea):
@@ -0,0 +1,109 @@
+"""
+.. module:: workers
+    :synopsys: Run the long tasks outside of the main thread
+
+"""
+from __future__ import unicode_literals
+import traceback
+
+from PySide import QtCore
+
+
+class JobSignals(QtCore.QObject):
+    """
+    Signals emitted by the jobs
+
+    A QRunnable not being a QObject, it can not define signals itself.
+    """
+    # job id and result
+    finished = QtCore.Signal(int, object)
+    # job id, kind of failure and description
+    failed = QtCore.Signal(int, str, str)
+
+
+class Job(QtCore.QRunnable):
+    """Call a function in a thread of the pool, and report by signals"""
+
+    def __init__(self, service, job_id, function, args):
+        QtCore.QRunnable.__init__(self)
+        self.service = service
+        self.job_id = job_id
+        self.function = function
+        self.args = args
+
+    def run(self):
+        # Skip the jobs that were superseded while waiting in the queue
+        if self.service.isStale(self.job_id):
+            return
+        try:
+            result = self.function(*self.args)
+        except ValueError as error:
+            # Expected errors, like the MarkdownSyntaxError
+            self.service.signals.failed.emit(
+                self.job_id, 'syntax', '%s' % error)
+        except Exception:
+            self.service.signals.failed.emit(
+                self.job_id, 'failure', traceback.format_exc())
+        else:
+            self.service.signals.finished.emit(self.job_id, result)
+
+
+class ConversionService(QtCore.QObject):
+    """
+    Run conversions in a background thread
+
+    Only the result of the most recently submitted job is reported: submitting
+    a new job cancels the previous ones, which are skipped if they have not
+    started yet, and whose result is dropped otherwise.
+    """
+    # result of the conversion
+    finished = QtCore.Signal(object)
+    # kind of failure ('syntax' or 'failure') and description
+    failed = QtCore.Signal(str, str)
+
+    def __init__(self, parent=None):
+        QtCore.QObject.__init__(self, parent)
+        self.pool = QtCore.QThreadPool(self)
+        # The conversions share their caches, so they are run one at a time
+        self.pool.setMaxThreadCount(1)
+        self.current = 0
+        # References to the jobs not yet reported, to keep them alive
+        self.jobs = []
+        self.signals = JobSignals(self)
+        self.signals.finished.connect(self.onFinished)
+        self.signals.failed.connect(self.onFailed)
+
+    def submit(self, function, *args):
+        """Queue the call of function(*args), and return the job id"""
+        self.current += 1
+        job = Job(self, self.current, function, args)
+        job.setAutoDelete(False)
+        self.jobs.append(job)
+        self.pool.start(job)
+        return self.current
+
+    def cancel(self):
+        """Drop the result of all the submitted jobs"""
+        self.current += 1
+
+    def isStale(self, job_id):
+        return job_id != self.current
+
+    def waitForDone(self, msecs=-1):
+        return self.pool.waitForDone(msecs)
+
+    def release(self, job_id):
+        """Forget the jobs up to job_id, which are done or were skipped"""
+        self.jobs = [job for job in self.jobs if job.job_id > job_id]
+
+    @QtCore.Slot(int, object)
+    def onFinished(self, job_id, result):
+        self.release(job_id)
+        if not self.isStale(job_id):
+            self.finished.emit(result)
+
+    @QtCore.Slot(int, str, str)
+    def onFailed(self, job_id, kind, message):
+        self.release(job_id)
+        if not self.isStale(job_id):
+            self.failed.emit(kind, message)
@@ -1,5 +1,4 @@
-from distutils.core import setup
-from setuptools import find_packages
+from setuptools import setup, find_packages
 
 import os
 
@@ -23,7 +22,8 @@ ASSETS = [('', ['VERSION']),
           (STYLE_FOLDER,
            [os.path.join(STYLE_FOLDER, 'default.css'),
             os.path.join(STYLE_FOLDER, 'bootstrap.css'),
-            os.path.join(STYLE_FOLDER, 'bootstrap-blog.html')]), ]
+            os.path.join(STYLE_FOLDER, 'bootstrap-blog.html'),
+            os.path.join(STYLE_FOLDER, 'fragments.html')]), ]
 
 setup(name='NoteOrganiser',
       version=open('VERSION').read().strip(),
@@ -35,6 +35,9 @@ setup(name='NoteOrganiser',
       url='https://github.com/baudren/NoteOrganiser',
       packages=PACKAGES,
       scripts=['noteorganiser/NoteOrganiser.py'],
+      entry_points={
+          'console_scripts': [
+              'noteorganiser-export = noteorganiser.export:main']},
       install_requires=['pypandoc', 'six', 'PySide>=1.2.2', 'qtawesome',
                         'qtpy', 'pygments'],
       data_files=ASSETS,